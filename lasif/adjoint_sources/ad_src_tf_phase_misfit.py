@@ -25,8 +25,11 @@ eps = np.spacing(1)
 
 
 def adsrc_tf_phase_misfit(t, data, synthetic, min_period, max_period,
-                          plot=False, max_criterion=7.0):
+                          plot=False, max_criterion=7.0, compute="all"):
     """
+    :param compute: ``"all"`` to calculate the misfit and the adjoint
+        source or ``"misfit"`` to stop after the phase misfit. The adjoint
+        source is ``None`` in the latter case and nothing is plotted.
     :rtype: dictionary
     :returns: Return a dictionary with three keys:
         * adjoint_source: The calculated adjoint source as a numpy array
@@ -38,6 +41,9 @@ def adsrc_tf_phase_misfit(t, data, synthetic, min_period, max_period,
     # Parts with zeros are essentially skipped making it fairly efficient.
     assert t[0] == 0
 
+    if compute not in ("all", "misfit"):
+        raise ValueError("compute must be either 'all' or 'misfit'.")
+
     messages = []
 
     # Internal sampling interval. Some explanations for this "magic" number.
@@ -88,9 +94,13 @@ def adsrc_tf_phase_misfit(t, data, synthetic, min_period, max_period,
     # Compute time-frequency representation of the cross-correlation
     _, _, tf_cc = time_frequency.time_frequency_cc_difference(
         t, data, synthetic, width)
-    # Compute the time-frequency representation of the synthetic
-    tau, nu, tf_synth = time_frequency.time_frequency_transform(t, synthetic,
-                                                                width)
+    # Compute the time-frequency representation of the synthetic. It is
+    # only needed for the adjoint source.
+    if compute == "misfit":
+        tau, nu = t, time_frequency.get_frequency_axis(t)
+    else:
+        tau, nu, tf_synth = time_frequency.time_frequency_transform(
+            t, synthetic, width)
 
     # -------------------------------------------------------------------------
     # compute tf window and weighting function
@@ -163,6 +173,13 @@ def adsrc_tf_phase_misfit(t, data, synthetic, min_period, max_period,
 
         return ret_dict
 
+    if compute == "misfit":
+        return {
+            "adjoint_source": None,
+            "misfit_value": phase_misfit,
+            "details": {"messages": messages}
+        }
+
     # Make kernel for the inverse tf transform
     idp = ne.evaluate(
         "weight ** 2 * DP * tf_synth / (m + abs(tf_synth) ** 2)")
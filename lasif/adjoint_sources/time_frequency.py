@@ -16,6 +16,100 @@ import scipy.interpolate
 from lasif.adjoint_sources import utils
 
 
+# Maximum number of elements of the intermediate matrices processed at once.
+# Bounds the memory usage of the transforms to a couple of 10 MB on top of
+# the final time frequency representations.
+MAX_BLOCK_ELEMENTS = 2 ** 20
+
+# FFTPACK is only fast for lengths with small prime factors. Transforms
+# whose length has a larger prime factor are computed with Bluestein's
+# algorithm.
+BLUESTEIN_MIN_PRIME_FACTOR = 300
+
+
+def _largest_prime_factor(n):
+    """
+    Returns the largest prime factor of n.
+
+    >>> _largest_prime_factor(1801)
+    1801
+    >>> _largest_prime_factor(3 * 5 * 7 * 7)
+    7
+    """
+    factor = 1
+    i = 2
+    while i * i <= n:
+        while n % i == 0:
+            factor = i
+            n //= i
+        i += 1
+    return max(factor, n)
+
+
+def _fft(x, n=None):
+    """
+    Discrete Fourier transform along the last axis of x, optionally zero
+    padded or truncated to n samples.
+
+    Lengths with large prime factors are very slow with FFTPACK and the
+    time frequency transforms frequently result in such lengths. These are
+    computed with Bluestein's algorithm which expresses the DFT as a
+    convolution that can be evaluated with fast transforms of a suitable
+    length.
+    """
+    n = x.shape[-1] if n is None else n
+    if _largest_prime_factor(n) <= BLUESTEIN_MIN_PRIME_FACTOR:
+        return scipy.fftpack.fft(x, n=n, axis=-1)
+
+    nfft = scipy.fftpack.next_fast_len(2 * n - 1)
+    if x.shape[-1] > n:
+        x = x[..., :n]
+    # Reducing k ** 2 modulo 2n keeps the argument of the exponential small
+    # and thus accurate.
+    k = np.arange(n)
+    chirp = np.exp(-1j * np.pi * ((k * k) % (2 * n)) / n)
+
+    kernel = np.zeros(nfft, dtype=np.complex128)
+    kernel[:n] = chirp.conj()
+    kernel[nfft - n + 1:] = chirp[:0:-1].conj()
+
+    a = np.zeros(x.shape[:-1] + (nfft,), dtype=np.complex128)
+    a[..., :x.shape[-1]] = x * chirp[:x.shape[-1]]
+    a = scipy.fftpack.ifft(scipy.fftpack.fft(a, axis=-1) *
+                           scipy.fftpack.fft(kernel), axis=-1)
+    return a[..., :n] * chirp
+
+
+def _ifft(x):
+    """
+    Inverse discrete Fourier transform along the last axis of x.
+    """
+    return _fft(x.conj()).conj() / x.shape[-1]
+
+
+def _row_blocks(n_rows, n_columns):
+    """
+    Yields slices splitting the rows of a matrix into blocks that have at
+    most MAX_BLOCK_ELEMENTS elements. Always at least one row per block.
+    """
+    rows_per_block = max(1, MAX_BLOCK_ELEMENTS // max(1, n_columns))
+    for i in xrange(0, n_rows, rows_per_block):
+        yield slice(i, min(i + rows_per_block, n_rows))
+
+
+def get_frequency_axis(t):
+    """
+    Returns the frequency axis of the time frequency transform of a signal
+    sampled at the discrete times ``t``.
+
+    >>> get_frequency_axis(np.arange(4) * 0.5).tolist()
+    [0.0, 0.5, 1.0, 1.5]
+    """
+    N = len(t)
+    dt = t[1] - t[0]
+    return np.linspace(0, float(N - 1) / (N * dt), N)
+
+
 def time_frequency_transform(t, s, width, threshold=1E-2):
     """
     Gabor transform (time frequency transform with Gaussian windows).
@@ -31,23 +125,24 @@ def time_frequency_transform(t, s, width, threshold=1E-2):
     N = len(t)
     dt = t[1] - t[0]
 
-    nu = np.linspace(0, float(N - 1) / (N * dt), N)
+    nu = get_frequency_axis(t)
 
     # Compute the time frequency representation
     tfs = np.zeros((N, N), dtype="complex128")
 
     threshold = np.abs(s).max() * threshold
 
-    for k in xrange(N):
-        # Window the signals
-        f = utils.gaussian_window(t - t[k], width) * s
+    for rows in _row_blocks(N, N):
+        # Window the signals - one row per window.
+        f = utils.gaussian_window(t - t[rows, np.newaxis], width) * s
 
         # No need to transform if nothing is there. Great speedup as lots of
         # windowed functions have 0 everywhere.
-        if np.abs(f).max() < threshold:
+        mask = np.abs(f).max(axis=1) >= threshold
+        if not mask.any():
             continue
 
-        tfs[k, :] = scipy.fftpack.fft(f)
+        tfs[rows][mask] = _fft(f[mask])
 
     tfs *= dt / np.sqrt(2.0 * np.pi)
 
@@ -85,18 +180,24 @@ def time_frequency_cc_difference(t, s1, s2, width, threshold=1E-2):
 
     threshold = np.abs(s1).max() * threshold
 
-    for k in xrange(len(t)):
-        # Window the signals
-        w = utils.gaussian_window(t - tau[k], width)
+    for rows in _row_blocks(len(t), len(t_cc)):
+        # Window the signals - one row per window.
+        w = utils.gaussian_window(t - tau[rows, np.newaxis], width)
         f1 = w * s1
         f2 = w * s2
 
-        if min(np.abs(f1).max(), np.abs(f2).max()) < threshold:
+        mask = np.minimum(np.abs(f1).max(axis=1),
+                          np.abs(f2).max(axis=1)) >= threshold
+        if not mask.any():
             continue
 
-        cc = utils.cross_correlation(f2, f1)
-        tfs[k, :] = \
-            scipy.interpolate.interp1d(cc_freqs, scipy.fftpack.fft(cc))(freqs)
+        # The spectrum of the circular cross correlation as computed by
+        # utils.cross_correlation(f2, f1) is the product of the spectra of
+        # both zero padded signals.
+        spec = _fft(f2[mask], n=len(t_cc)) * \
+            _fft(f1[mask], n=len(t_cc)).conj()
+        tfs[rows][mask] = \
+            scipy.interpolate.interp1d(cc_freqs, spec, axis=1)(freqs)
     tfs *= dt / np.sqrt(2.0 * np.pi)
 
     return tau, nu, tfs
@@ -112,18 +213,22 @@ def itfa(tau, tfs, width, threshold=1E-2):
     I = np.zeros((N, N), dtype="complex128")
 
     # IFFT and scaling.
-    for k in xrange(N):
-        if np.abs(tfs[k, :]).max() < threshold:
+    for rows in _row_blocks(N, N):
+        mask = np.abs(tfs[rows]).max(axis=1) >= threshold
+        if not mask.any():
             continue
-        I[k, :] = scipy.fftpack.ifft(tfs[k, :])
+        I[rows][mask] = _ifft(tfs[rows][mask])
     I *= 2.0 * np.pi / dt
 
     # time integration
     s = np.zeros(N, dtype="complex128")
 
-    for k in xrange(N):
-        f = utils.gaussian_window(tau[k] - tau, width) * I[:, k].transpose()
-        s[k] = np.sum(f) * dt
+    # The Gaussian windows are symmetric so column k of the windows matrix
+    # is the window centered at tau[k].
+    for columns in _row_blocks(N, N):
+        f = utils.gaussian_window(tau[:, np.newaxis] - tau[columns], width) * \
+            I[:, columns]
+        s[columns] = np.sum(f, axis=0) * dt
     s *= dt / np.sqrt(2.0 * np.pi)
 
     return s, tau, I
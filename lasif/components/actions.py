@@ -7,7 +7,8 @@ import numpy as np
 import os
 import warnings
 
-from lasif import LASIFError, LASIFWarning, LASIFNotFoundError
+from lasif import LASIFError, LASIFWarning, LASIFNotFoundError, \
+    LASIFAdjointSourceCalculationError
 from lasif import rotations
 from .component import Component
 
@@ -20,7 +21,8 @@ class ActionsComponent(Component):
     :param communicator: The communicator instance.
     :param component_name: The name of this component for the communicator.
     """
-    def preprocess_data(self, iteration_name, event_names=None):
+    def preprocess_data(self, iteration_name, event_names=None,
+                        backend=None, processes=None, resume_from=None):
         """
         Preprocesses all data for a given iteration.
 
@@ -28,15 +30,31 @@ class ActionsComponent(Component):
 
         :param event_names: event_ids is a list of events to process in this
             run. It will process all events if not given.
+        :param backend: The parallel backend. See
+            :func:`~lasif.tools.parallel_helpers.distribute_across_ranks`.
+            Defaults to the ``parallel_backend`` misc setting of the project.
+        :param processes: The number of processes for the multiprocessing
+            backend. Defaults to the ``parallel_processes`` misc setting of
+            the project.
+        :param resume_from: The logfile of a previous, interrupted run.
+            Items processed in it will not be processed again.
         """
         from mpi4py import MPI
         from lasif.tools.parallel_helpers import distribute_across_ranks
+        from lasif.tools.response_cache import ResponseCache
 
         iteration = self.comm.iterations.get(iteration_name)
 
         process_params = iteration.get_process_params()
         processing_tag = iteration.processing_tag
 
+        # Shared by all events and iterations. The workers on other MPI
+        # ranks write to it as well which is safe as each spectrum is
+        # written atomically.
+        response_cache = ResponseCache(
+            os.path.join(self.comm.project.paths["cache"], "RESPONSES"),
+            read_only=self.comm.project.read_only_caches)
+
         def processing_data_generator():
             """
             Generate a dictionary with information for processing for each
@@ -129,6 +147,7 @@ class ActionsComponent(Component):
                             get_channel_filename(channel["channel_id"],
                                                  channel["starttime"]),
                             "event_information": event,
+                            "response_cache": response_cache,
                         }
                         yield ret_dict
 
@@ -136,6 +155,12 @@ class ActionsComponent(Component):
         if MPI.COMM_WORLD.rank == 0:
             to_be_processed = [{"processing_info": _i, "iteration": iteration}
                                for _i in processing_data_generator()]
+            # Group the items sharing a station file. They are handed out in
+            # consecutive chunks so these mostly end up on the same worker
+            # which then only has to parse the station file once. See
+            # lasif.utils.read_station_file().
+            to_be_processed.sort(
+                key=lambda x: x["processing_info"]["station_filename"])
         else:
             to_be_processed = None
 
@@ -150,7 +175,18 @@ class ActionsComponent(Component):
         distribute_across_ranks(
             function=preprocessing_function, items=to_be_processed,
             get_name=lambda x: x["processing_info"]["input_filename"],
-            logfile=logfile)
+            logfile=logfile, stream=True, resume_from=resume_from,
+            **self._get_parallel_settings(backend, processes))
+
+    def _get_parallel_settings(self, backend=None, processes=None):
+        """
+        Fills in the parallel backend and the number of processes from the
+        project's misc settings if not given.
+        """
+        settings = self.comm.project.config["misc_settings"]
+        return {
+            "backend": backend or settings["parallel_backend"],
+            "processes": processes or settings["parallel_processes"]}
 
     def select_windows(self, event, iteration):
         """
@@ -165,25 +201,13 @@ class ActionsComponent(Component):
         :param event: The event.
         :param iteration: The iteration.
         """
+        from lasif.tools.parallel_helpers import mpi_imap_unordered
         from lasif.utils import channel2station
         from mpi4py import MPI
 
         event = self.comm.events.get(event)
         iteration = self.comm.iterations.get(iteration)
 
-        def split(container, count):
-            """
-            Simple and elegant function splitting a container into count
-            equal chunks.
-
-            Order is not preserved but for the use case at hand this is
-            potentially an advantage as data sitting in the same folder thus
-            have a higher at being processed at the same time thus the disc
-            head does not have to jump around so much. Of course very
-            architecture dependent.
-            """
-            return [container[_i::count] for _i in range(count)]
-
         # Only rank 0 needs to know what has to be processsed.
         if MPI.COMM_WORLD.rank == 0:
             # All stations for the given iteration and event.
@@ -193,10 +217,8 @@ class ActionsComponent(Component):
             # Get all stations that currently do not have windows.
             windows = self.comm.windows.get(event, iteration).list()
             stations_without_windows = \
-                stations - set(map(channel2station, windows))
+                sorted(stations - set(map(channel2station, windows)))
             total_size = len(stations_without_windows)
-            stations_without_windows = split(list(stations_without_windows),
-                                             MPI.COMM_WORLD.size)
 
             # Initialize station cache on rank 0.
             self.comm.stations.file_count
@@ -215,11 +237,7 @@ class ActionsComponent(Component):
         else:
             stations_without_windows = None
 
-        # Distribute on a per-station basis.
-        stations_without_windows = MPI.COMM_WORLD.scatter(
-            stations_without_windows, root=0)
-
-        for _i, station in enumerate(stations_without_windows):
+        def select_windows_for_station(station):
             try:
                 self.select_windows_for_station(event, iteration, station)
             except LASIFNotFoundError as e:
@@ -229,11 +247,12 @@ class ActionsComponent(Component):
                     "Exception occured for iteration %s, event %s, and "
                     "station %s: %s" % (iteration.name, event["event_name"],
                                         station, str(e)), LASIFWarning)
-            if MPI.COMM_WORLD.rank == 0:
-                print("Window picking process: Picked windows for approx. %i "
-                      "of %i stations." % (
-                          min(_i * MPI.COMM_WORLD.size, total_size),
-                          total_size))
+
+        # Rank 0 hands out the stations to whichever rank is idle.
+        for _i, _ in enumerate(mpi_imap_unordered(
+                select_windows_for_station, stations_without_windows)):
+            print("Window picking process: Picked windows for %i of %i "
+                  "stations." % (_i + 1, total_size))
 
         # Barrier at the end useful for running this in a loop.
         MPI.COMM_WORLD.barrier()
@@ -567,41 +586,180 @@ class ActionsComponent(Component):
         gen.write(format=solver_format, output_dir=output_dir)
         print "Written files to '%s'." % output_dir
 
-    def calculate_all_adjoint_sources(self, iteration_name, event_name):
+    def calculate_all_adjoint_sources(self, iteration_name, event_name,
+                                      backend=None, processes=None):
         """
         Function to calculate all adjoint sources for a certain iteration
         and event.
+
+        Function can be called with and without MPI. The stations are
+        dynamically distributed across all ranks or the processes of a
+        local pool. Rank 0 writes all newly calculated adjoint sources.
+
+        :param backend: The parallel backend. See
+            :func:`~lasif.tools.parallel_helpers.distribute_across_ranks`.
+            Defaults to the ``parallel_backend`` misc setting of the project.
+        :param processes: The number of processes for the multiprocessing
+            backend. Defaults to the ``parallel_processes`` misc setting of
+            the project.
         """
+        from lasif.tools.parallel_helpers import imap_unordered
+        from mpi4py import MPI
+
         window_manager = self.comm.windows.get(event_name, iteration_name)
         event = self.comm.events.get(event_name)
         iteration = self.comm.iterations.get(iteration_name)
         iteration_event_def = iteration.events[event["event_name"]]
         iteration_stations = iteration_event_def["stations"]
 
-        l = sorted(window_manager.list())
-        for station, windows in itertools.groupby(
-                l, key=lambda x: ".".join(x.split(".")[:2])):
-            if station not in iteration_stations:
-                continue
+        # Only rank 0 needs to know what has to be processed.
+        if MPI.COMM_WORLD.rank == 0:
+            l = sorted(window_manager.list())
+            stations = [
+                (station, list(windows)) for station, windows in
+                itertools.groupby(
+                    l, key=lambda x: ".".join(x.split(".")[:2]))
+                if station in iteration_stations]
+            total_size = len(stations)
+            # Migrates the adjoint sources of older LASIF versions before
+            # any worker reads them.
+            self.comm.adjoint_sources.get_store(event_name,
+                                                iteration.long_name)
+        else:
+            stations = None
+
+        def calculate_adjoint_sources_for_station(item):
+            """
+            Returns the newly calculated adjoint sources of the station.
+            """
+            station, windows = item
+            new_values = []
             try:
-                for w in windows:
-                    w = window_manager.get(w)
-                    for window in w:
-                        # Access the property will trigger an adjoint source
-                        # calculation.
-                        window.adjoint_source
+                # Calculates all adjoint sources of the station from a
+                # single read of its waveforms.
+                collections = [window_manager.get(w) for w in windows]
+                for ad_srcs in self.comm.adjoint_sources \
+                        .calculate_adjoint_sources(collections,
+                                                   new_values=new_values):
+                    for ad_src in ad_srcs:
+                        if ad_src["adjoint_source"] is None:
+                            raise LASIFAdjointSourceCalculationError(
+                                "Could not calculate adjoint source!")
             except LASIFError as e:
                 print("Could not calculate adjoint source for iteration %s "
                       "and station %s. Repick windows? Reason: %s" % (
                           iteration.name, station, str(e)))
+            # Must not raise, a failed station must not stop the others.
+            except Exception as e:
+                print("Could not calculate adjoint source for iteration %s "
+                      "and station %s. Reason: %s" % (
+                          iteration.name, station, str(e)))
+            return new_values
+
+        for _i, new_values in enumerate(imap_unordered(
+                calculate_adjoint_sources_for_station, stations,
+                **self._get_parallel_settings(backend, processes))):
+            self.comm.adjoint_sources.store_adjoint_sources(new_values)
+            print("Calculated adjoint sources for %i of %i stations." % (
+                _i + 1, total_size))
+
+        # Barrier at the end useful for running this in a loop.
+        MPI.COMM_WORLD.barrier()
 
-    def finalize_adjoint_sources(self, iteration_name, event_name):
+    def convert_synthetics(self, iteration_name, event_names=None,
+                           backend=None, processes=None):
+        """
+        Converts the synthetics of an iteration to the binary containers of
+        converted synthetics. Later reads of the synthetics then no longer
+        have to parse, map, and rotate the solver output.
+
+        Function can be called with and without MPI. The stations are
+        dynamically distributed across all ranks or the processes of a
+        local pool.
+
+        :param iteration_name: The name of the iteration.
+        :param event_names: The events to convert. Defaults to all events of
+            the iteration.
+        :param backend: The parallel backend. See
+            :func:`~lasif.tools.parallel_helpers.distribute_across_ranks`.
+            Defaults to the ``parallel_backend`` misc setting of the project.
+        :param processes: The number of processes for the multiprocessing
+            backend. Defaults to the ``parallel_processes`` misc setting of
+            the project.
+        """
+        from lasif.tools.parallel_helpers import imap_unordered
+        from mpi4py import MPI
+
+        iteration = self.comm.iterations.get(iteration_name)
+
+        # Only rank 0 needs to know what has to be converted.
+        if MPI.COMM_WORLD.rank == 0:
+            if event_names is None:
+                event_names = sorted(iteration.events.keys())
+            stations = []
+            for event_name in event_names:
+                try:
+                    metadata = self.comm.waveforms.get_metadata_synthetic(
+                        event_name, iteration.long_name)
+                except LASIFNotFoundError as e:
+                    print(str(e))
+                    continue
+                stations.extend((event_name, _i) for _i in sorted(set(
+                    "%s.%s" % (_j["network"], _j["station"])
+                    for _j in metadata)))
+            total_size = len(stations)
+        else:
+            stations = None
+
+        def convert_synthetics_for_station(item):
+            event_name, station = item
+            # Must not raise, a failed station must not stop the others.
+            try:
+                return self.comm.waveforms.convert_synthetics(
+                    event_name, station, iteration.long_name)
+            except Exception as e:
+                print("Could not convert synthetics for event %s and "
+                      "station %s. Reason: %s" % (event_name, station,
+                                                  str(e)))
+
+        counts = {True: 0, False: 0, None: 0}
+        for _i, result in enumerate(imap_unordered(
+                convert_synthetics_for_station, stations,
+                **self._get_parallel_settings(backend, processes))):
+            counts[result] += 1
+            print("Converted synthetics of %i of %i stations." % (
+                _i + 1, total_size))
+
+        if MPI.COMM_WORLD.rank == 0:
+            print("Converted %i stations, %i were already up to date, %i "
+                  "failed." % (counts[True], counts[False], counts[None]))
+
+        # Barrier at the end useful for running this in a loop.
+        MPI.COMM_WORLD.barrier()
+
+    def finalize_adjoint_sources(self, iteration_name, event_name,
+                                 backend=None, processes=None):
         """
         Finalizes the adjoint sources.
+
+        Function can be called with and without MPI. The adjoint sources of
+        the stations are calculated on all ranks or the processes of a local
+        pool. Rank 0 stores all newly calculated adjoint sources and writes
+        all files in the order of the station ids so the output does not
+        depend on the distribution of the work.
+
+        :param backend: The parallel backend. See
+            :func:`~lasif.tools.parallel_helpers.distribute_across_ranks`.
+            Defaults to the ``parallel_backend`` misc setting of the project.
+        :param processes: The number of processes for the multiprocessing
+            backend. Defaults to the ``parallel_processes`` misc setting of
+            the project.
         """
         from itertools import izip
         import numpy as np
+        from mpi4py import MPI
         from lasif import rotations
+        from lasif.tools.parallel_helpers import imap_unordered
 
         window_manager = self.comm.windows.get(event_name, iteration_name)
         event = self.comm.events.get(event_name)
@@ -609,41 +767,47 @@ class ActionsComponent(Component):
         iteration_event_def = iteration.events[event["event_name"]]
         iteration_stations = iteration_event_def["stations"]
 
-        # For now assume that the adjoint sources have the same
-        # sampling rate as the synthetics which in LASIF's workflow
-        # actually has to be true.
-        dt = iteration.get_process_params()["dt"]
-
-        # Current domain and solver.
-        domain = self.comm.project.domain
-        solver = iteration.solver_settings["solver"].lower()
-
-        adjoint_source_stations = set()
-
-        if "ses3d" in solver:
-            ses3d_all_coordinates = []
-
         event_weight = iteration_event_def["event_weight"]
 
-        output_folder = self.comm.project.get_output_folder(
-            type="adjoint_sources",
-            tag="ITERATION_%s__%s" % (iteration_name, event_name))
+        # Only rank 0 needs to know what has to be processed.
+        if MPI.COMM_WORLD.rank == 0:
+            l = sorted(window_manager.list())
+            stations = [
+                (station, list(windows)) for station, windows in
+                itertools.groupby(
+                    l, key=lambda x: ".".join(x.split(".")[:2]))
+                if station in iteration_stations]
+            total_size = len(stations)
+            # Migrates the adjoint sources of older LASIF versions before
+            # any worker reads them.
+            self.comm.adjoint_sources.get_store(event_name,
+                                                iteration.long_name)
+        else:
+            stations = None
 
-        l = sorted(window_manager.list())
-        for station, windows in itertools.groupby(
-                l, key=lambda x: ".".join(x.split(".")[:2])):
-            if station not in iteration_stations:
-                continue
-            print ".",
+        def get_adjoint_sources_for_station(item):
+            """
+            Returns the station id, the weighted adjoint source of each of
+            its channels, and the newly calculated adjoint sources.
+            """
+            station, windows = item
             station_weight = iteration_stations[station]["station_weight"]
             channels = {}
+            new_values = []
             try:
-                for w in windows:
-                    w = window_manager.get(w)
+                # Calculates all adjoint sources of the station from a
+                # single read of its waveforms.
+                collections = [window_manager.get(w) for w in windows]
+                all_ad_srcs = self.comm.adjoint_sources \
+                    .calculate_adjoint_sources(collections,
+                                               new_values=new_values)
+                for w, ad_srcs in izip(collections, all_ad_srcs):
                     channel_weight = 0
                     srcs = []
-                    for window in w:
-                        ad_src = window.adjoint_source
+                    for window, ad_src in izip(w, ad_srcs):
+                        if ad_src["adjoint_source"] is None:
+                            raise LASIFAdjointSourceCalculationError(
+                                "Could not calculate adjoint source!")
                         if not ad_src["adjoint_source"].ptp():
                             continue
                         srcs.append(ad_src["adjoint_source"] * window.weight)
@@ -659,9 +823,52 @@ class ActionsComponent(Component):
                 print("Could not calculate adjoint source for iteration %s "
                       "and station %s. Repick windows? Reason: %s" % (
                           iteration.name, station, str(e)))
-                continue
-            if not channels:
-                continue
+                return station, {}, new_values
+            # Must not raise, a failed station must not stop the others.
+            except Exception as e:
+                print("Could not calculate adjoint source for iteration %s "
+                      "and station %s. Reason: %s" % (
+                          iteration.name, station, str(e)))
+                return station, {}, new_values
+            return station, channels, new_values
+
+        all_channels = {}
+        for _i, (station, channels, new_values) in enumerate(imap_unordered(
+                get_adjoint_sources_for_station, stations,
+                **self._get_parallel_settings(backend, processes))):
+            self.comm.adjoint_sources.store_adjoint_sources(new_values)
+            all_channels[station] = channels
+            print("Calculated adjoint sources for %i of %i stations." % (
+                _i + 1, total_size))
+
+        # Only rank 0 writes the files.
+        if MPI.COMM_WORLD.rank != 0:
+            return
+
+        # For now assume that the adjoint sources have the same
+        # sampling rate as the synthetics which in LASIF's workflow
+        # actually has to be true.
+        dt = iteration.get_process_params()["dt"]
+
+        # Current domain and solver.
+        domain = self.comm.project.domain
+        solver = iteration.solver_settings["solver"].lower()
+
+        adjoint_source_stations = set()
+
+        if "ses3d" in solver:
+            ses3d_all_coordinates = []
+
+        output_folder = self.comm.project.get_output_folder(
+            type="adjoint_sources",
+            tag="ITERATION_%s__%s" % (iteration_name, event_name))
+
+        # Always write in the same order, independent of the order in which
+        # the stations have been processed.
+        stations = [_i for _i in sorted(all_channels.keys())
+                    if all_channels[_i]]
+        for station in stations:
+            channels = all_channels[station]
             # Now all adjoint sources of a window should have the same length.
             length = set(len(v) for v in channels.values())
             assert len(length) == 1
@@ -672,32 +879,48 @@ class ActionsComponent(Component):
                     continue
                 channels[c] = np.zeros(length)
 
+        if "ses3d" in solver and stations:
             # Get the station coordinates
-            coords = self.comm.query.get_coordinates_for_station(event_name,
-                                                                 station)
+            coordinates = [
+                self.comm.query.get_coordinates_for_station(event_name,
+                                                            station)
+                for station in stations]
+            rec_lats = np.array([_i["latitude"] for _i in coordinates])
+            rec_lngs = np.array([_i["longitude"] for _i in coordinates])
+
+            # Rotate if needed.
+            if domain.rotation_angle_in_degree:
+                # Rotate the adjoint source locations.
+                r_rec_lats, r_rec_lngs = rotations.rotate_lat_lon_array(
+                    rec_lats, rec_lngs, domain.rotation_axis,
+                    -domain.rotation_angle_in_degree)
+                # Rotate the adjoint sources of all stations with the same
+                # number of samples at once.
+                lengths = [len(all_channels[_i]["Z"]) for _i in stations]
+                for length in set(lengths):
+                    idx = [_i for _i, _j in enumerate(lengths)
+                           if _j == length]
+                    rotated = rotations.rotate_data_array(
+                        *[[all_channels[stations[_i]][c] for _i in idx]
+                          for c in ["N", "E", "Z"]],
+                        lats=rec_lats[idx], lons=rec_lngs[idx],
+                        rotation_axis=domain.rotation_axis,
+                        angle=-domain.rotation_angle_in_degree)
+                    for _k, _i in enumerate(idx):
+                        channels = all_channels[stations[_i]]
+                        channels["N"], channels["E"], channels["Z"] = \
+                            [_j[_k] for _j in rotated]
+            else:
+                r_rec_lats = rec_lats
+                r_rec_lngs = rec_lngs
 
-            # Rotate. if needed
-            rec_lat = coords["latitude"]
-            rec_lng = coords["longitude"]
+        for _i, station in enumerate(stations):
+            channels = all_channels[station]
 
             # The adjoint sources depend on the solver.
             if "ses3d" in solver:
-                # Rotate if needed.
-                if domain.rotation_angle_in_degree:
-                    # Rotate the adjoint source location.
-                    r_rec_lat, r_rec_lng = rotations.rotate_lat_lon(
-                        rec_lat, rec_lng, domain.rotation_axis,
-                        -domain.rotation_angle_in_degree)
-                    # Rotate the adjoint sources.
-                    channels["N"], channels["E"], channels["Z"] = \
-                        rotations.rotate_data(
-                            channels["N"], channels["E"],
-                            channels["Z"], rec_lat, rec_lng,
-                            domain.rotation_axis,
-                            -domain.rotation_angle_in_degree)
-                else:
-                    r_rec_lat = rec_lat
-                    r_rec_lng = rec_lng
+                r_rec_lat = r_rec_lats[_i]
+                r_rec_lng = r_rec_lngs[_i]
                 r_rec_depth = 0.0
                 r_rec_colat = rotations.lat2colat(r_rec_lat)
 
@@ -2,16 +2,19 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import
 
+import collections
 import copy
-import joblib
 import numpy as np
 import os
+import shutil
 
 from lasif import LASIFNotFoundError, LASIFAdjointSourceCalculationError
 from .component import Component
 from ..adjoint_sources.ad_src_tf_phase_misfit import adsrc_tf_phase_misfit
 from ..adjoint_sources.ad_src_l2_norm_misfit import adsrc_l2_norm_misfit
 from ..adjoint_sources.ad_src_cc_time_shift import adsrc_cc_time_shift
+from ..tools.adjoint_source_store import AdjointSourceStore
+from ..window_manager import DEFAULT_AD_SRC_TYPE
 
 
 # Map the adjoint source type names to functions implementing them.
@@ -21,6 +24,10 @@ MISFIT_MAPPING = {
     "CCTimeShift": adsrc_cc_time_shift
 }
 
+# Adjoint source types that can calculate the misfit without the adjoint
+# source.
+MISFIT_ONLY_TYPES = ["TimeFrequencyPhaseMisfitFichtner2008"]
+
 
 class AdjointSourcesComponent(Component):
     """
@@ -32,15 +39,78 @@ class AdjointSourcesComponent(Component):
     """
     def __init__(self, ad_src_folder, communicator, component_name):
         self._folder = ad_src_folder
+        # The opened stores, keyed by event and iteration.
+        self._stores = {}
         super(AdjointSourcesComponent, self).__init__(
             communicator, component_name)
 
+    def get_store(self, event_name, iteration_name, migrate=True):
+        """
+        Returns the store with all adjoint sources of an event and an
+        iteration.
+
+        :param event_name: The name of the event.
+        :param iteration_name: The long name of the iteration.
+        :param migrate: Import the adjoint sources of earlier LASIF
+            versions, pickled to one file per window, into the store and
+            remove them. Only pass True in the process writing to the store.
+        """
+        key = (event_name, iteration_name)
+        if key not in self._stores:
+            self._stores[key] = AdjointSourceStore(os.path.join(
+                self._folder, event_name, iteration_name + os.path.extsep +
+                "sqlite"))
+        store = self._stores[key]
+        if migrate:
+            self._migrate_legacy_adjoint_sources(
+                store, os.path.join(self._folder, event_name, iteration_name))
+        return store
+
+    def _migrate_legacy_adjoint_sources(self, store, folder):
+        """
+        Moves the adjoint sources pickled with joblib by earlier versions of
+        LASIF into the store. Files that cannot be read are discarded.
+        """
+        if not os.path.isdir(folder):
+            return
+        import joblib
+
+        values = []
+        for key in sorted(os.listdir(folder)):
+            try:
+                adsrc = joblib.load(os.path.join(folder, key))
+            except Exception:
+                continue
+            if self._validate_return_value(adsrc):
+                values.append((key, adsrc))
+        store.update(values)
+        shutil.rmtree(folder)
+
+    def store_adjoint_sources(self, new_values):
+        """
+        Writes adjoint sources collected with the ``new_values`` argument of
+        :meth:`.calculate_adjoint_sources` to their stores. Each store is
+        written in a single transaction.
+
+        :param new_values: List of ``(event_name, iteration_name, key,
+            value)`` tuples.
+        """
+        stores = collections.defaultdict(list)
+        for event_name, iteration_name, key, value in new_values:
+            stores[(event_name, iteration_name)].append((key, value))
+        for (event_name, iteration_name), values in stores.iteritems():
+            self.get_store(event_name, iteration_name).update(values)
+
     def calculate_adjoint_source(self, event_name, iteration_name,
                                  channel_id, starttime, endtime, taper,
-                                 taper_percentage, ad_src_type, plot=False):
+                                 taper_percentage, ad_src_type, plot=False,
+                                 compute="all", new_values=None):
         """
         Calculates an adjoint source for a single window.
 
+        Use :meth:`.calculate_adjoint_sources` for more than one window of
+        a station as it reads the waveforms only once.
+
         :param event_name: The name of the event.
         :param iteration_name: The name of the iteration.
         :param channel_id: The channel id in the form NET.STA.NET.CHA.
@@ -51,24 +121,96 @@ class AdjointSourcesComponent(Component):
             decimal number ranging from 0.0 to 0.5 for a full width taper.
         :param ad_src_type: The type of adjoint source. Currently supported
             are ``"TimeFrequencyPhaseMisfitFichtner2008"`` and ``"L2Norm"``.
+        :param compute: ``"all"`` for the misfit and the adjoint source or
+            ``"misfit"`` to only get the misfit value. The latter skips the
+            expensive parts of the adjoint source calculation if the
+            adjoint source type supports it. Its adjoint source is always
+            ``None`` and the misfit details are not stored.
+        :param new_values: See :meth:`.calculate_adjoint_sources`.
         """
         iteration = self.comm.iterations.get(iteration_name)
-        iteration_name = iteration.long_name
         event = self.comm.events.get(event_name)
+        return self._calculate_adjoint_source(
+            event=event, iteration=iteration, channel_id=channel_id,
+            starttime=starttime, endtime=endtime, taper=taper,
+            taper_percentage=taper_percentage, ad_src_type=ad_src_type,
+            waveforms={}, plot=plot, compute=compute, new_values=new_values)
+
+    def calculate_adjoint_sources(self, window_collections, compute="all",
+                                  new_values=None):
+        """
+        Calculates the adjoint sources for all windows of any number of
+        window collections, e.g. all collections of a station.
+
+        The waveforms of each station are only read, and SES3D synthetics
+        only rotated, once for all windows of all its channels and only if
+        at least one adjoint source is not yet stored.
+
+        Returns a list with a list of adjoint sources for each collection
+        in the same order as the windows of the collection.
+
+        :param window_collections: The
+            :class:`~lasif.window_manager.WindowCollection` objects.
+        :param compute: ``"all"`` or ``"misfit"``. See
+            :meth:`.calculate_adjoint_source`.
+        :param new_values: If given, newly calculated adjoint sources are
+            not written to the stores but appended to this list as
+            ``(event_name, iteration_name, key, value)`` tuples. Parallel
+            workers use it to return them to the single process writing
+            them with :meth:`.store_adjoint_sources`.
+        """
+        # Waveforms per station, shared by all windows.
+        waveforms = {}
+
+        results = []
+        for collection in window_collections:
+            event = self.comm.events.get(collection.event_name)
+            iteration = self.comm.iterations.get(collection.synthetics_tag)
+            collection_results = []
+            for window in collection:
+                if window.misfit_type is None:
+                    window.misfit_type = DEFAULT_AD_SRC_TYPE
+                collection_results.append(self._calculate_adjoint_source(
+                    event=event, iteration=iteration,
+                    channel_id=collection.channel_id,
+                    starttime=window.starttime, endtime=window.endtime,
+                    taper=window.taper,
+                    taper_percentage=window.taper_percentage,
+                    ad_src_type=window.misfit_type, waveforms=waveforms,
+                    compute=compute, new_values=new_values))
+            results.append(collection_results)
+        return results
+
+    def _calculate_adjoint_source(self, event, iteration, channel_id,
+                                  starttime, endtime, taper,
+                                  taper_percentage, ad_src_type, waveforms,
+                                  plot=False, compute="all", new_values=None):
+        """
+        Calculates or loads the adjoint source for a single window.
+
+        :param waveforms: Dictionary with the already read waveforms of each
+            station. Missing ones will be read and added to it.
+        """
+        if compute not in ("all", "misfit"):
+            raise ValueError("compute must be either 'all' or 'misfit'.")
+
+        iteration_name = iteration.long_name
         event_name = event["event_name"]
 
-        folder = os.path.join(self._folder, event_name, iteration_name)
-        if not os.path.exists(folder):
-            os.makedirs(folder)
-        filename = os.path.join(folder, "%s_%s_%s_%s_%.2f_%s" % (
-            channel_id, str(starttime), str(endtime), str(taper),
-            taper_percentage, ad_src_type))
-
-        if not plot and os.path.exists(filename):
-            adsrc = joblib.load(filename)
-            if not self._validate_return_value(adsrc):
-                os.remove(filename)
-            else:
+        store = self.get_store(event_name, iteration_name,
+                               migrate=new_values is None)
+        key = store.get_key(channel_id, starttime, endtime, taper,
+                            taper_percentage, ad_src_type)
+
+        if not plot and compute == "misfit":
+            misfit_value = store.get_misfit(key)
+            if misfit_value is not None:
+                return {"adjoint_source": None,
+                        "misfit_value": misfit_value,
+                        "details": {"messages": []}}
+        elif not plot:
+            adsrc = store.get(key)
+            if adsrc is not None and self._validate_return_value(adsrc):
                 return adsrc
 
         if ad_src_type not in MISFIT_MAPPING:
@@ -76,11 +218,19 @@ class AdjointSourcesComponent(Component):
                 "Adjoint source type '%s' not supported. Supported types: %s"
                 % (ad_src_type, ", ".join(MISFIT_MAPPING.keys())))
 
-        waveforms = self.comm.query.get_matching_waveforms(
-            event=event_name, iteration=iteration_name,
-            station_or_channel_id=channel_id)
-        data = waveforms.data
-        synth = waveforms.synthetics
+        station_id = ".".join(channel_id.split(".")[:2])
+        if station_id not in waveforms:
+            waveforms[station_id] = self.comm.query.get_matching_waveforms(
+                event=event_name, iteration=iteration_name,
+                station_or_channel_id=station_id)
+
+        # Only use the last letter of the channel for the selection just as
+        # get_matching_waveforms() does.
+        component = channel_id[-1].upper()
+        data = [tr for tr in waveforms[station_id].data
+                if tr.stats.channel[-1].upper() == component]
+        synth = [tr for tr in waveforms[station_id].synthetics
+                 if tr.stats.channel[-1].upper() == component]
 
         if len(data) != 1:
             raise LASIFNotFoundError(
@@ -90,8 +240,9 @@ class AdjointSourcesComponent(Component):
             raise LASIFNotFoundError(
                 "Synthetics not found for event '%s', iteration '%s', "
                 "and channel '%s'." % (event_name, iteration_name, channel_id))
-        data = data[0]
-        synth = synth[0]
+        # Copy as the traces are shared by all windows of the station.
+        data = data[0].copy()
+        synth = synth[0].copy()
 
         # Make sure they are equal enough.
         if abs(data.stats.starttime - synth.stats.starttime) > 0.1:
@@ -124,13 +275,18 @@ class AdjointSourcesComponent(Component):
 
         process_parameters = iteration.get_process_params()
 
+        kwargs = {}
+        if compute == "misfit" and ad_src_type in MISFIT_ONLY_TYPES:
+            kwargs["compute"] = "misfit"
+
         #  compute misfit and adjoint source
         adsrc = MISFIT_MAPPING[ad_src_type](
             t, data_d, synth_d,
             1.0 / process_parameters["lowpass"],
             1.0 / process_parameters["highpass"], plot=plot,
             max_criterion=self.comm.project.config["misc_settings"][
-                "time_frequency_adjoint_source_criterion"]
+                "time_frequency_adjoint_source_criterion"],
+            **kwargs
         )
         if plot:
             return
@@ -143,16 +299,21 @@ class AdjointSourcesComponent(Component):
         }
 
         # If the adjoint source has not been calculated, the misfit might
-        # still have. Don't store the adjoint source in that case.
+        # still have. Only store the misfit in that case.
         if ret_val["adjoint_source"] is None and \
                 isinstance(ret_val["misfit_value"], float):
-            return ret_val
-
-        if not self._validate_return_value(ret_val):
+            value = {"adjoint_source": None,
+                     "misfit_value": ret_val["misfit_value"]}
+        elif self._validate_return_value(ret_val):
+            value = ret_val
+        else:
             raise LASIFAdjointSourceCalculationError(
                 "Could not calculate adjoint source due to mismatching types.")
 
-        joblib.dump(ret_val, filename)
+        if new_values is None:
+            store.update([(key, value)])
+        else:
+            new_values.append((event_name, iteration_name, key, value))
         return ret_val
 
     def _validate_return_value(self, adsrc):
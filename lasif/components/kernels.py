@@ -117,7 +117,12 @@ class KernelsComponent(Component):
 
         from lasif.ses3d_models import RawSES3DModelHandler  # NOQA
 
+        kernel_dir = self.get(iteration=iteration, event=event)
         return RawSES3DModelHandler(
-            directory=self.get(iteration=iteration, event=event),
+            directory=kernel_dir,
             domain=self.comm.project.domain,
-            model_type="kernel")
+            model_type="kernel",
+            cache_directory=os.path.join(
+                self.comm.project.paths["cache"], "KERNELS",
+                os.path.relpath(kernel_dir, self._folder)),
+            read_only_cache=self.comm.project.read_only_caches)
@@ -48,4 +48,7 @@ class ModelsComponent(Component):
         return RawSES3DModelHandler(
             directory=self.get(model_name),
             domain=self.comm.project.domain,
-            model_type="earth_model")
+            model_type="earth_model",
+            cache_directory=os.path.join(self.comm.project.paths["cache"],
+                                         "MODELS", model_name),
+            read_only_cache=self.comm.project.read_only_caches)
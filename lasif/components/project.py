@@ -213,6 +213,14 @@ class Project(Component):
                     if "misc_settings" not in self.config:
                         self.config["misc_settings"] = {
                             "time_frequency_adjoint_source_criterion": 7.0}
+                    self.config["misc_settings"].setdefault(
+                        "parallel_backend", "auto")
+                    self.config["misc_settings"].setdefault(
+                        "parallel_processes", None)
+                    self.config["misc_settings"].setdefault(
+                        "waveform_hash_function", "crc32")
+                    self.config["misc_settings"].setdefault(
+                        "waveform_hash_sample_size", None)
 
                     self.config["download_settings"] = \
                         default_download_settings
@@ -295,6 +303,34 @@ class Project(Component):
             self.config["misc_settings"] = {
                 "time_frequency_adjoint_source_criterion": 7.0}
 
+        # Optional settings for the parallel execution.
+        self.config["misc_settings"]["parallel_backend"] = "auto"
+        self.config["misc_settings"]["parallel_processes"] = None
+        if misc is not None:
+            backend = misc.find("parallel_backend")
+            if backend is not None and backend.text:
+                self.config["misc_settings"]["parallel_backend"] = \
+                    backend.text.strip().lower()
+            processes = misc.find("parallel_processes")
+            if processes is not None and processes.text:
+                self.config["misc_settings"]["parallel_processes"] = \
+                    int(processes.text)
+
+        # Optional settings for detecting changed waveform files. Setting a
+        # sample size greatly speeds up updating the caches of large
+        # waveform files but changes in the middle of a file are missed.
+        self.config["misc_settings"]["waveform_hash_function"] = "crc32"
+        self.config["misc_settings"]["waveform_hash_sample_size"] = None
+        if misc is not None:
+            hash_function = misc.find("waveform_hash_function")
+            if hash_function is not None and hash_function.text:
+                self.config["misc_settings"]["waveform_hash_function"] = \
+                    hash_function.text.strip().lower()
+            sample_size = misc.find("waveform_hash_sample_size")
+            if sample_size is not None and sample_size.text:
+                self.config["misc_settings"]["waveform_hash_sample_size"] = \
+                    int(sample_size.text)
+
         # Write cache file.
         cf_cache = {}
         cf_cache["config"] = self.config
@@ -304,10 +340,20 @@ class Project(Component):
         with open(cfile, "wb") as fh:
             cPickle.dump(cf_cache, fh, protocol=2)
 
-    def build_all_caches(self, quick=False):
+    def build_all_caches(self, quick=False, waveform_index=False):
         """
         Command to build/update all caches.
+
+        :param quick: Only build caches that do not yet exist.
+        :param waveform_index: Also create the project wide waveform index
+            and import all waveform caches into it. Once it exists it will
+            be updated every time this method is called.
         """
+        if waveform_index:
+            print("Importing existing waveform caches to the project wide "
+                  "waveform index...")
+            self.comm.waveforms.build_waveform_index()
+
         # The event cache is always up to date and does not have to be updated.
 
         if quick and os.path.exists(self.comm.stations.cache_file):
@@ -411,6 +457,7 @@ class Project(Component):
                           communicator=self.comm, component_name="stations")
         WaveformsComponent(data_folder=self.paths["data"],
                            synthetics_folder=self.paths["synthetics"],
+                           index_file=self.paths["waveform_index_file"],
                            communicator=self.comm, component_name="waveforms")
         InventoryDBComponent(db_file=self.paths["inv_db_file"],
                              communicator=self.comm,
@@ -489,6 +536,8 @@ class Project(Component):
             os.path.join(self.paths["cache"], "config.xml_cache.pickle")
         self.paths["inv_db_file"] = \
             os.path.join(self.paths["cache"], "inventory_db.sqlite")
+        self.paths["waveform_index_file"] = \
+            os.path.join(self.paths["cache"], "waveform_index.sqlite")
 
     def __update_folder_structure(self):
         """
@@ -177,6 +177,25 @@ class QueryComponent(Component):
         if events:
             events = [self.comm.events.get(_i)["event_name"] for _i in events]
 
+        # With the project wide waveform index the available stations of
+        # all events can be retrieved with a single query per data type.
+        # Outdated parts of the index are refreshed first.
+        event_names = events or list(iteration.events.keys())
+        index = self.comm.waveforms.refresh_waveform_index(
+            "raw", event_names=event_names)
+        if index is not None:
+            self.comm.waveforms.refresh_waveform_index(
+                "processed", iteration.processing_tag,
+                event_names=event_names)
+            self.comm.waveforms.refresh_waveform_index(
+                "synthetic", iteration.long_name, event_names=event_names)
+            indexed_stations = {
+                "raw": index.get_stations("raw"),
+                "processed": index.get_stations(
+                    "processed", iteration.processing_tag),
+                "synthetic": index.get_stations(
+                    "synthetic", iteration.long_name)}
+
         # Get all the data.
         for event_name, event_dict in iteration.events.items():
             # Skip events if some are specified.
@@ -187,46 +206,14 @@ class QueryComponent(Component):
             # iteration.
             stations = set(event_dict["stations"].keys())
 
-            # Raw data.
-            try:
-                raw = self.comm.waveforms.get_metadata_raw(event_name)
-                # Get a list of all stations
-                raw = set((
-                    "{network}.{station}".format(**_i) for _i in raw))
-                # Get the missing raw stations.
-                missing_raw = stations.difference(raw)
-            except LASIFNotFoundError:
-                missing_raw = set(stations)
-            status[event_name]["missing_raw"] = missing_raw
-
-            # Processed data.
-            try:
-                processed = self.comm.waveforms.get_metadata_processed(
-                    event_name, iteration.processing_tag)
-                # Get a list of all stations
-                processed = set((
-                    "{network}.{station}".format(**_i) for _i in processed))
-                # Get all stations in raw that are also defined for the
-                # current iteration.
-                # Get the missing raw stations.
-                missing_processed = stations.difference(processed)
-            except LASIFNotFoundError:
-                missing_processed = set(stations)
-            status[event_name]["missing_processed"] = missing_processed
-
-            # Synthetic data.
-            try:
-                synthetic = self.comm.waveforms.get_metadata_synthetic(
-                    event_name, iteration.long_name)
-                # Get a list of all stations
-                synthetic = set((
-                    "{network}.{station}".format(**_i) for _i in synthetic))
-                # Get all stations in raw that are also defined for the
-                # current iteration.
-                missing_synthetic = stations.difference(synthetic)
-            except LASIFNotFoundError:
-                missing_synthetic = set(stations)
-            status[event_name]["missing_synthetic"] = missing_synthetic
+            if index is not None:
+                for data_type in ("raw", "processed", "synthetic"):
+                    status[event_name]["missing_%s" % data_type] = \
+                        stations.difference(indexed_stations[data_type].get(
+                            event_name, set()))
+            else:
+                self._get_missing_stations(event_name, iteration, stations,
+                                           status[event_name])
 
             try:
                 windows = self.comm.windows.get(event_name, iteration)
@@ -242,6 +229,53 @@ class QueryComponent(Component):
 
         return dict(status)
 
+    def _get_missing_stations(self, event_name, iteration, stations, status):
+        """
+        Helper method for :meth:`get_iteration_status` determining the
+        stations with missing data for an event from the per-folder
+        waveform caches.
+        """
+        # Raw data.
+        try:
+            raw = self.comm.waveforms.get_metadata_raw(event_name)
+            # Get a list of all stations
+            raw = set((
+                "{network}.{station}".format(**_i) for _i in raw))
+            # Get the missing raw stations.
+            missing_raw = stations.difference(raw)
+        except LASIFNotFoundError:
+            missing_raw = set(stations)
+        status["missing_raw"] = missing_raw
+
+        # Processed data.
+        try:
+            processed = self.comm.waveforms.get_metadata_processed(
+                event_name, iteration.processing_tag)
+            # Get a list of all stations
+            processed = set((
+                "{network}.{station}".format(**_i) for _i in processed))
+            # Get all stations in raw that are also defined for the
+            # current iteration.
+            # Get the missing raw stations.
+            missing_processed = stations.difference(processed)
+        except LASIFNotFoundError:
+            missing_processed = set(stations)
+        status["missing_processed"] = missing_processed
+
+        # Synthetic data.
+        try:
+            synthetic = self.comm.waveforms.get_metadata_synthetic(
+                event_name, iteration.long_name)
+            # Get a list of all stations
+            synthetic = set((
+                "{network}.{station}".format(**_i) for _i in synthetic))
+            # Get all stations in raw that are also defined for the
+            # current iteration.
+            missing_synthetic = stations.difference(synthetic)
+        except LASIFNotFoundError:
+            missing_synthetic = set(stations)
+        status["missing_synthetic"] = missing_synthetic
+
     def get_data_and_synthetics_iterator(self, iteration, event):
         """
         Get the processed data and matching synthetics for a particular event.
@@ -437,6 +471,18 @@ class QueryComponent(Component):
         domain = self.comm.project.domain
         return domain.point_in_domain(longitude=longitude, latitude=latitude)
 
+    def points_in_domain(self, latitudes, longitudes):
+        """
+        Tests which of the points are in the domain. Returns a boolean
+        array.
+
+        :param latitudes: The latitudes of the points.
+        :param longitudes: The longitudes of the points.
+        """
+        domain = self.comm.project.domain
+        return domain.points_in_domain(longitudes=longitudes,
+                                       latitudes=latitudes)
+
     def what_is(self, path):
         """
         Debug function returning a string with information about the file.
@@ -4,6 +4,7 @@ from __future__ import absolute_import
 
 import collections
 import colorama
+import numpy as np
 import os
 import sys
 
@@ -167,32 +168,32 @@ class ValidatorComponent(Component):
             except LASIFNotFoundError:
                 continue
             self._flush_point()
-            for station_id, value in \
-                    self.comm.query.get_all_stations_for_event(
-                        event_name).iteritems():
-                network_code, station_code = station_id.split(".")
-                # Check if the whole path of the event-station pair is within
-                # the domain boundaries.
-                if self.is_event_station_raypath_within_boundaries(
-                        event_name, value["latitude"], value["longitude"],
-                        raypath_steps=12):
-                    continue
-                # Otherwise get all waveform files for that station.
-                waveform_files = [_i["filename"]
-                                  for _i in waveforms
-                                  if (_i["network"] == network_code) and
-                                  (_i["station"] == station_code)]
-                if not waveform_files:
-                    continue
+            stations = self.comm.query.get_all_stations_for_event(event_name)
+            station_ids = sorted(stations.keys())
+            # Check if the whole paths of all event-station pairs are within
+            # the domain boundaries.
+            in_domain = self.are_event_station_raypaths_within_boundaries(
+                event_name,
+                [stations[_i]["latitude"] for _i in station_ids],
+                [stations[_i]["longitude"] for _i in station_ids],
+                raypath_steps=12)
+            violating_stations = set(
+                tuple(_i.split(".")) for _i, is_in_domain in
+                zip(station_ids, in_domain) if not is_in_domain)
+            if not violating_stations:
+                continue
+            # Otherwise get all waveform files for these stations.
+            for filename in [_i["filename"] for _i in waveforms
+                             if (_i["network"], _i["station"]) in
+                             violating_stations]:
                 all_good = False
-                for filename in waveform_files:
-                    files_to_be_deleted.append(filename)
-                    self._add_report(
-                        "WARNING: "
-                        "The event-station raypath for the file\n\t'{f}'\n "
-                        "does not fully lay within the domain. You might want "
-                        "to remove the file or change the domain "
-                        "specifications.".format(f=os.path.relpath(filename)))
+                files_to_be_deleted.append(filename)
+                self._add_report(
+                    "WARNING: "
+                    "The event-station raypath for the file\n\t'{f}'\n "
+                    "does not fully lay within the domain. You might want "
+                    "to remove the file or change the domain "
+                    "specifications.".format(f=os.path.relpath(filename)))
         if all_good:
             self._print_ok_message()
         else:
@@ -256,12 +257,36 @@ class ValidatorComponent(Component):
         # flow. I'm too lazy to implement something fancy now.
         iterations.append('__RAW__')
 
+        # With the project wide waveform index all metadata of one data type
+        # can be retrieved with a single query. Outdated parts of the index
+        # are refreshed first.
+        index = self.comm.waveforms.refresh_waveform_index("raw")
+        indexed_info = {}
+        if index is not None:
+            for iteration in iterations:
+                if iteration == "__RAW__":
+                    values = index.get_values("raw")
+                else:
+                    tag = self.comm.iterations.get(iteration).processing_tag
+                    self.comm.waveforms.refresh_waveform_index(
+                        "processed", tag)
+                    values = index.get_values("processed", tag)
+                indexed_info[iteration] = collections.defaultdict(list)
+                for value in values:
+                    indexed_info[iteration][value["event"]].append(value)
+
         # Loop over all events.
         for event_name in self.comm.events.list():
             self._flush_point()
 
             for iteration in iterations:
-                if iteration == "__RAW__":
+                if index is not None:
+                    waveform_info = indexed_info[iteration].get(event_name)
+                    if not waveform_info:
+                        print("NO RAW!!!" if iteration == "__RAW__"
+                              else "NO %s!!!" % iteration)
+                        continue
+                elif iteration == "__RAW__":
                     try:
                         waveform_info = self.comm.waveforms.get_metadata_raw(
                             event_name)
@@ -523,9 +548,11 @@ class ValidatorComponent(Component):
               (self.comm.events.count() * "."),
         all_good = True
         domain = self.comm.project.domain
-        for event in event_infos:
-            if domain.point_in_domain(latitude=event["latitude"],
-                                      longitude=event["longitude"]):
+        in_domain = domain.points_in_domain(
+            latitudes=[_i["latitude"] for _i in event_infos],
+            longitudes=[_i["longitude"] for _i in event_infos])
+        for event, is_in_domain in itertools.izip(event_infos, in_domain):
+            if is_in_domain:
                 continue
             all_good = False
             self._add_report(
@@ -558,23 +585,47 @@ class ValidatorComponent(Component):
         :param raypath_steps: The number of discrete points along the raypath
             that will be checked. Optional.
         """
-        from lasif.utils import greatcircle_points, Point
+        return bool(self.are_event_station_raypaths_within_boundaries(
+            event_name, [station_latitude], [station_longitude],
+            raypath_steps=raypath_steps)[0])
+
+    def are_event_station_raypaths_within_boundaries(
+            self, event_name, station_latitudes, station_longitudes,
+            raypath_steps=25):
+        """
+        Vectorized version of
+        :meth:`is_event_station_raypath_within_boundaries` checking the
+        raypaths from an event to any number of stations at once.
+
+        Returns a boolean array with one value per station.
+
+        :type event_name: str
+        :param event_name: The name of the event.
+        :param station_latitudes: The station latitudes.
+        :param station_longitudes: The station longitudes.
+        :type raypath_steps: int
+        :param raypath_steps: The number of discrete points along each
+            raypath that will be checked. Optional.
+        """
+        from lasif.utils import greatcircle_points_array
         import lasif.domain
 
-        ev = self.comm.events.get(event_name)
+        station_latitudes = np.asarray(station_latitudes, dtype=np.float64)
+        station_longitudes = np.asarray(station_longitudes,
+                                        dtype=np.float64)
 
         domain = self.comm.project.domain
 
         # Shortcircuit.
         if isinstance(domain, lasif.domain.GlobalDomain):
-            return True
+            return np.ones(len(station_latitudes), dtype=np.bool_)
 
-        for point in greatcircle_points(
-                Point(station_latitude, station_longitude),
-                Point(ev["latitude"], ev["longitude"]),
-                max_npts=raypath_steps):
+        ev = self.comm.events.get(event_name)
 
-            if not domain.point_in_domain(latitude=point.lat,
-                                          longitude=point.lng):
-                return False
-        return True
+        lats, lngs = greatcircle_points_array(
+            station_latitudes, station_longitudes,
+            np.repeat(ev["latitude"], len(station_latitudes)),
+            np.repeat(ev["longitude"], len(station_latitudes)),
+            npts=raypath_steps)
+        return domain.points_in_domain(longitudes=lngs,
+                                       latitudes=lats).all(axis=1)
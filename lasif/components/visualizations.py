@@ -82,11 +82,20 @@ class VisualizationsComponent(Component):
         self.comm.project.domain.plot(
             plot_simulation_domain=plot_simulation_domain)
 
-    def plot_raydensity(self, save_plot=True, plot_stations=False):
+    def plot_raydensity(self, save_plot=True, plot_stations=False,
+                        processes=None):
         """
         Plots the raydensity.
+
+        The binned raypaths of each event are cached so only new or changed
+        events have to be binned again.
+
+        :param processes: The number of processes binning the raypaths.
+            Defaults to the ``parallel_processes`` of the project's misc
+            settings or the number of CPUs.
         """
         from lasif import visualization
+        from lasif.tools.raydensity_cache import RaydensityCache
         import matplotlib.pyplot as plt
 
         plt.figure(figsize=(20, 21))
@@ -103,9 +112,15 @@ class VisualizationsComponent(Component):
                 stations = {}
             event_stations.append((event_info, stations))
 
+        processes = processes or \
+            self.comm.project.config["misc_settings"]["parallel_processes"]
+        cache = RaydensityCache(
+            os.path.join(self.comm.project.paths["cache"], "RAYDENSITY"),
+            read_only=self.comm.project.read_only_caches)
         visualization.plot_raydensity(map_object=map_object,
                                       station_events=event_stations,
-                                      domain=self.comm.project.domain)
+                                      domain=self.comm.project.domain,
+                                      processes=processes, cache=cache)
 
         visualization.plot_events(self.comm.events.get_all_events().values(),
                                   map_object=map_object)
@@ -12,6 +12,8 @@ import obspy
 
 from lasif import LASIFError, LASIFNotFoundError, LASIFWarning
 from ..tools.cache_helpers.waveform_cache import WaveformCache
+from ..tools.cache_helpers.waveform_index import WaveformIndex
+from ..tools.synthetics_store import SyntheticsStore
 from .component import Component
 
 
@@ -42,17 +44,26 @@ class WaveformsComponent(Component):
     :param synthetics_folder: The synthetics folder in a LASIF project.
     :param communicator: The communicator instance.
     :param component_name: The name of this component for the communicator.
+    :param index_file: The file of the optional project wide waveform
+        index. See :meth:`build_waveform_index`.
     """
     def __init__(self, data_folder, synthetics_folder, communicator,
-                 component_name):
+                 component_name, index_file=None):
         self._data_folder = data_folder
         self._synthetics_folder = synthetics_folder
+        self._index_file = index_file
+
+        # Will be initialized on first access if the index exists.
+        self.__waveform_index = None
 
         # Internal cache for the initialized waveform cache instances.
         # Limit to 20 instances as SQLite does not like too many open
         # databases at the same time.
         self.__cache = LimitedSizeDict(size_limit=10)
 
+        # Same for the stores of converted synthetics.
+        self.__synthetics_stores = LimitedSizeDict(size_limit=10)
+
         super(WaveformsComponent, self).__init__(communicator, component_name)
 
     def reset_cached_caches(self):
@@ -64,6 +75,136 @@ class WaveformsComponent(Component):
         """
         self.__cache = {}
 
+    @property
+    def waveform_index(self):
+        """
+        The project wide waveform index or ``None`` if it does not exist.
+
+        The index contains the information of all per-folder waveform caches
+        in a single database. It is only created by
+        :meth:`build_waveform_index` and afterwards kept in sync whenever a
+        per-folder cache is initialized. Use
+        :meth:`refresh_waveform_index` before querying it.
+        """
+        if self.__waveform_index is None and self._index_file and \
+                os.path.exists(self._index_file):
+            self.__waveform_index = WaveformIndex(
+                index_db_file=self._index_file,
+                root_folder=self.comm.project.paths["root"],
+                read_only=self.comm.project.read_only_caches)
+        return self.__waveform_index
+
+    def build_waveform_index(self):
+        """
+        Creates or updates the project wide waveform index.
+
+        Imports all existing per-folder waveform caches that changed since
+        they have last been imported, thus migrating all existing caches
+        to the index. Per-folder caches that do not yet exist will not be
+        built by this method.
+
+        Returns the number of imported per-folder caches.
+        """
+        if self.comm.project.read_only_caches:
+            raise LASIFError("Cannot build the waveform index with "
+                             "read-only caches.")
+        if not self._index_file:
+            raise LASIFError("No file for the waveform index specified.")
+        if self.waveform_index is None:
+            self.__waveform_index = WaveformIndex(
+                index_db_file=self._index_file,
+                root_folder=self.comm.project.paths["root"])
+
+        self.__waveform_index.remove_missing_sources()
+
+        count = 0
+        for event_name in self.comm.events.list():
+            folders = [("raw", None)]
+            try:
+                folders.extend(
+                    ("processed", _i) for _i in
+                    self.get_available_processing_tags(event_name))
+            except LASIFNotFoundError:
+                pass
+            try:
+                folders.extend(
+                    ("synthetic", self.comm.iterations.get(_i).long_name)
+                    for _i in self.get_available_synthetics(event_name))
+            except LASIFNotFoundError:
+                pass
+
+            for data_type, tag in folders:
+                cache_db_file = self.get_waveform_folder(
+                    event_name, data_type, tag) + "_cache" + \
+                    os.path.extsep + "sqlite"
+                if self._update_waveform_index(event_name, data_type, tag,
+                                               cache_db_file):
+                    count += 1
+        return count
+
+    def refresh_waveform_index(self, data_type, tag_or_iteration=None,
+                               event_names=None):
+        """
+        Brings the waveform index up to date for one data type and tag and
+        returns it. Returns ``None`` if there is no index or if it cannot be
+        updated due to read-only caches. The per-folder caches have to be
+        used in that case.
+
+        Folders which are new, removed, or had files added or removed since
+        they have last been imported are detected with a single ``stat``
+        each. Only their per-folder caches are updated and imported again.
+        Files changed in place are, as before, only noticed once the
+        per-folder cache is updated.
+
+        :param data_type: The data type.
+        :param tag_or_iteration: If processed data, the tag, if synthetic
+            data, the iteration.
+        :param event_names: The events to refresh. Defaults to all events.
+        """
+        index = self.waveform_index
+        if index is None or index.read_only:
+            return None
+
+        if data_type == "synthetic":
+            tag_or_iteration = \
+                self.comm.iterations.get(tag_or_iteration).long_name
+        if event_names is None:
+            event_names = self.comm.events.list()
+
+        for event_name in event_names:
+            folder = self.get_waveform_folder(event_name, data_type,
+                                              tag_or_iteration)
+            cache_db_file = folder + "_cache" + os.path.extsep + "sqlite"
+            if not os.path.exists(folder):
+                index.remove_source(event_name, data_type, tag_or_iteration)
+            elif not index.is_up_to_date(event_name, data_type,
+                                         tag_or_iteration, cache_db_file,
+                                         folder):
+                # Force a new, updated per-folder cache which is then
+                # imported.
+                self.__cache.pop(cache_db_file, None)
+                self.get_waveform_cache(event_name, data_type,
+                                        tag_or_iteration)
+        return index
+
+    def _update_waveform_index(self, event_name, data_type, tag,
+                               cache_db_file):
+        """
+        Imports the given per-folder cache to the waveform index if the
+        index exists and the cache changed since it has last been imported.
+
+        Returns True if it has been imported.
+        """
+        index = self.waveform_index
+        folder = self.get_waveform_folder(event_name, data_type, tag)
+        if index is None or index.read_only or \
+                not os.path.exists(cache_db_file) or \
+                index.is_up_to_date(event_name, data_type, tag,
+                                    cache_db_file, folder):
+            return False
+        index.import_cache(event_name, data_type, tag, cache_db_file, folder)
+        return True
+
     def get_metadata_for_file(self, absolute_filename):
         """
         Returns the metadata for a certain file.
@@ -163,12 +304,16 @@ class WaveformsComponent(Component):
         waveform_db_file = data_path + "_cache" + os.path.extsep + "sqlite"
         if waveform_db_file in self.__cache:
             return self.__cache[waveform_db_file]
+        misc_settings = self.comm.project.config["misc_settings"]
+        hash_settings = {
+            "hash_function": misc_settings["waveform_hash_function"],
+            "hash_sample_size": misc_settings["waveform_hash_sample_size"]}
         if dont_update is True and os.path.exists(waveform_db_file):
             cache = WaveformCache(cache_db_file=waveform_db_file,
                                   root_folder=self.comm.project.paths["root"],
                                   waveform_folder=data_path,
                                   pretty_name="%s Waveform Cache" % label,
-                                  read_only=True)
+                                  read_only=True, **hash_settings)
         elif data_type == "synthetic" \
                 and not os.path.exists(waveform_db_file) \
                 and os.listdir(data_path):
@@ -189,14 +334,18 @@ class WaveformsComponent(Component):
                                   waveform_folder=data_path,
                                   pretty_name="%s Waveform Cache" % label,
                                   read_only=self.comm.project.read_only_caches,
-                                  synthetic_info=synthetic_info)
+                                  synthetic_info=synthetic_info,
+                                  **hash_settings)
         else:
             cache = WaveformCache(cache_db_file=waveform_db_file,
                                   root_folder=self.comm.project.paths["root"],
                                   waveform_folder=data_path,
                                   pretty_name="%s Waveform Cache" % label,
-                                  read_only=self.comm.project.read_only_caches)
+                                  read_only=self.comm.project.read_only_caches,
+                                  **hash_settings)
         self.__cache[waveform_db_file] = cache
+        self._update_waveform_index(event_name, data_type, tag_or_iteration,
+                                    waveform_db_file)
         return cache
 
     def _convert_timestamps(self, values):
@@ -237,14 +386,114 @@ class WaveformsComponent(Component):
         Gets the synthetic waveforms for the given event and station as a
         :class:`~obspy.core.stream.Stream` object.
 
+        Synthetics converted with :meth:`convert_synthetics` are read from
+        the converted container if they are still up to date.
+
         :param event_name: The name of the event.
         :param station_id: The id of the station in the form ``NET.STA``.
         :param long_iteration_name: The long form of an iteration name.
         """
-        from lasif import rotations
-        import lasif.domain
+        iteration = self.comm.iterations.get(long_iteration_name)
+
+        st = None
+        store = self.get_synthetics_store(event_name, iteration.long_name)
+        if os.path.exists(store.filename):
+            st = store.get_stream(station_id, self._get_synthetics_fingerprint(
+                event_name, station_id, iteration))
+        if st is None:
+            st = self._read_synthetics(event_name, station_id, iteration)
 
+        # Apply the project function that modifies synthetics on the fly.
+        fct = self.comm.project.get_project_function("process_synthetics")
+        return fct(st, iteration=iteration,
+                   event=self.comm.events.get(event_name))
+
+    def get_synthetics_store(self, event_name, long_iteration_name):
+        """
+        Returns the store with the converted synthetics of an event and an
+        iteration. It is located next to the folder with the synthetics.
+
+        :param event_name: The name of the event.
+        :param long_iteration_name: The long form of an iteration name.
+        """
+        filename = self.get_waveform_folder(
+            event_name, "synthetic", long_iteration_name) + "_converted" + \
+            os.path.extsep + "sqlite"
+        if filename not in self.__synthetics_stores:
+            self.__synthetics_stores[filename] = SyntheticsStore(filename)
+        return self.__synthetics_stores[filename]
+
+    def convert_synthetics(self, event_name, station_id,
+                           long_iteration_name):
+        """
+        Reads the synthetics of a station, maps them to ZNE and rotates
+        them if necessary, and stores them in the converted synthetics
+        container. The ``process_synthetics`` project function is not
+        applied before storing them so it can still be changed afterwards.
+
+        Returns True if the station has been converted and False if it
+        already is up to date.
+
+        :param event_name: The name of the event.
+        :param station_id: The id of the station in the form ``NET.STA``.
+        :param long_iteration_name: The long form of an iteration name.
+        """
         iteration = self.comm.iterations.get(long_iteration_name)
+        store = self.get_synthetics_store(event_name, iteration.long_name)
+        fingerprint = self._get_synthetics_fingerprint(event_name,
+                                                       station_id, iteration)
+        if store.get_stream(station_id, fingerprint) is not None:
+            return False
+        store.add_stream(
+            station_id, self._read_synthetics(event_name, station_id,
+                                              iteration),
+            fingerprint)
+        return True
+
+    def _get_synthetics_fingerprint(self, event_name, station_id,
+                                    iteration):
+        """
+        Returns a string identifying everything the synthetics of a station
+        depend on. Changes of the solver output, the event's origin time,
+        or the rotation will all result in a different fingerprint.
+        """
+        import lasif.domain
+
+        waveform_cache = self.get_waveform_cache(
+            event_name, "synthetic", iteration.long_name)
+        network, station = station_id.split(".")
+        files = sorted(set(
+            _i["filename"] for _i in
+            waveform_cache.get_files_for_station(network, station)))
+        if not files:
+            raise LASIFNotFoundError(
+                "No 'synthetic' waveform data found for event '%s' and "
+                "station '%s'." % (event_name, station_id))
+
+        rotation = None
+        domain = self.comm.project.domain
+        if isinstance(domain, lasif.domain.RectangularSphericalSection) \
+                and domain.rotation_angle_in_degree and \
+                "ses3d" in iteration.solver_settings["solver"].lower():
+            coordinates = self.comm.query.get_coordinates_for_station(
+                event_name, station_id)
+            rotation = (list(domain.rotation_axis),
+                        domain.rotation_angle_in_degree,
+                        coordinates["latitude"], coordinates["longitude"])
+
+        return repr((
+            [(os.path.basename(_i), os.path.getmtime(_i),
+              os.path.getsize(_i)) for _i in files],
+            str(self.comm.events.get(event_name)["origin_time"]),
+            rotation))
+
+    def _read_synthetics(self, event_name, station_id, iteration):
+        """
+        Reads the synthetics of a station from the solver output. SES3D
+        synthetics are mapped to ZNE and rotated if necessary.
+        """
+        from lasif import rotations
+        import lasif.domain
 
         st = self._get_waveforms(event_name, station_id,
                                  data_type="synthetic",
@@ -305,11 +554,7 @@ class WaveformsComponent(Component):
                 st.select(channel="Z")[0].data = z
 
         st.sort()
-
-        # Apply the project function that modifies synthetics on the fly.
-        fct = self.comm.project.get_project_function("process_synthetics")
-        return fct(st, iteration=iteration,
-                   event=self.comm.events.get(event_name))
+        return st
 
     def _get_waveforms(self, event_name, station_id, data_type,
                        tag_or_iteration=None):
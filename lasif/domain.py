@@ -38,6 +38,17 @@ class Domain(object):
         """
         pass
 
+    @abstractmethod
+    def points_in_domain(self, longitudes, latitudes):
+        """
+        Called to determine which of many points are contained by the domain.
+
+        :param longitudes: The longitudes of the points.
+        :param latitudes: The latitudes of the points.
+        :return: Boolean array with the shape of the coordinates.
+        """
+        pass
+
     @abstractmethod
     def plot(self, plot_simulation_domain=False, ax=None):
         """
@@ -201,25 +212,38 @@ class RectangularSphericalSection(Domain):
 
         :return: bool
         """
+        return bool(self.points_in_domain(longitudes=[longitude],
+                                          latitudes=[latitude])[0])
+
+    def points_in_domain(self, longitudes, latitudes):
+        """
+        Vectorized version of :meth:`point_in_domain`. All points are
+        rotated at once and then checked against the unrotated domain.
+
+        :param longitudes: The longitudes of the points.
+        :param latitudes:  The latitudes of the points.
+
+        :return: Boolean array with the shape of the coordinates.
+        """
+        longitudes = np.asarray(longitudes, dtype=np.float64)
+        latitudes = np.asarray(latitudes, dtype=np.float64)
+
         if self.rotation_angle_in_degree:
-            # Rotate the point.
-            r_lat, r_lng = rotations.rotate_lat_lon(
-                latitude, longitude, self.rotation_axis,
+            # Rotate the points.
+            r_lat, r_lng = rotations.rotate_lat_lon_array(
+                latitudes, longitudes, self.rotation_axis,
                 -1.0 * self.rotation_angle_in_degree)
         else:
-            r_lng = longitude
-            r_lat = latitude
+            r_lng = longitudes
+            r_lat = latitudes
 
         bw = self.boundary_width_in_degree
 
         # Check if in bounds.
-        if not ((self.min_latitude + bw) <= r_lat <=
-                (self.max_latitude - bw)) or \
-                not ((self.min_longitude + bw) <= r_lng <=
-                     (self.max_longitude - bw)):
-            return False
-
-        return True
+        return ((self.min_latitude + bw) <= r_lat) & \
+            (r_lat <= (self.max_latitude - bw)) & \
+            ((self.min_longitude + bw) <= r_lng) & \
+            (r_lng <= (self.max_longitude - bw))
 
     def plot(self, plot_simulation_domain=False, ax=None, resolution=None,
              skip_map_features=False):
@@ -352,6 +376,20 @@ class GlobalDomain(Domain):
         """
         return True
 
+    def points_in_domain(self, longitudes, latitudes):
+        """
+        Naturally contains every point and always returns an array of True
+        values.
+
+        :param longitudes: The longitudes of the points.
+        :param latitudes: The latitudes of the points.
+
+        :return: Boolean array with the shape of the coordinates.
+        """
+        return np.ones(np.broadcast(np.asarray(longitudes),
+                                    np.asarray(latitudes)).shape,
+                       dtype=np.bool_)
+
     def plot(self, plot_simulation_domain=False, ax=None,
              skip_map_features=False):
         """
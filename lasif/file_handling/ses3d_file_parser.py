@@ -13,6 +13,7 @@ points in the setup.py.
     GNU General Public License, Version 3
     (http://www.gnu.org/copyleft/gpl.html)
 """
+import itertools
 import numpy as np
 import warnings
 
@@ -57,7 +58,8 @@ def is_SES3D(filename_or_file_object):
     return False
 
 
-def read_SES3D(file_or_file_object, headonly=False, *args, **kwargs):
+def read_SES3D(file_or_file_object, headonly=False, sample_range=None,
+               *args, **kwargs):
     """
     Turns a SES3D file into a obspy.core.Stream object.
 
@@ -79,20 +81,27 @@ def read_SES3D(file_or_file_object, headonly=False, *args, **kwargs):
     The network, station, and location attributes of the trace will be empty,
     and the channel will be set to either 'X' (south component), 'Y' (east
     component), or 'Z' (vertical component).
+
+    :param sample_range: Optional ``(start, stop)`` tuple of sample indices
+        with the same meaning as a Python slice. Only these samples are
+        parsed and the remainder of the file is not even read. The trace
+        then starts ``start * delta`` seconds after 1970-01-01T00:00:00.
     """
     if not hasattr(file_or_file_object, "read"):
         with open(file_or_file_object, "rb") as fh:
-            return _read_SES3D(fh, headonly=headonly)
+            return _read_SES3D(fh, headonly=headonly,
+                               sample_range=sample_range)
     else:
-        return _read_SES3D(file_or_file_object, headonly=headonly)
+        return _read_SES3D(file_or_file_object, headonly=headonly,
+                           sample_range=sample_range)
 
 
-def _read_SES3D(fh, headonly=False):
+def _read_SES3D(fh, headonly=False, sample_range=None):
     """
     Internal SES3D parsing routine.
     """
     # Import here to avoid circular imports.
-    from obspy.core import AttribDict, Trace, Stream
+    from obspy.core import AttribDict, Trace, Stream, UTCDateTime
 
     # Read the header.
     component = fh.readline().split()[0].lower()
@@ -107,12 +116,24 @@ def _read_SES3D(fh, headonly=False):
     src_loc = fh.readline().split()
     src_x, src_y, src_z = map(float, [src_loc[1], src_loc[3], src_loc[5]])
 
-    # Read the data.
-    if headonly is False:
-        data = np.array(map(float, fh.readlines()),
-                        dtype="float32")
-    else:
+    # Read the data. Each line holds one sample. All samples are parsed by
+    # a single call to numpy which is faster than converting each line
+    # on its own. They are parsed as doubles first so the rounding is the
+    # same as when converting each line with float().
+    start = 0
+    if headonly is not False:
         data = np.array([])
+    elif sample_range is None:
+        data = np.fromstring(fh.read(), dtype=np.float64, sep=" ")
+        data = np.require(data, dtype="float32")
+    else:
+        start, stop, _ = slice(*sample_range).indices(npts)
+        stop = max(start, stop)
+        data = np.fromstring(
+            b"".join(itertools.islice(fh, start, stop)), dtype=np.float64,
+            sep=" ")
+        data = np.require(data, dtype="float32")
+        npts = stop - start
 
     ses3d = AttribDict()
     ses3d.receiver_latitude = rotations.colat2lat(rec_x)
@@ -128,6 +149,8 @@ def _read_SES3D(fh, headonly=False):
         "ses3d": ses3d,
         "npts": npts
     }
+    if start:
+        header["starttime"] = UTCDateTime(start * delta)
 
     # Setup Obspy Stream/Trace structure.
     tr = Trace(data=data, header=header)
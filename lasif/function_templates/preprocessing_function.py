@@ -11,11 +11,11 @@ Project specific function processing observed data.
 """
 import numpy as np
 import obspy
-from obspy.io.xseed import Parser
 from scipy import signal
 import warnings
 
 from lasif import LASIFError
+from lasif.utils import read_station_file
 
 
 def preprocessing_function(processing_info, iteration):  # NOQA
@@ -70,7 +70,13 @@ def preprocessing_function(processing_info, iteration):  # NOQA
             'latitude': 46.882,
             'local_depth_in_m': None,
             'longitude': -124.3337},
-         'station_filename': u'/.../STATIONS/RESP/RESP.7D.FN01A..HH*'}
+         'station_filename': u'/.../STATIONS/RESP/RESP.7D.FN01A..HH*',
+         'response_cache': <lasif.tools.response_cache.ResponseCache ...>}
+
+    The ``response_cache`` removes instrument responses with the help of
+    deconvolution spectra cached in the project's cache folder. They only
+    have to be calculated once per channel epoch and processing parameters
+    which makes the instrument correction of further events a lot faster.
 
     Please note that you also got the iteration object here, so if you
     want some parameters to change depending on the iteration, just use
@@ -196,6 +202,7 @@ def preprocessing_function(processing_info, iteration):  # NOQA
     # =========================================================================
     output_units = "VEL"
     station_file = processing_info["station_filename"]
+    response_cache = processing_info["response_cache"]
 
     # check if the station file actually exists ==============================
     if not processing_info["station_filename"]:
@@ -220,17 +227,18 @@ def preprocessing_function(processing_info, iteration):  # NOQA
         # XXX: Check if this is m/s. In all cases encountered so far it
         # always is, but SEED is in theory also able to specify corrections
         # to other units...
-        parser = Parser(station_file)
         try:
+            # Cached, so the file is only parsed once for all its channels.
+            parser = read_station_file(station_file)
             # The simulate might fail but might still modify the data. The
             # backup is needed for the backup plan to only correct using
             # poles and zeros.
             backup_tr = tr.copy()
             try:
-                tr.simulate(seedresp={"filename": parser,
-                                      "units": output_units,
-                                      "date": tr.stats.starttime},
-                            pre_filt=pre_filt, zero_mean=False, taper=False)
+                # Same water level as Trace.simulate().
+                response_cache.remove_response(
+                    tr, station_file, pre_filt=pre_filt,
+                    output_units=output_units, water_level=600.0)
             except ValueError:
                 warnings.warn("Evalresp failed, will only use the Poles and "
                               "Zeros stage")
@@ -253,26 +261,28 @@ def preprocessing_function(processing_info, iteration):  # NOQA
     # processing with RESP files =============================================
     elif "/RESP/" in station_file:
         try:
-            tr.simulate(seedresp={"filename": station_file,
-                                  "units": output_units,
-                                  "date": tr.stats.starttime},
-                        pre_filt=pre_filt, zero_mean=False, taper=False)
-        except ValueError as e:
+            # Same water level as Trace.simulate().
+            response_cache.remove_response(
+                tr, station_file, pre_filt=pre_filt,
+                output_units=output_units, water_level=600.0)
+        except (ValueError, LASIFError) as e:
             msg = ("File  could not be corrected with the help of the "
                    "RESP file '%s'. Will be skipped. Due to: %s") \
                 % (processing_info["station_filename"], str(e))
             raise LASIFError(msg)
     elif "/StationXML/" in station_file:
         try:
-            inv = obspy.read_inventory(station_file, format="stationxml")
+            # Cached, so the file is only parsed once for all its channels.
+            read_station_file(station_file)
         except Exception as e:
             msg = ("Could not open StationXML file '%s'. Due to: %s. Will be "
                    "skipped." % (station_file, str(e)))
             raise LASIFError(msg)
-        tr.attach_response(inv)
         try:
-            tr.remove_response(output=output_units, pre_filt=pre_filt,
-                               zero_mean=False, taper=False)
+            # Same water level as Trace.remove_response().
+            response_cache.remove_response(
+                tr, station_file, pre_filt=pre_filt,
+                output_units=output_units, water_level=60.0)
         except Exception as e:
             msg = ("File  could not be corrected with the help of the "
                    "StationXML file '%s'. Due to: '%s'  Will be skipped.") \
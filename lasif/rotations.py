@@ -187,6 +187,38 @@ def get_spherical_unit_vectors(lat, lon):
     return e_theta, e_phi, e_r
 
 
+def get_spherical_unit_vectors_array(lats, lons):
+    """
+    Vectorized version of :func:`get_spherical_unit_vectors` for any number
+    of points.
+
+    Returns an array of shape ``(N, 3, 3)``. Its rows are e_theta, e_phi and
+    e_r of each point.
+
+    >>> bases = get_spherical_unit_vectors_array([0.0, 90.0], [0.0, 0.0])
+    >>> bases.shape
+    (2, 3, 3)
+    >>> bases[0].round(6).tolist()
+    [[0.0, 0.0, -1.0], [-0.0, 1.0, 0.0], [1.0, 0.0, 0.0]]
+
+    :param lats: Latitudes in degree.
+    :param lons: Longitudes in degree.
+    """
+    colats = np.deg2rad(lat2colat(np.asarray(lats, dtype=np.float64)))
+    lons = np.deg2rad(np.asarray(lons, dtype=np.float64))
+    bases = np.empty(colats.shape + (3, 3), dtype=np.float64)
+    bases[..., 0, 0] = np.cos(lons) * np.cos(colats)
+    bases[..., 0, 1] = np.sin(lons) * np.cos(colats)
+    bases[..., 0, 2] = -np.sin(colats)
+    bases[..., 1, 0] = -np.sin(lons)
+    bases[..., 1, 1] = np.cos(lons)
+    bases[..., 1, 2] = 0.0
+    bases[..., 2, 0] = np.cos(lons) * np.sin(colats)
+    bases[..., 2, 1] = np.sin(lons) * np.sin(colats)
+    bases[..., 2, 2] = np.cos(colats)
+    return bases
+
+
 def rotate_lat_lon(lat, lon, rotation_axis, angle):
     """
     Takes a point specified by latitude and longitude and return a new pair of
@@ -198,15 +230,61 @@ def rotate_lat_lon(lat, lon, rotation_axis, angle):
     :param rotation_axis: Rotation axis specified as [x, y, z].
     :param angle: Rotation angle in degree.
     """
-    # Convert to xyz. Do the calculation on the unit sphere as the radius does
-    # not matter.
-    xyz = lat_lon_radius_to_xyz(lat, lon, 1.0)
-    # Rotate xyz.
-    new_xyz = rotate_vector(xyz, rotation_axis, angle)
-    new_lat, new_lon, _ = xyz_to_lat_lon_radius(new_xyz)
+    new_lat, new_lon = rotate_lat_lon_array(lat, lon, rotation_axis, angle)
+    if new_lat.ndim == 0:
+        return new_lat[()], new_lon[()]
     return new_lat, new_lon
 
 
+def rotate_lat_lon_array(lats, lons, rotation_axis, angle):
+    """
+    Vectorized version of :func:`rotate_lat_lon`. Rotates any number of
+    points with a single rotation matrix.
+
+    The returned coordinates have the same shape as the input and single
+    precision, just as the ones of :func:`xyz_to_lat_lon_radius`.
+
+    >>> lats, lons = rotate_lat_lon_array([10.0, -20.0], [0.0, 45.0], \
+        [0, 0, 1], 90)
+    >>> lats.round(4).tolist(), lons.round(4).tolist()
+    ([10.0, -20.0], [90.0, 135.0])
+
+    :param lats: Latitudes of the original points.
+    :param lons: Longitudes of the original points.
+    :param rotation_axis: Rotation axis specified as [x, y, z].
+    :param angle: Rotation angle in degree.
+    """
+    new_lats, new_lons = _rotate_lat_lon_array(lats, lons, rotation_axis,
+                                               angle)
+    return (np.require(new_lats, dtype=np.float32),
+            np.require(new_lons, dtype=np.float32))
+
+
+def _rotate_lat_lon_array(lats, lons, rotation_axis, angle):
+    """
+    Rotates the points in double precision.
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    colats = np.deg2rad(lat2colat(lats))
+    lons = np.deg2rad(lons)
+
+    # Unit vectors of all points along the last axis. The radius does not
+    # matter.
+    xyz = np.empty(lats.shape + (3,), dtype=np.float64)
+    xyz[..., 0] = np.sin(colats) * np.cos(lons)
+    xyz[..., 1] = np.sin(colats) * np.sin(lons)
+    xyz[..., 2] = np.cos(colats)
+
+    rotation_matrix = np.asarray(_get_rotation_matrix(rotation_axis, angle))
+    xyz = xyz.dot(rotation_matrix.T)
+
+    # Clip to guard against rounding errors right at the poles.
+    new_colats = np.rad2deg(np.arccos(np.clip(xyz[..., 2], -1.0, 1.0)))
+    new_lons = np.rad2deg(np.arctan2(xyz[..., 1], xyz[..., 0]))
+    return colat2lat(new_colats), new_lons
+
+
 def xyz_to_lat_lon_radius(*args):
     """
     Converts x, y, and z to latitude, longitude and radius.
@@ -300,33 +378,51 @@ def _get_rotation_and_base_transfer_matrix(lat, lon, rotation_axis, angle):
     >>> mat[1, 2] <= 1E-7
     True
     """
+    return _get_rotation_and_base_transfer_matrices(
+        lat, lon, rotation_axis, angle)[0]
+
+
+def _get_rotation_and_base_transfer_matrices(lats, lons, rotation_axis,
+                                             angle):
+    """
+    Vectorized version of :func:`_get_rotation_and_base_transfer_matrix`.
+    Returns the transfer matrices of all points as an array of shape
+    ``(N, 3, 3)``.
+
+    :param lats: Latitudes of the recording points.
+    :param lons: Longitudes of the recording points.
+    :param rotation_axis: Rotation axis given as [x, y, z].
+    :param angle: Rotation angle in degree.
+
+    >>> mats = _get_rotation_and_base_transfer_matrices( \
+        [12, -45], [34, 170], [-45, 34, 45], -66)
+    >>> mats.shape
+    (2, 3, 3)
+    >>> bool(np.all(np.abs(mats[:, 2, 2] - 1.0) <= 1E-7))
+    True
+    """
+    lats = np.atleast_1d(np.asarray(lats, dtype=np.float64))
+    lons = np.atleast_1d(np.asarray(lons, dtype=np.float64))
+
     # Rotate latitude and longitude to obtain the new coordinates after the
     # rotation.
-    lat_new, lon_new = rotate_lat_lon(lat, lon, rotation_axis, angle)
+    lats_new, lons_new = _rotate_lat_lon_array(lats, lons, rotation_axis,
+                                               angle)
 
     # Get the orthonormal basis vectors at both points. This can be interpreted
     # as having two sets of basis vectors in the original xyz coordinate
     # system.
-    e_theta, e_phi, e_r = get_spherical_unit_vectors(lat, lon)
-    e_theta_new, e_phi_new, e_r_new = get_spherical_unit_vectors(lat_new,
-                                                                 lon_new)
-
-    # Rotate the new unit vectors in the opposite direction to simulate a
-    # rotation in the wanted direction.
-    e_theta_new = rotate_vector(e_theta_new, rotation_axis, -angle)
-    e_phi_new = rotate_vector(e_phi_new, rotation_axis, -angle)
-    e_r_new = rotate_vector(e_r_new, rotation_axis, -angle)
-
-    # Calculate the transfer matrix. This works because both sets of basis
+    bases = get_spherical_unit_vectors_array(lats, lons)
+    bases_new = get_spherical_unit_vectors_array(lats_new, lons_new)
+
+    # The new unit vectors have to be rotated in the opposite direction to
+    # simulate a rotation in the wanted direction. The inverse of a rotation
+    # matrix is its transpose and thus the dot products between the rotated
+    # new and the old unit vectors are equal to the ones between the new and
+    # the rotated old unit vectors. This works because both sets of basis
     # vectors are orthonormal.
-    transfer_matrix = np.matrix((
-        [np.dot(e_theta_new, e_theta), np.dot(e_theta_new, e_phi),
-            np.dot(e_theta_new, e_r)],
-        [np.dot(e_phi_new, e_theta), np.dot(e_phi_new, e_phi),
-            np.dot(e_phi_new, e_r)],
-        [np.dot(e_r_new, e_theta), np.dot(e_r_new, e_phi), np.dot(e_r_new,
-                                                                  e_r)]))
-    return transfer_matrix
+    rotation_matrix = np.asarray(_get_rotation_matrix(rotation_axis, angle))
+    return np.einsum("nik,kl,njl->nij", bases_new, rotation_matrix, bases)
 
 
 def rotate_moment_tensor(Mrr, Mtt, Mpp, Mrt, Mrp, Mtp, lat, lon, rotation_axis,
@@ -377,20 +473,42 @@ def rotate_data(north_data, east_data, vertical_data, lat, lon, rotation_axis,
     :param rotation_axis: Rotation axis given as [x, y, z].
     :param angle: Rotation angle in degree.
     """
-    transfer_matrix = _get_rotation_and_base_transfer_matrix(
-        lat, lon, rotation_axis, angle)
+    north_data, east_data, vertical_data = rotate_data_array(
+        [north_data], [east_data], [vertical_data], [lat], [lon],
+        rotation_axis, angle)
+    return north_data[0], east_data[0], vertical_data[0]
+
+
+def rotate_data_array(north_data, east_data, vertical_data, lats, lons,
+                      rotation_axis, angle):
+    """
+    Vectorized version of :func:`rotate_data`. Rotates the three component
+    data of any number of recording points at once.
+
+    :param north_data: The north components of all points as an array of
+        shape ``(N, npts)``.
+    :param east_data: The east components of all points as an array of
+        shape ``(N, npts)``.
+    :param vertical_data: The vertical components of all points as an array
+        of shape ``(N, npts)``. Vertical is defined to be up, e.g. radially
+        outwards.
+    :param lats: Latitudes of the N recording points.
+    :param lons: Longitudes of the N recording points.
+    :param rotation_axis: Rotation axis given as [x, y, z].
+    :param angle: Rotation angle in degree.
+    """
+    transfer_matrices = _get_rotation_and_base_transfer_matrices(
+        lats, lons, rotation_axis, angle)
 
-    # Apply the transfer matrix. Invert north data because they have
+    # Apply the transfer matrices. Invert north data because they have
     # to point in the other direction to be consistent with the spherical
     # coordinates.
-    new_data = np.array(transfer_matrix.dot([-1.0 * north_data,
-                                             east_data, vertical_data]))
+    data = np.array([-1.0 * np.asarray(north_data), east_data,
+                     vertical_data])
+    new_data = np.einsum("nij,jnt->int", transfer_matrices, data)
 
     # Return the transferred data arrays. Again negate north data.
-    north_data = -1.0 * new_data[0]
-    east_data = new_data[1]
-    vertical_data = new_data[2]
-    return north_data, east_data, vertical_data
+    return -1.0 * new_data[0], new_data[1], new_data[2]
 
 
 def get_border_latlng_list(
@@ -47,11 +47,9 @@ from lasif import LASIFError
 os.environ["OPENBLAS_NUM_THREADS"] = "1"
 
 import argparse
-import collections
 import colorama
 import difflib
 import itertools
-import progressbar
 import sys
 import time
 import traceback
@@ -128,6 +126,24 @@ class LASIFCommandLineException(Exception):
     pass
 
 
+def _add_parallel_arguments(parser):
+    """
+    Adds the arguments choosing how work is distributed to the parser.
+    """
+    from lasif.tools.parallel_helpers import BACKENDS
+    parser.add_argument(
+        "--parallel_backend", choices=BACKENDS, default=None,
+        help="how to distribute the work. 'auto' uses MPI if launched with "
+             "more than one MPI process and otherwise runs serially. "
+             "'multiprocessing' uses a pool of local processes. Defaults to "
+             "the 'parallel_backend' of the project's misc settings.")
+    parser.add_argument(
+        "--processes", type=int, default=None,
+        help="number of processes for the 'multiprocessing' backend. "
+             "Defaults to the 'parallel_processes' of the project's misc "
+             "settings or the number of CPUs.")
+
+
 def _find_project_comm(folder, read_only_caches):
     """
     Will search upwards from the given folder until a folder containing a
@@ -169,20 +185,6 @@ def _find_project_comm_mpi(folder, read_only_caches):
     return comm
 
 
-def split(container, count):
-    """
-    Simple and elegant function splitting a container into count
-    equal chunks.
-
-    Order is not preserved but for the use case at hand this is
-    potentially an advantage as data sitting in the same folder thus
-    have a higher at being processed at the same time thus the disc
-    head does not have to jump around so much. Of course very
-    architecture dependent.
-    """
-    return [container[_i::count] for _i in range(count)]
-
-
 @command_group("Plotting")
 def lasif_plot_domain(parser, args):
     """
@@ -264,10 +266,16 @@ def lasif_plot_raydensity(parser, args):
     """
     parser.add_argument("--plot_stations", help="also plot the stations",
                         action="store_true")
+    parser.add_argument(
+        "--processes", type=int, default=None,
+        help="number of processes binning the raypaths. Defaults to the "
+             "'parallel_processes' of the project's misc settings or the "
+             "number of CPUs.")
     args = parser.parse_args(args)
 
     comm = _find_project_comm(".", args.read_only_caches)
-    comm.visualizations.plot_raydensity(plot_stations=args.plot_stations)
+    comm.visualizations.plot_raydensity(plot_stations=args.plot_stations,
+                                        processes=args.processes)
 
 
 @command_group("Data Acquisition")
@@ -411,10 +419,17 @@ def lasif_build_all_caches(parser, args):
     parser.add_argument("--quick", help="Only check caches for folders that "
                                         "do not have a cache.",
                         action="store_true")
+    parser.add_argument("--waveform_index",
+                        help="Create the project wide waveform index and "
+                             "import all waveform caches into it. Speeds up "
+                             "project wide queries. Once created, it is "
+                             "always updated by this command.",
+                        action="store_true")
     args = parser.parse_args(args)
 
     comm = _find_project_comm(".", read_only_caches=False)
-    comm.project.build_all_caches(quick=args.quick)
+    comm.project.build_all_caches(quick=args.quick,
+                                  waveform_index=args.waveform_index)
 
 
 @command_group("Project Management")
@@ -657,34 +672,101 @@ def lasif_init_project(parser, args):
     print("Initialized project in: \n\t%s" % folder_path)
 
 
+@mpi_enabled
 @command_group("Iteration Management")
 def lasif_finalize_adjoint_sources(parser, args):
     """
     Finalize the adjoint sources.
+
+    This function works with MPI. Without MPI it can use a pool of local
+    processes with "--parallel_backend=multiprocessing", otherwise only one
+    core actually does any work.
     """
     parser.add_argument("iteration_name", help="name of the iteration")
     parser.add_argument("event_name", help="name of the event")
+    _add_parallel_arguments(parser)
     args = parser.parse_args(args)
     iteration_name = args.iteration_name
     event_name = args.event_name
 
-    comm = _find_project_comm(".", args.read_only_caches)
-    comm.actions.finalize_adjoint_sources(iteration_name, event_name)
+    comm = _find_project_comm_mpi(".", args.read_only_caches)
+    comm.actions.finalize_adjoint_sources(iteration_name, event_name,
+                                          backend=args.parallel_backend,
+                                          processes=args.processes)
 
 
+@mpi_enabled
 @command_group("Iteration Management")
 def lasif_calculate_all_adjoint_sources(parser, args):
     """
     Calculates all adjoint sources for a given iteration and event.
+
+    This function works with MPI. Without MPI it can use a pool of local
+    processes with "--parallel_backend=multiprocessing", otherwise only one
+    core actually does any work.
     """
     parser.add_argument("iteration_name", help="name of the iteration")
     parser.add_argument("event_name", help="name of the event")
+    _add_parallel_arguments(parser)
     args = parser.parse_args(args)
     iteration_name = args.iteration_name
     event_name = args.event_name
 
-    comm = _find_project_comm(".", args.read_only_caches)
-    comm.actions.calculate_all_adjoint_sources(iteration_name, event_name)
+    comm = _find_project_comm_mpi(".", args.read_only_caches)
+    comm.actions.calculate_all_adjoint_sources(
+        iteration_name, event_name, backend=args.parallel_backend,
+        processes=args.processes)
+
+
+@mpi_enabled
+@command_group("Iteration Management")
+def lasif_convert_synthetics(parser, args):
+    """
+    Converts the synthetics of an iteration to a binary format.
+
+    Synthetics are afterwards read from the converted files which is much
+    faster, especially for SES3D synthetics. Stations whose synthetics
+    changed after the conversion are read from the original files again.
+
+    This function works with MPI. Without MPI it can use a pool of local
+    processes with "--parallel_backend=multiprocessing", otherwise only one
+    core actually does any work.
+    """
+    parser.add_argument("iteration_name", help="name of the iteration")
+    parser.add_argument(
+        "events", help="One or more events. If none given, all will be done.",
+        nargs="*")
+    _add_parallel_arguments(parser)
+    args = parser.parse_args(args)
+    iteration_name = args.iteration_name
+    events = args.events if args.events else None
+
+    comm = _find_project_comm_mpi(".", args.read_only_caches)
+
+    # No need to perform these checks on all ranks.
+    exceptions = []
+    if MPI.COMM_WORLD.rank == 0:
+        if not comm.iterations.has_iteration(iteration_name):
+            msg = ("Iteration '%s' not found. Use 'lasif list_iterations' to "
+                   "get a list of all available iterations.") % iteration_name
+            exceptions.append(msg)
+        elif events:
+            iteration = comm.iterations.get(iteration_name)
+            for event_name in events:
+                if event_name not in iteration.events:
+                    msg = "Event '%s' not part of iteration '%s'." % (
+                        event_name, iteration_name)
+                    exceptions.append(msg)
+                    break
+
+    # Raise any exceptions on all ranks if necessary.
+    exceptions = MPI.COMM_WORLD.bcast(exceptions, root=0)
+    if exceptions:
+        raise LASIFCommandLineException(exceptions[0])
+
+    comm.actions.convert_synthetics(iteration_name, events,
+                                    backend=args.parallel_backend,
+                                    processes=args.processes)
 
 
 @mpi_enabled
@@ -798,7 +880,6 @@ def lasif_plot_model(parser, args):
     plt.figure(figsize=(15, 15))
 
     model = comm.models.get_model_handler(args.model_name)
-    model.parse_component(args.component)
 
     m = comm.project.domain.plot()
     im = model.plot_depth_slice(component=args.component,
@@ -845,8 +926,6 @@ def lasif_plot_kernel(parser, args):
         directory=args.folder, domain=comm.project.domain,
         model_type="kernel")
 
-    model.parse_component(args.component)
-
     m = comm.project.domain.plot()
     im = model.plot_depth_slice(component=args.component,
                                 depth_in_km=args.depth, m=m)["mesh"]
@@ -925,6 +1004,7 @@ def lasif_compare_misfits(parser, args):
     meaningless.
     """
     from lasif import LASIFAdjointSourceCalculationError
+    from lasif.tools.parallel_helpers import mpi_imap_unordered
 
     parser.add_argument("from_iteration",
                         help="past iteration")
@@ -946,27 +1026,26 @@ def lasif_compare_misfits(parser, args):
             set(to_it.events.keys())))
         event_count = len(events)
 
-        # Split into a number of events per MPI process.
-        events = split(events, MPI.COMM_WORLD.size)
-
         print " => Calculating misfit change from iteration '%s' to " \
             "iteration '%s' ..." % (from_it.name, to_it.name)
         print " => Launching calculations on %i core(s)\n" % \
             MPI.COMM_WORLD.size
 
+        # Migrates the misfits of older LASIF versions before any worker
+        # reads them.
+        for event in events:
+            for iteration in (from_it, to_it):
+                comm.adjoint_sources.get_store(event, iteration.long_name)
+
     else:
         events = None
 
-    # Scatter jobs
-    events = MPI.COMM_WORLD.scatter(events, root=0)
-
-    total_misfit_from = 0
-    total_misfit_to = 0
-
-    all_events = collections.defaultdict(list)
-
-    # Loop over each event.
-    for _i, event in enumerate(events):
+    def compare_misfits_for_event(event):
+        """
+        Returns the event name, the total misfits of the event in both
+        iterations, the misfit difference for each shared channel, and the
+        newly calculated misfits. The latter are stored by rank 0.
+        """
         # Get the windows from both.
         window_group_to = comm.windows.get(event, to_it)
         window_group_from = comm.windows.get(event, from_it)
@@ -977,20 +1056,13 @@ def lasif_compare_misfits(parser, args):
         shared_channels = set(window_group_to.list()).intersection(
             set(window_group_from.list()))
 
-        # On rank 0, show a progressbar because it can take forever.
-        if MPI.COMM_WORLD.rank == 0:
-            widgets = [
-                "Approximately event %i of %i: " % (
-                    _i * MPI.COMM_WORLD.size + 1, event_count),
-                progressbar.Percentage(),
-                progressbar.Bar(), "", progressbar.ETA()]
-            pbar = progressbar.ProgressBar(
-                widgets=widgets, maxval=len(shared_channels)).start()
+        event_misfit_from = 0
+        event_misfit_to = 0
+        differences = []
+        new_values = []
 
         # Loop over each channel.
-        for _i, channel in enumerate(shared_channels):
-            if MPI.COMM_WORLD.rank == 0:
-                pbar.update(_i)
+        for channel in shared_channels:
             window_collection_from = window_group_from.get(channel)
             window_collection_to = window_group_to.get(channel)
 
@@ -1010,7 +1082,9 @@ def lasif_compare_misfits(parser, args):
                     continue
 
                 try:
-                    misfit_from = win_from.misfit_value
+                    misfit_from = win_from.get_adjoint_source(
+                        compute="misfit",
+                        new_values=new_values)["misfit_value"]
                 except LASIFAdjointSourceCalculationError:
                     continue
                 except LASIFNotFoundError as e:
@@ -1018,7 +1092,9 @@ def lasif_compare_misfits(parser, args):
                     continue
 
                 try:
-                    misfit_to = win_to.misfit_value
+                    misfit_to = win_to.get_adjoint_source(
+                        compute="misfit",
+                        new_values=new_values)["misfit_value"]
                 except Exception as e:
                     print(e)
                     # Random penalty...but how else to compare?
@@ -1040,28 +1116,37 @@ def lasif_compare_misfits(parser, args):
             channel_misfit_to *= \
                 event_weight * station_weight / total_channel_weight
 
-            total_misfit_from += channel_misfit_from
-            total_misfit_to += channel_misfit_to
+            event_misfit_from += channel_misfit_from
+            event_misfit_to += channel_misfit_to
 
             if (misfit_to - misfit_from) < -1.5:
                 print(event, channel, misfit_from - misfit_to)
-            all_events[event].append(misfit_to - misfit_from)
-        if MPI.COMM_WORLD.rank == 0:
-            pbar.finish()
+            differences.append(misfit_to - misfit_from)
 
-    _all_events = MPI.COMM_WORLD.gather(all_events, root=0)
+        return event, event_misfit_from, event_misfit_to, differences, \
+            new_values
 
-    total_misfit_from = MPI.COMM_WORLD.reduce(total_misfit_from, root=0)
-    total_misfit_to = MPI.COMM_WORLD.reduce(total_misfit_to, root=0)
+    total_misfit_from = 0
+    total_misfit_to = 0
+
+    all_events = {}
+
+    # Rank 0 hands out the events to whichever rank is idle and collects
+    # the results as they come in.
+    for _i, (event, misfit_from, misfit_to, differences, new_values) in \
+            enumerate(mpi_imap_unordered(compare_misfits_for_event, events)):
+        comm.adjoint_sources.store_adjoint_sources(new_values)
+        print "Compared misfits of %i of %i events." % (
+            _i + 1, event_count)
+        total_misfit_from += misfit_from
+        total_misfit_to += misfit_to
+        if differences:
+            all_events[event] = differences
 
     # Only rank 0 continues.
     if MPI.COMM_WORLD.rank != 0:
         return
 
-    # Collect in singular dictionary again.
-    all_events = {}
-    [all_events.update(_i) for _i in _all_events]
-
     if not all_events:
         raise LASIFCommandLineException("No misfit values could be compared.")
 
@@ -1197,13 +1282,19 @@ def lasif_preprocess_data(parser, args):
     Launch data preprocessing.
 
     This function works with MPI. Don't use too many cores, I/O quickly
-    becomes the limiting factor. It also works without MPI but then only one
+    becomes the limiting factor. Without MPI it can use a pool of local
+    processes with "--parallel_backend=multiprocessing", otherwise only one
     core actually does any work.
     """
     parser.add_argument("iteration_name", help="name of the iteration")
     parser.add_argument(
         "events", help="One or more events. If none given, all will be done.",
         nargs="*")
+    parser.add_argument(
+        "--resume_from", default=None,
+        help="logfile of a previous, interrupted run. Items already "
+             "processed in it will not be processed again.")
+    _add_parallel_arguments(parser)
     args = parser.parse_args(args)
     iteration_name = args.iteration_name
     events = args.events if args.events else None
@@ -1231,7 +1322,10 @@ def lasif_preprocess_data(parser, args):
     if exceptions:
         raise LASIFCommandLineException(exceptions[0])
 
-    comm.actions.preprocess_data(iteration_name, events)
+    comm.actions.preprocess_data(iteration_name, events,
+                                 backend=args.parallel_backend,
+                                 processes=args.processes,
+                                 resume_from=args.resume_from)
 
 
 @command_group("Iteration Management")
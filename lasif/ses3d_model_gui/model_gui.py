@@ -247,9 +247,7 @@ class Window(QtGui.QMainWindow):
         if None in self.current_state.values():
             return
 
-        self.model.parse_component(component)
-
-        # Plot model and colorbar.
+        # Plot model and colorbar. Only the required depth slice is read.
         ret_val = self.model.plot_depth_slice(
             component, depth, self.basemap,
             absolute_values=True if style == "absolute" else False)
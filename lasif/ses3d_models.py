@@ -13,6 +13,8 @@ A set of classes dealing with SES3D 4.1 Models
 """
 import collections
 import glob
+import itertools
+import json
 import math
 import numpy as np
 import os
@@ -36,6 +38,10 @@ UNIT_DICT = {
 tomo_colormap = lasif.colors.get_colormap(
     "tomo_full_scale_linear_lightness")
 
+# Version of the on-disc component caches. Increment it to invalidate all
+# existing caches if the format or the derivation of any component changes.
+COMPONENT_CACHE_VERSION = 1
+
 
 class RawSES3DModelHandler(object):
     """
@@ -64,7 +70,8 @@ class RawSES3DModelHandler(object):
         * vy_[xx]_[timestep]
         * vz_[xx]_[timestep]
     """
-    def __init__(self, directory, domain, model_type="earth_model"):
+    def __init__(self, directory, domain, model_type="earth_model",
+                 cache_directory=None, read_only_cache=False):
         """
         The init function.
 
@@ -75,6 +82,12 @@ class RawSES3DModelHandler(object):
                 * earth_model - The standard SES3D model files (default)
                 * kernel - The kernels. Identifies by lots of grad_* files.
                 * wavefield - The raw wavefields.
+        :param cache_directory: If given, all parsed and derived components
+            are stored in this directory and reused by later instances
+            unless any of the files they have been created from changed.
+            Cached components are memory mapped when loaded.
+        :param read_only_cache: If True, existing cached components will be
+            used but no new ones will be written.
         """
         self.directory = directory
         self.boxfile = os.path.join(self.directory, "boxfile")
@@ -82,6 +95,13 @@ class RawSES3DModelHandler(object):
             msg = "boxfile not found. Wrong directory?"
             raise ValueError(msg)
 
+        self.cache_directory = cache_directory
+        self.read_only_cache = read_only_cache
+        # The state of the files each parsed component has been created from.
+        # Determined before the files are read.
+        self._component_sources = {}
+        self._boxfile_state = self._get_file_states([self.boxfile])
+
         # Read the boxfile.
         self.setup = self._read_boxfile()
 
@@ -212,17 +232,85 @@ class RawSES3DModelHandler(object):
                 self.depth_bounds[1], self.depth_bounds[0],
                 self.setup["point_count_in_z"])[::-1]
 
-    def _read_single_box(self, component, file_number):
+    def _get_axis_mapping(self, domain, axis, index=None):
+        """
+        Maps the GLL points of a single subdomain along one axis to the
+        indices of the merged array without duplicates.
+
+        Returns a list of ``(node, source, destination)`` tuples. ``source``
+        is a slice over the elements of the subdomain and ``destination``
+        the corresponding slice in the merged array for the given node of
+        each element. Points shared by two neighbouring elements are only
+        taken from the first of both. The z axis is reversed.
+
+        :param domain: The subdomain.
+        :param axis: The axis, one of ``"x"``, ``"y"``, and ``"z"``.
+        :param index: If given, only the single point with this index in
+            the merged array is mapped to the destination index 0. The
+            returned list is empty if the subdomain does not contain it.
+        """
+        lpd = self.lagrange_polynomial_degree
+        count = domain["index_%s_count" % axis]
+        offset = lpd * domain["boundaries_%s" % axis][0]
+
+        mapping = []
+        for node in xrange(lpd + 1):
+            if axis != "z":
+                if node == 0:
+                    mapping.append((node, slice(0, 1),
+                                    slice(offset, offset + 1)))
+                    continue
+                start = offset + node
+                mapping.append((node, slice(0, count), slice(
+                    start, start + (count - 1) * lpd + 1, lpd)))
+            else:
+                if node == 0:
+                    start = offset + count * lpd
+                    mapping.append((node, slice(0, 1),
+                                    slice(start, start + 1)))
+                    continue
+                start = offset + lpd - node
+                mapping.append((node, slice(None, None, -1), slice(
+                    start, start + (count - 1) * lpd + 1, lpd)))
+
+        if index is None:
+            return mapping
+
+        for node, source, destination in mapping:
+            if not destination.start <= index < destination.stop or \
+                    (index - destination.start) % lpd:
+                continue
+            element = range(count)[source][
+                (index - destination.start) // lpd]
+            return [(node, slice(element, element + 1), slice(0, 1))]
+        return []
+
+    def _read_single_box(self, component, file_number, data, x_index=None,
+                         y_index=None, z_index=None):
         """
         This function reads Ses3ds raw binary files, e.g. 3d velocity field
-        snapshots, as well as model parameter files or sensitivity kernels. It
-        returns the field as an array of rank 3 with shape (nx*lpd+1, ny*lpd+1,
-        nz*lpd+1), discarding the duplicates by default.
+        snapshots, as well as model parameter files or sensitivity kernels.
+        The values are directly written to their place in the merged array
+        of shape (nx*lpd+1, ny*lpd+1, nz*lpd+1), discarding the duplicates.
+
+        The file is memory mapped so only a single copy of the data is ever
+        held in memory.
+
+        If any index is given, only this index is read along the
+        corresponding axis and data must have a length of one along this
+        axis. Nothing is read if the subdomain does not contain the
+        requested indices.
         """
         # Get the file and the corresponding domain.
         filename = self.components[component]["filenames"][file_number]
         domain = self.setup["subdomains"][file_number]
 
+        mappings = [self._get_axis_mapping(domain, axis, index)
+                    for axis, index in (("x", x_index), ("y", y_index),
+                                        ("z", z_index))]
+        if not all(mappings):
+            return
+
         lpd = self.lagrange_polynomial_degree
 
         shape = (domain["index_x_count"], domain["index_y_count"],
@@ -230,32 +318,15 @@ class RawSES3DModelHandler(object):
 
         # Take care: The first and last four bytes in the arrays are invalid
         #  due to them being written by Fortran.
-        with open(filename, "rb") as open_file:
-            field = np.ndarray(shape, buffer=open_file.read()[4:-4],
-                               dtype="float32", order="F")
-
-        # Calculate the new shape by multiplying every dimension with lpd + 1
-        # value for every dimension.
-        new_shape = [_i * _j for _i, _j in zip(shape[:3], shape[3:])]
-
-        # Reorder the axes:
-        # v[x, y, z, lpd + 1 ,lpd + 1, lpd + 1] -> v[x, lpd + 1, y, z,
-        # lpd + 1, lpd + 1] -> v[x, lpd + 1, y, lpd + 1, z, lpd + 1]
-        field = np.rollaxis(np.rollaxis(field, 3, 1), 3, lpd + 1)
-
-        # Reshape the data:
-        # v[nx,lpd+1,ny,lpd+1,nz,lpd+1] to v[nx*(lpd+1),ny*(lpd+1),nz*(lpd+1)]
-        field = field.reshape(new_shape, order="C")
+        field = np.memmap(filename, dtype="float32", mode="r", offset=4,
+                          shape=shape, order="F")
 
-        # XXX: Attempt to do this in one step.
-        for axis, count in enumerate(new_shape):
-            # Mask the duplicate values.
-            mask = np.ones(count, dtype="bool")
-            mask[::lpd + 1][1:] = False
-            # Remove them by compressing the array.
-            field = field.compress(mask, axis=axis)
-
-        return field[:, :, ::-1]
+        # Each combination of nodes is a contiguous block in the file.
+        for (x_node, x_src, x_dst), (y_node, y_src, y_dst), \
+                (z_node, z_src, z_dst) in itertools.product(*mappings):
+            data[x_dst, y_dst, z_dst] = \
+                field[x_src, y_src, z_src, x_node, y_node, z_node]
+        del field
 
     def parse_component(self, component):
         """
@@ -272,64 +343,226 @@ class RawSES3DModelHandler(object):
             msg = "Component %s is unknown" % component
             raise ValueError(msg)
 
+        if component in self.parsed_components or \
+                self._load_cached_component(component):
+            return
+
+        sources = dict(self._boxfile_state)
+
+        def get_component(name):
+            self._parse_component(name)
+            sources.update(self._component_sources[name])
+            return self.parsed_components[name]
+
+        self.parsed_components[component] = \
+            self._derive_component(component, get_component)
+        self._component_sources[component] = sources
+        self._write_cached_component(component)
+
+    def _derive_component(self, component, get_component):
+        """
+        Calculates a derived component.
+
+        :param component: The name of the derived component.
+        :param get_component: Function returning the values of a real
+            component given its name.
+        """
         if component == "vp":
-            self._parse_component("lambda")
-            self._parse_component("mu")
-            self._parse_component("rhoinv")
-            lambda_ = self.parsed_components["lambda"]
-            mu = self.parsed_components["mu"]
-            rhoinv = self.parsed_components["rhoinv"]
-            self.parsed_components["vp"] = \
-                np.sqrt(((lambda_ + 2.0 * mu) * rhoinv)) / 1000.0
+            lambda_ = get_component("lambda")
+            mu = get_component("mu")
+            rhoinv = get_component("rhoinv")
+            return np.sqrt(((lambda_ + 2.0 * mu) * rhoinv)) / 1000.0
         elif component == "vsh":
-            self._parse_component("mu")
-            self._parse_component("rhoinv")
-            mu = self.parsed_components["mu"]
-            rhoinv = self.parsed_components["rhoinv"]
-            self.parsed_components["vsh"] = np.sqrt((mu * rhoinv)) / 1000.0
+            mu = get_component("mu")
+            rhoinv = get_component("rhoinv")
+            return np.sqrt((mu * rhoinv)) / 1000.0
         elif component == "vsv":
-            self._parse_component("mu")
-            self._parse_component("rhoinv")
-            self._parse_component("B")
-            mu = self.parsed_components["mu"]
-            rhoinv = self.parsed_components["rhoinv"]
-            b = self.parsed_components["B"]
-            self.parsed_components["vsv"] = \
-                np.sqrt((mu + b) * rhoinv) / 1000.0
+            mu = get_component("mu")
+            rhoinv = get_component("rhoinv")
+            b = get_component("B")
+            return np.sqrt((mu + b) * rhoinv) / 1000.0
         elif component == "rho":
-            self._parse_component("rhoinv")
-            rhoinv = self.parsed_components["rhoinv"]
-            self.parsed_components["rho"] = 1.0 / rhoinv
+            rhoinv = get_component("rhoinv")
+            return 1.0 / rhoinv
+        msg = "Component %s is unknown" % component
+        raise ValueError(msg)
+
+    def get_slice(self, component, x_index=None, y_index=None,
+                  z_index=None):
+        """
+        Returns the values of a component at the given GLL point indices.
+
+        Works like indexing the array of a parsed component, e.g.
+        ``get_slice(component, z_index=10)`` is equal to
+        ``parsed_components[component][:, :, 10]``. Axes without an index
+        are returned completely. Negative indices count from the end and
+        out of range indices raise an ``IndexError``.
+
+        If the component has neither been parsed nor cached, only the parts
+        of the subdomain files containing the requested points are read. This
+        enables fast access to depth slices and depth profiles of models
+        that are too large to be completely loaded into memory.
+
+        :param component: The component name.
+        :param x_index: The index along the x axis (colatitude).
+        :param y_index: The index along the y axis (longitude).
+        :param z_index: The index along the z axis (depth).
+        """
+        indices = tuple(
+            None if value is None else self._normalize_index(value, axis)
+            for value, axis in zip((x_index, y_index, z_index), "xyz"))
+        index = tuple(slice(None) if _i is None else _i for _i in indices)
+
+        if component in self.parsed_components or \
+                self._load_cached_component(component):
+            return self.parsed_components[component][index]
+        elif component not in self.components and \
+                component not in self.available_derived_components:
+            msg = "Component %s is unknown" % component
+            raise ValueError(msg)
+
+        # The real components read for this request. The derived components
+        # are computed point wise so they can be derived from the slices.
+        values = {}
+
+        def get_component(name):
+            if name in self.parsed_components or \
+                    self._load_cached_component(name):
+                return self.parsed_components[name][index]
+            if name not in values:
+                shape = [1 if _i is not None else
+                         self.setup["point_count_in_%s" % _j]
+                         for _i, _j in zip(indices, ("x", "y", "z"))]
+                data = np.empty(shape, dtype="float32")
+                for _i in xrange(len(self.setup["subdomains"])):
+                    self._read_single_box(name, _i, data, *indices)
+                values[name] = data[tuple(
+                    slice(None) if _i is None else 0 for _i in indices)]
+            return values[name]
+
+        if component in self.components:
+            return get_component(component)
+        return self._derive_component(component, get_component)
+
+    def _normalize_index(self, index, axis):
+        """
+        Returns the non-negative equivalent of an index along the given axis
+        of the merged array.
+        """
+        count = self.setup["point_count_in_%s" % axis]
+        index = int(index)
+        if not -count <= index < count:
+            raise IndexError(
+                "Index %i is out of bounds for the %s axis with %i points." %
+                (index, axis, count))
+        return index % count
 
     def _parse_component(self, component):
         """
         Parses the specified component.
         """
-        if component in self.parsed_components:
+        if component in self.parsed_components or \
+                self._load_cached_component(component):
             return
+
+        sources = dict(self._boxfile_state)
+        sources.update(self._get_file_states(
+            self.components[component]["filenames"]))
+
         # Allocate empty array with the necessary dimensions.
         data = np.empty((
             self.setup["point_count_in_x"],
             self.setup["point_count_in_y"], self.setup["point_count_in_z"]),
             dtype="float32")
 
-        for _i, domain in enumerate(self.setup["subdomains"]):
-            x_min, x_max = domain["boundaries_x"]
-            y_min, y_max = domain["boundaries_y"]
-            z_min, z_max = domain["boundaries_z"]
+        # Merge all subdomains into data.
+        for _i in xrange(len(self.setup["subdomains"])):
+            self._read_single_box(component, _i, data)
+
+        self.parsed_components[component] = data
+        self._component_sources[component] = sources
+        self._write_cached_component(component)
+
+    @staticmethod
+    def _get_file_states(filenames):
+        """
+        Returns a dictionary with the modification time and the size of
+        each file which is used to detect changes of them.
+        """
+        return {_i: [os.path.getmtime(_i), os.path.getsize(_i)]
+                for _i in filenames}
+
+    def _get_cache_filenames(self, component):
+        """
+        Returns the names of the data and the header file of the cache of a
+        component.
+        """
+        name = component.replace(" ", "_")
+        return (os.path.join(self.cache_directory,
+                             name + os.path.extsep + "npy"),
+                os.path.join(self.cache_directory,
+                             name + os.path.extsep + "json"))
 
-            # Minimum indices
-            x_min, y_min, z_min = [self.lagrange_polynomial_degree * _j
-                                   for _j in (x_min, y_min, z_min)]
-            # Maximum indices
-            x_max, y_max, z_max = [self.lagrange_polynomial_degree * (_j + 1)
-                                   for _j in (x_max, y_max, z_max)]
+    def _load_cached_component(self, component):
+        """
+        Loads a component from the cache if possible.
 
-            # Merge into data.
-            data[x_min: x_max + 1, y_min: y_max + 1, z_min: z_max + 1] = \
-                self._read_single_box(component, _i)
+        Returns True if the component could be loaded, False otherwise.
+        """
+        if not self.cache_directory:
+            return False
+        data_file, header_file = self._get_cache_filenames(component)
+        try:
+            with open(header_file, "rt") as fh:
+                header = json.load(fh)
+            if header["version"] != COMPONENT_CACHE_VERSION:
+                return False
+            # Make sure none of the source files changed. The filenames are
+            # part of the state so they also must not change.
+            sources = header["sources"]
+            if self.boxfile not in sources or \
+                    self._get_file_states(sources.keys()) != sources:
+                return False
+            data = np.load(data_file, mmap_mode="r")
+        except (IOError, OSError, ValueError, KeyError):
+            return False
+
+        if data.shape != (self.setup["point_count_in_x"],
+                          self.setup["point_count_in_y"],
+                          self.setup["point_count_in_z"]):
+            return False
 
         self.parsed_components[component] = data
+        self._component_sources[component] = sources
+        return True
+
+    def _write_cached_component(self, component):
+        """
+        Writes a parsed component to the cache if the handler has one.
+        """
+        if not self.cache_directory or self.read_only_cache:
+            return
+        data_file, header_file = self._get_cache_filenames(component)
+        try:
+            if not os.path.exists(self.cache_directory):
+                os.makedirs(self.cache_directory)
+            # Remove the header first so an interrupted write results in an
+            # invalid cache. Write to a temporary file so already memory
+            # mapped caches remain valid.
+            if os.path.exists(header_file):
+                os.remove(header_file)
+            temp_file = data_file + ".tmp"
+            with open(temp_file, "wb") as fh:
+                np.save(fh, np.require(self.parsed_components[component],
+                                       dtype=np.float32))
+            os.rename(temp_file, data_file)
+            with open(header_file, "wt") as fh:
+                json.dump({"version": COMPONENT_CACHE_VERSION,
+                           "sources": self._component_sources[component]},
+                          fh)
+        except (IOError, OSError) as e:
+            warnings.warn("Could not write cache for component '%s': %s" % (
+                component, str(e)))
 
     def _calculate_final_dimensions(self):
         """
@@ -424,8 +657,6 @@ class RawSES3DModelHandler(object):
                                           component, absolute_values):
                 return None
 
-        data = self.parsed_components[component]
-
         depth = self.collocation_points_depth[depth_index]
         lngs = self.collocation_points_lngs
         lats = self.collocation_points_lats
@@ -446,7 +677,7 @@ class RawSES3DModelHandler(object):
             lat.shape = lat_shape
 
         x, y = m(lon, lat)
-        depth_data = data[::-1, :, depth_index]
+        depth_data = self.get_slice(component, z_index=depth_index)[::-1, :]
 
         # Plot values relative to AK135.
         if not absolute_values:
@@ -539,9 +770,8 @@ class RawSES3DModelHandler(object):
         x_index = self.get_closest_gll_index("latitude", latitude)
         y_index = self.get_closest_gll_index("longitude", longitude)
 
-        data = self.parsed_components[component]
         depths = self.collocation_points_depth
-        values = data[x_index, y_index, :]
+        values = self.get_slice(component, x_index=x_index, y_index=y_index)
 
         lat = self.collocation_points_lats[::-1][x_index]
         lng = self.collocation_points_lngs[y_index]
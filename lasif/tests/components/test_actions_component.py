@@ -273,7 +273,7 @@ def test_adjoint_source_finalization_unrotated_domain(patch, comm, capsys):
     capsys.readouterr()
 
     # Make sure nothing is rotated as the domain is not rotated.
-    with mock.patch("lasif.rotations.rotate_data") as patch:
+    with mock.patch("lasif.rotations.rotate_data_array") as patch:
         comm.actions.finalize_adjoint_sources(it.name, event_name)
     assert patch.call_count == 0
 
@@ -288,6 +288,268 @@ def test_adjoint_source_finalization_unrotated_domain(patch, comm, capsys):
                                                       "ad_src_1"])
 
 
+@mock.patch("lasif.tools.Q_discrete.calculate_Q_model")
+def test_adjoint_sources_of_a_station_read_waveforms_once(patch, comm):
+    """
+    All adjoint sources of a station are calculated from a single read of
+    its waveforms and none at all if they are already stored.
+    """
+    # Speed up this test.
+    patch.return_value = (np.array([1.6341, 1.0513, 1.5257]),
+                          np.array([0.59496, 3.7119, 22.2171]))
+
+    comm.iterations.create_new_iteration(
+        "1", "ses3d_4_1", comm.query.get_stations_for_all_events(), 8, 100)
+
+    event_name = "GCMT_event_TURKEY_Mag_5.1_2010-3-24-14-11"
+    event = comm.events.get(event_name)
+    t = event["origin_time"]
+    it = comm.iterations.get("1")
+
+    # Fake preprocessed data by copying the synthetics and perturbing them.
+    np.random.seed(123456)
+    s = comm.waveforms.get_waveforms_synthetic(event_name, "HL.ARG",
+                                               it.long_name)
+    for tr in s:
+        tr.data += np.random.random(len(tr.data)) * 2E-8
+    path = comm.waveforms.get_waveform_folder(event_name, "processed",
+                                              it.processing_tag)
+    if not os.path.exists(path):
+        os.makedirs(path)
+    for tr in s:
+        tr.write(os.path.join(path, tr.id), format="mseed")
+
+    window_group_manager = comm.windows.get(event, it)
+    for chan in ["HL.ARG..BHE", "HL.ARG..BHN", "HL.ARG..BHZ"]:
+        window_group = window_group_manager.get(chan)
+        window_group.add_window(starttime=t + 100, endtime=t + 200)
+        window_group.add_window(starttime=t + 100, endtime=t + 200,
+                                taper_percentage=0.1)
+        window_group.write()
+
+    query = comm.query
+    with mock.patch.object(query, "get_matching_waveforms",
+                           wraps=query.get_matching_waveforms) as p:
+        comm.actions.calculate_all_adjoint_sources(it.name, event_name)
+    assert p.call_count == 1
+    assert p.call_args[1]["station_or_channel_id"] == "HL.ARG"
+
+    # Now all are stored and the waveforms are not needed at all.
+    with mock.patch.object(query, "get_matching_waveforms",
+                           wraps=query.get_matching_waveforms) as p:
+        collections = window_group_manager.get_windows_for_station("HL.ARG")
+        ad_srcs = comm.adjoint_sources.calculate_adjoint_sources(collections)
+    assert p.call_count == 0
+    assert [len(_i) for _i in ad_srcs] == [2, 2, 2]
+
+    # Same as the single window calculation.
+    window = collections[0].windows[1]
+    single = comm.adjoint_sources.calculate_adjoint_source(
+        event_name, it.name, collections[0].channel_id, window.starttime,
+        window.endtime, window.taper, window.taper_percentage,
+        window.misfit_type)
+    assert single["misfit_value"] == ad_srcs[0][1]["misfit_value"]
+    np.testing.assert_array_equal(single["adjoint_source"],
+                                  ad_srcs[0][1]["adjoint_source"])
+
+
+@mock.patch("lasif.tools.Q_discrete.calculate_Q_model")
+def test_misfit_values_without_adjoint_sources(patch, comm):
+    """
+    Misfit values can be calculated and stored without calculating the
+    adjoint sources.
+    """
+    # Speed up this test.
+    patch.return_value = (np.array([1.6341, 1.0513, 1.5257]),
+                          np.array([0.59496, 3.7119, 22.2171]))
+
+    comm.iterations.create_new_iteration(
+        "1", "ses3d_4_1", comm.query.get_stations_for_all_events(), 8, 100)
+
+    event_name = "GCMT_event_TURKEY_Mag_5.1_2010-3-24-14-11"
+    event = comm.events.get(event_name)
+    t = event["origin_time"]
+    it = comm.iterations.get("1")
+
+    # Fake preprocessed data by copying the synthetics and perturbing them.
+    np.random.seed(123456)
+    s = comm.waveforms.get_waveforms_synthetic(event_name, "HL.ARG",
+                                               it.long_name)
+    for tr in s:
+        tr.data += np.random.random(len(tr.data)) * 2E-8
+    path = comm.waveforms.get_waveform_folder(event_name, "processed",
+                                              it.processing_tag)
+    if not os.path.exists(path):
+        os.makedirs(path)
+    for tr in s:
+        tr.write(os.path.join(path, tr.id), format="mseed")
+
+    window_group = comm.windows.get(event, it).get("HL.ARG..BHZ")
+    window_group.add_window(starttime=t + 100, endtime=t + 200)
+    window_group.write()
+    window = window_group.windows[0]
+
+    misfit_value = window.misfit_value
+    assert isinstance(misfit_value, float)
+    store = comm.adjoint_sources.get_store(event_name, it.long_name)
+    assert len(store) == 0
+
+    # The stored misfit does not require the waveforms.
+    query = comm.query
+    with mock.patch.object(query, "get_matching_waveforms") as p:
+        assert window.misfit_value == misfit_value
+    assert p.call_count == 0
+
+    # The full calculation results in the same misfit.
+    adj_src = window.adjoint_source
+    assert len(store) == 1
+    assert adj_src["misfit_value"] == misfit_value
+
+
+@mock.patch("lasif.tools.Q_discrete.calculate_Q_model")
+def test_new_adjoint_sources_are_returned_instead_of_stored(patch, comm):
+    """
+    Parallel workers return the new adjoint sources so a single process
+    can store them.
+    """
+    # Speed up this test.
+    patch.return_value = (np.array([1.6341, 1.0513, 1.5257]),
+                          np.array([0.59496, 3.7119, 22.2171]))
+
+    comm.iterations.create_new_iteration(
+        "1", "ses3d_4_1", comm.query.get_stations_for_all_events(), 8, 100)
+
+    event_name = "GCMT_event_TURKEY_Mag_5.1_2010-3-24-14-11"
+    event = comm.events.get(event_name)
+    t = event["origin_time"]
+    it = comm.iterations.get("1")
+
+    # Fake preprocessed data by copying the synthetics and perturbing them.
+    np.random.seed(123456)
+    s = comm.waveforms.get_waveforms_synthetic(event_name, "HL.ARG",
+                                               it.long_name)
+    for tr in s:
+        tr.data += np.random.random(len(tr.data)) * 2E-8
+    path = comm.waveforms.get_waveform_folder(event_name, "processed",
+                                              it.processing_tag)
+    if not os.path.exists(path):
+        os.makedirs(path)
+    for tr in s:
+        tr.write(os.path.join(path, tr.id), format="mseed")
+
+    window_group = comm.windows.get(event, it).get("HL.ARG..BHZ")
+    window_group.add_window(starttime=t + 100, endtime=t + 200)
+    window_group.write()
+
+    new_values = []
+    ad_srcs = comm.adjoint_sources.calculate_adjoint_sources(
+        [window_group], new_values=new_values)
+    store = comm.adjoint_sources.get_store(event_name, it.long_name)
+    assert len(store) == 0
+    assert len(new_values) == 1
+    assert new_values[0][:2] == (event_name, it.long_name)
+
+    comm.adjoint_sources.store_adjoint_sources(new_values)
+    assert store.keys() == [new_values[0][2]]
+    np.testing.assert_array_equal(
+        store[new_values[0][2]]["adjoint_source"],
+        ad_srcs[0][0]["adjoint_source"])
+
+    # Stored ones are not returned again.
+    new_values = []
+    comm.adjoint_sources.calculate_adjoint_sources(
+        [window_group], new_values=new_values)
+    assert new_values == []
+
+
+def test_migration_of_legacy_adjoint_sources(comm):
+    """
+    Adjoint sources pickled to one file per window by earlier versions are
+    moved into the store.
+    """
+    import joblib
+
+    event_name = "GCMT_event_TURKEY_Mag_5.1_2010-3-24-14-11"
+    folder = os.path.join(comm.project.paths["adjoint_sources"], event_name,
+                          "ITERATION_1")
+    os.makedirs(folder)
+    adsrc = {"adjoint_source": np.linspace(0.0, 1.0, 100),
+             "misfit_value": 1.5,
+             "details": {"messages": []}}
+    joblib.dump(adsrc, os.path.join(folder, "valid"))
+    joblib.dump({"misfit_value": 1.5}, os.path.join(folder, "invalid"))
+    with open(os.path.join(folder, "broken"), "wb") as fh:
+        fh.write(b"no pickle")
+
+    # Workers do not migrate.
+    comm.adjoint_sources.get_store(event_name, "ITERATION_1", migrate=False)
+    assert os.path.exists(folder)
+
+    store = comm.adjoint_sources.get_store(event_name, "ITERATION_1")
+    assert not os.path.exists(folder)
+    assert store.keys() == ["valid"]
+    np.testing.assert_array_equal(store["valid"]["adjoint_source"],
+                                  adsrc["adjoint_source"])
+    assert store.get_misfit("valid") == 1.5
+
+
+@mock.patch("lasif.tools.Q_discrete.calculate_Q_model")
+def test_adjoint_source_finalization_with_process_pool(patch, comm):
+    """
+    Finalizing the adjoint sources with a pool of processes must result in
+    exactly the same files as doing it serially.
+    """
+    # Speed up this test.
+    patch.return_value = (np.array([1.6341, 1.0513, 1.5257]),
+                          np.array([0.59496, 3.7119, 22.2171]))
+
+    comm.iterations.create_new_iteration(
+        "1", "ses3d_4_1", comm.query.get_stations_for_all_events(), 8, 100)
+
+    event_name = "GCMT_event_TURKEY_Mag_5.1_2010-3-24-14-11"
+    event = comm.events.get(event_name)
+    t = event["origin_time"]
+    it = comm.iterations.get("1")
+
+    # Fake preprocessed data by copying the synthetics and perturbing them.
+    np.random.seed(123456)
+    s = comm.waveforms.get_waveforms_synthetic(event_name, "HL.ARG",
+                                               it.long_name)
+    for tr in s:
+        tr.data += np.random.random(len(tr.data)) * 2E-8
+    path = comm.waveforms.get_waveform_folder(event_name, "processed",
+                                              it.processing_tag)
+    if not os.path.exists(path):
+        os.makedirs(path)
+    for tr in s:
+        tr.write(os.path.join(path, tr.id), format="mseed")
+
+    window_group_manager = comm.windows.get(event, it)
+    for chan in ["HL.ARG..BHE", "HL.ARG..BHN", "HL.ARG..BHZ"]:
+        window_group = window_group_manager.get(chan)
+        window_group.add_window(starttime=t + 100, endtime=t + 200)
+        window_group.write()
+
+    out = os.path.join(comm.project.paths["output"], "adjoint_sources")
+    files = []
+    # The pool first so the workers actually calculate the adjoint sources.
+    for backend in ("multiprocessing", "serial"):
+        comm.actions.finalize_adjoint_sources(it.name, event_name,
+                                              backend=backend, processes=2)
+        adj_src_dir = os.path.join(out, os.listdir(out)[0])
+        contents = {}
+        for filename in os.listdir(adj_src_dir):
+            with open(os.path.join(adj_src_dir, filename), "rt") as fh:
+                contents[filename] = fh.read()
+        files.append(contents)
+        shutil.rmtree(adj_src_dir)
+
+    assert sorted(files[0].keys()) == ["ad_src_1", "ad_srcfile"]
+    assert files[0] == files[1]
+    # The adjoint sources calculated by the workers have been stored.
+    assert len(comm.adjoint_sources.get_store(event_name, it.long_name)) == 3
+
+
 def test_adjoint_source_finalization_global_domain(comm, capsys):
     """
     Tests the adjoint source finalization with with a global domain.
@@ -336,7 +598,7 @@ def test_adjoint_source_finalization_global_domain(comm, capsys):
     capsys.readouterr()
 
     # Make sure nothing is rotated as the domain is not rotated.
-    with mock.patch("lasif.rotations.rotate_data") as patch:
+    with mock.patch("lasif.rotations.rotate_data_array") as patch:
         comm.actions.finalize_adjoint_sources(it.name, event_name)
     assert patch.call_count == 0
 
@@ -404,12 +666,13 @@ def test_adjoint_source_finalization_rotated_domain(patch, comm, capsys):
     capsys.readouterr()
 
     # Make sure nothing is rotated as the domain is not rotated.
-    rotate_data = rotations.rotate_data
-    with mock.patch("lasif.rotations.rotate_data") as patch:
+    rotate_data_array = rotations.rotate_data_array
+    with mock.patch("lasif.rotations.rotate_data_array") as patch:
         patch.side_effect = \
-            lambda *args, **kwargs: rotate_data(*args, **kwargs)
+            lambda *args, **kwargs: rotate_data_array(*args, **kwargs)
         comm.actions.finalize_adjoint_sources(it.name, event_name)
-    # Once for each synthetic and once for the adjoint source.
+    # Once for each synthetic and once for the adjoint sources of all
+    # stations.
     assert patch.call_count == 4
 
     out, _ = capsys.readouterr()
@@ -474,10 +737,10 @@ def test_adjoint_source_finalization_rotated_domain_specfem(comm, capsys):
     capsys.readouterr()
 
     # Make sure nothing is rotated as the domain is not rotated.
-    rotate_data = rotations.rotate_data
-    with mock.patch("lasif.rotations.rotate_data") as patch:
+    rotate_data_array = rotations.rotate_data_array
+    with mock.patch("lasif.rotations.rotate_data_array") as patch:
         patch.side_effect = \
-            lambda *args, **kwargs: rotate_data(*args, **kwargs)
+            lambda *args, **kwargs: rotate_data_array(*args, **kwargs)
         comm.actions.finalize_adjoint_sources(it.name, event_name)
     # Should not be rotated at all!
     assert patch.call_count == 0
@@ -537,9 +800,46 @@ def test_calculate_all_adjoint_sources_with_failing_adjoint_src_calculation(
     assert "Could not calculate adjoint source for iteration 1" in out
 
     # Make sure nothing is actually written.
-    out = os.path.join(comm.project.paths["adjoint_sources"], event_name,
-                       it.long_name)
-    assert os.listdir(out) == []
+    assert len(comm.adjoint_sources.get_store(event_name, it.long_name)) == 0
+
+
+@mock.patch("lasif.tools.Q_discrete.calculate_Q_model")
+def test_adjoint_sources_with_unexpected_exceptions(patch, comm, capsys):
+    """
+    Any exception of a station is reported and must not propagate out of
+    the parallel workers.
+    """
+    # Speed up this test.
+    patch.return_value = (np.array([1.6341, 1.0513, 1.5257]),
+                          np.array([0.59496, 3.7119, 22.2171]))
+
+    comm.iterations.create_new_iteration(
+        "1", "ses3d_4_1", comm.query.get_stations_for_all_events(), 8, 100)
+
+    event_name = "GCMT_event_TURKEY_Mag_5.1_2010-3-24-14-11"
+    event = comm.events.get(event_name)
+    t = event["origin_time"]
+    it = comm.iterations.get("1")
+
+    window_group = comm.windows.get(event, it).get("HL.ARG..BHZ")
+    window_group.add_window(starttime=t + 100, endtime=t + 200)
+    window_group.write()
+
+    capsys.readouterr()
+    with mock.patch("lasif.components.adjoint_sources."
+                    "AdjointSourcesComponent.calculate_adjoint_sources") as p:
+        p.side_effect = ValueError("corrupt file")
+        comm.actions.calculate_all_adjoint_sources(it.name, event_name)
+        out, _ = capsys.readouterr()
+        assert "Could not calculate adjoint source for iteration 1 and " \
+            "station HL.ARG. Reason: corrupt file" in out
+
+        comm.actions.finalize_adjoint_sources(it.name, event_name)
+        out, _ = capsys.readouterr()
+        assert "Could not calculate adjoint source for iteration 1 and " \
+            "station HL.ARG. Reason: corrupt file" in out
+        assert "Could not create a single adjoint source." in out
+    assert p.call_count == 2
 
 
 @mock.patch("lasif.tools.Q_discrete.calculate_Q_model")
@@ -605,9 +905,9 @@ def test_calculate_all_adjoint_sources_rotated_domain(patch, comm, capsys):
     out, _ = capsys.readouterr()
     assert out == ""
 
-    # Make sure that three adjoint sources are written in the end.
-    out = os.path.join(comm.project.paths["adjoint_sources"], event_name,
-                       it.long_name)
-    # Joblib dumps one or two files per written array, depending on the
-    # version.
-    assert len(os.listdir(out)) >= 3
+    # Make sure that three adjoint sources are written in the end, all to
+    # the same file.
+    assert len(comm.adjoint_sources.get_store(event_name, it.long_name)) == 3
+    assert os.listdir(os.path.join(comm.project.paths["adjoint_sources"],
+                                   event_name)) == \
+        [it.long_name + os.path.extsep + "sqlite"]
@@ -246,6 +246,66 @@ def test_iteration_status(patch, comm):
     assert status[event]["missing_raw"] == set(["HL.ARG"])
 
 
+@mock.patch("lasif.tools.Q_discrete.calculate_Q_model")
+def test_iteration_status_with_waveform_index(patch, comm):
+    """
+    The iteration status must be the same when using the project wide
+    waveform index.
+    """
+    # Speed up this test.
+    patch.return_value = (np.array([1.6341, 1.0513, 1.5257]),
+                          np.array([0.59496, 3.7119, 22.2171]))
+
+    comm.iterations.create_new_iteration(
+        "1", "ses3d_4_1", comm.query.get_stations_for_all_events(), 8, 100)
+    event = "GCMT_event_TURKEY_Mag_5.1_2010-3-24-14-11"
+    comm.actions.preprocess_data("1", [event])
+
+    # Build the caches first to test the migration of existing caches.
+    comm.project.build_all_caches()
+    assert comm.waveforms.waveform_index is None
+    expected = comm.query.get_iteration_status("1")
+
+    # Three caches for the first event: raw, processed, and synthetic. The
+    # second event has no data.
+    assert comm.waveforms.build_waveform_index() == 3
+    # Nothing changed so nothing is imported again.
+    assert comm.waveforms.build_waveform_index() == 0
+
+    index = comm.waveforms.waveform_index
+    assert index is not None
+    assert comm.query.get_iteration_status("1") == expected
+    values = index.get_values("raw", event=event)
+    assert all(_i["event"] == event for _i in values)
+    assert sorted(_i["filename"] for _i in values) == \
+        sorted(_i["filename"] for _i in
+               comm.waveforms.get_metadata_raw(event))
+
+    # Added and removed files are detected without updating any caches.
+    proc_folder = os.path.join(
+        comm.project.paths["data"], event,
+        comm.iterations.get("1").processing_tag)
+    for filename in glob.glob(os.path.join(proc_folder, "HL.ARG*")):
+        os.remove(filename)
+
+    status = comm.query.get_iteration_status("1")
+    assert status[event]["missing_processed"] == set(["HL.ARG"])
+    assert status[event]["missing_raw"] == set()
+    assert status[event]["missing_synthetic"] == \
+        expected[event]["missing_synthetic"]
+    # The index has been refreshed.
+    assert "HL.ARG" not in index.get_stations(
+        "processed", comm.iterations.get("1").processing_tag)[event]
+
+    # Same for removed folders.
+    for folder in os.listdir(comm.project.paths["synthetics"]):
+        shutil.rmtree(os.path.join(comm.project.paths["synthetics"], folder))
+    status = comm.query.get_iteration_status("1")
+    assert status[event]["missing_synthetic"] == \
+        set(["KO.KULA", "KO.RSDY", "HT.SIGR", "HL.ARG"])
+    assert status[event]["missing_processed"] == set(["HL.ARG"])
+
+
 @mock.patch("lasif.tools.Q_discrete.calculate_Q_model")
 def test_data_synthetic_iterator(patch, comm, recwarn):
     """
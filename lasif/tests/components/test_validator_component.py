@@ -4,6 +4,7 @@ from __future__ import absolute_import
 
 import inspect
 import mock
+import numpy as np
 import os
 import pytest
 import shutil
@@ -37,6 +38,11 @@ def test_is_event_station_raypath_within_boundaries(comm):
     assert not comm.validator.is_event_station_raypath_within_boundaries(
         event, 38.92, 140.0)
 
+    np.testing.assert_array_equal(
+        comm.validator.are_event_station_raypaths_within_boundaries(
+            event, [38.92, 38.92, 38.0], [40.0, 140.0, 39.0]),
+        [True, False, True])
+
 
 def test_data_validation_raypath_in_domain(comm):
     """
@@ -50,12 +56,14 @@ def test_data_validation_raypath_in_domain(comm):
 
     # Have the raypath check fail.
     with mock.patch('lasif.components.validator.ValidatorComponent'
-                    '.is_event_station_raypath_within_boundaries') as p:
-        p.return_value = False
+                    '.are_event_station_raypaths_within_boundaries') as p:
+        p.side_effect = lambda event_name, lats, lngs, **kwargs: \
+            np.zeros(len(lats), dtype=np.bool_)
         assert sorted(comm.validator.validate_raypaths_in_domain()) == \
             filenames
-        # 4 stations, 4 calls
-        assert p.call_count == 4
+        # 4 stations of a single event, 1 call.
+        assert p.call_count == 1
+        assert len(p.call_args[0][1]) == 4
 
 
 def test_data_validation(comm, capsys):
@@ -4,6 +4,7 @@ from __future__ import absolute_import
 
 import inspect
 import mock
+import numpy as np
 import os
 import pytest
 import shutil
@@ -91,6 +92,85 @@ def test_reading_synthetics(comm):
     assert st[2].stats.starttime == origin_time
 
 
+def test_converted_synthetics(comm):
+    """
+    Converted synthetics are identical to the original ones but reading
+    them neither parses nor rotates the solver output.
+    """
+    from lasif import rotations
+
+    comm.iterations.create_new_iteration(
+        "1", "ses3d_4_1", comm.query.get_stations_for_all_events(), 8, 100)
+    it = comm.iterations.get("1")
+    event_name = "GCMT_event_TURKEY_Mag_5.1_2010-3-24-14-11"
+    comm.project.domain.rotation_angle_in_degree = 0.1
+
+    original = comm.waveforms.get_waveforms_synthetic(event_name, "HL.ARG", 1)
+
+    comm.actions.convert_synthetics("1", [event_name])
+    store = comm.waveforms.get_synthetics_store(event_name, it.long_name)
+    assert store.get_stations() == ["HL.ARG", "HT.SIGR"]
+
+    with mock.patch("lasif.rotations.rotate_data") as p_rotate, \
+            mock.patch("obspy.read") as p_read:
+        st = comm.waveforms.get_waveforms_synthetic(event_name, "HL.ARG", 1)
+    assert p_rotate.call_count == 0
+    assert p_read.call_count == 0
+
+    assert len(st) == 3
+    for tr, tr_original in zip(st, original):
+        assert tr.id == tr_original.id
+        assert tr.stats.starttime == tr_original.stats.starttime
+        assert tr.stats.delta == tr_original.stats.delta
+        np.testing.assert_array_equal(tr.data, tr_original.data)
+
+    # Nothing to do for up to date stations.
+    assert not comm.waveforms.convert_synthetics(event_name, "HL.ARG",
+                                                 it.long_name)
+
+    # A different rotation requires the original synthetics again.
+    comm.project.domain.rotation_angle_in_degree = 0.2
+    rotate_data = rotations.rotate_data
+    with mock.patch("lasif.rotations.rotate_data") as p_rotate:
+        p_rotate.side_effect = \
+            lambda *args, **kwargs: rotate_data(*args, **kwargs)
+        comm.waveforms.get_waveforms_synthetic(event_name, "HL.ARG", 1)
+    assert p_rotate.call_count == 1
+    assert comm.waveforms.convert_synthetics(event_name, "HL.ARG",
+                                             it.long_name)
+
+
+def test_converting_synthetics_with_failures(comm, capsys):
+    """
+    Any exception only fails the conversion of a single station.
+    """
+    comm.iterations.create_new_iteration(
+        "1", "ses3d_4_1", comm.query.get_stations_for_all_events(), 8, 100)
+    event_name = "GCMT_event_TURKEY_Mag_5.1_2010-3-24-14-11"
+
+    convert = comm.waveforms.convert_synthetics
+
+    def convert_or_fail(event, station, long_iteration_name):
+        if station == "HL.ARG":
+            raise ValueError("Mixed formats.")
+        return convert(event, station, long_iteration_name)
+
+    capsys.readouterr()
+    with mock.patch("lasif.components.waveforms.WaveformsComponent."
+                    "convert_synthetics") as p:
+        p.side_effect = convert_or_fail
+        comm.actions.convert_synthetics("1", [event_name])
+    assert p.call_count == 2
+
+    out = capsys.readouterr()[0]
+    assert "station HL.ARG. Reason: Mixed formats." in out
+    assert "Converted 1 stations, 0 were already up to date, 1 failed." in \
+        out
+    store = comm.waveforms.get_synthetics_store(
+        event_name, comm.iterations.get("1").long_name)
+    assert store.get_stations() == ["HT.SIGR"]
+
+
 def test_waveform_cache_usage(comm):
     """
     Tests the automatic creation and usage of the waveform caches.
@@ -134,3 +214,44 @@ def test_waveform_cache_usage(comm):
     assert info["longitude"] is None
     assert info["elevation_in_m"] is None
     assert info["local_depth_in_m"] is None
+
+
+def test_waveform_cache_hash_settings(comm):
+    """
+    The hash settings of the project are used by the waveform caches.
+    """
+    from lasif.tools.cache_helpers.file_info_cache import get_file_hash
+
+    event_name = "GCMT_event_TURKEY_Mag_5.1_2010-3-24-14-11"
+    filename = os.path.join(comm.project.paths["data"], event_name, "raw",
+                            "HL.ARG..BHZ.mseed")
+    comm.project.config["misc_settings"]["waveform_hash_function"] = \
+        "adler32"
+    comm.project.config["misc_settings"]["waveform_hash_sample_size"] = 1000
+
+    cache = comm.waveforms.get_waveform_cache(event_name, "raw")
+    assert cache.hash_function == "adler32"
+    assert cache.hash_sample_size == 1000
+
+    def get_hash():
+        return cache.db_cursor.execute(
+            "SELECT crc32_hash FROM files WHERE filename LIKE ?",
+            ("%HL.ARG..BHZ.mseed",)).fetchone()[0]
+
+    sampled_hash = get_file_hash(filename, hash_function="adler32",
+                                 sample_size=1000)
+    assert sampled_hash != get_file_hash(filename, hash_function="adler32")
+    assert get_hash() == sampled_hash
+
+    # Changes in the middle of the file are not detected when sampling.
+    filesize = os.path.getsize(filename)
+    with open(filename, "r+b") as fh:
+        fh.seek(filesize // 2, 0)
+        fh.write(b"\x00" * 100)
+    mtime = os.path.getmtime(filename) + 10.0
+    os.utime(filename, (mtime, mtime))
+    with mock.patch("lasif.tools.cache_helpers.waveform_cache.WaveformCache"
+                    "._extract_index_values_waveform") as p:
+        cache.update()
+    assert p.call_count == 0
+    assert get_hash() == sampled_hash
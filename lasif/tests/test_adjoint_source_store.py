@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Test suite for the adjoint source store.
+
+:copyright:
+    Lion Krischer (krischer@geophysik.uni-muenchen.de), 2015
+:license:
+    GNU General Public License, Version 3
+    (http://www.gnu.org/copyleft/gpl.html)
+"""
+import multiprocessing
+import numpy as np
+import os
+import pickle
+
+from lasif.tools.adjoint_source_store import AdjointSourceStore
+
+
+def _get_adjoint_source(value):
+    return {"adjoint_source": np.linspace(0.0, value, 100),
+            "misfit_value": float(value),
+            "details": {"messages": ["Message %i" % value]}}
+
+
+def _read_misfits(args):
+    """
+    Helper function reading some misfit values from a store.
+    """
+    store, values = args
+    return [store["key_%i" % value]["misfit_value"] for value in values]
+
+
+def test_store_round_trip(tmpdir):
+    """
+    Adjoint sources are stored losslessly in a single file.
+    """
+    filename = os.path.join(str(tmpdir), "EVENT", "ITERATION.sqlite")
+    store = AdjointSourceStore(filename)
+    assert len(store) == 0
+    assert "a" not in store
+    assert store.get("a") is None
+
+    store["b"] = _get_adjoint_source(2)
+    store["a"] = _get_adjoint_source(1)
+    assert os.listdir(os.path.dirname(filename)) == ["ITERATION.sqlite"]
+
+    # A new instance reads the same values.
+    store = AdjointSourceStore(filename)
+    assert len(store) == 2
+    assert store.keys() == ["a", "b"]
+    assert "a" in store
+    value = store["a"]
+    expected = _get_adjoint_source(1)
+    np.testing.assert_array_equal(value["adjoint_source"],
+                                  expected["adjoint_source"])
+    assert value["adjoint_source"].dtype == np.float64
+    assert value["misfit_value"] == expected["misfit_value"]
+    assert value["details"] == expected["details"]
+
+    # Overwrite and delete.
+    store["a"] = _get_adjoint_source(3)
+    assert store["a"]["misfit_value"] == 3.0
+    assert store.get_misfit("a") == 3.0
+    del store["a"]
+    assert store.keys() == ["b"]
+    assert store.get_misfit("a") is None
+
+
+def test_store_misfit_values(tmpdir):
+    """
+    Misfit values can be stored without an adjoint source.
+    """
+    store = AdjointSourceStore(os.path.join(str(tmpdir), "store.sqlite"))
+    assert store.get_misfit("a") is None
+
+    store.set_misfit("a", 1.5)
+    assert store.get_misfit("a") == 1.5
+    assert "a" not in store
+    assert len(store) == 0
+
+    # Storing the adjoint source also stores the misfit.
+    store["b"] = _get_adjoint_source(2)
+    assert store.get_misfit("b") == 2.0
+
+
+def test_store_update(tmpdir):
+    """
+    Any number of adjoint sources and misfits can be stored at once.
+    """
+    store = AdjointSourceStore(os.path.join(str(tmpdir), "store.sqlite"))
+    store.update([("key_%i" % _i, _get_adjoint_source(_i))
+                  for _i in range(10)] +
+                 [("misfit", {"adjoint_source": None, "misfit_value": 2.5})])
+    assert len(store) == 10
+    assert store["key_3"]["misfit_value"] == 3.0
+    assert "misfit" not in store
+    assert store.get_misfit("misfit") == 2.5
+
+
+def test_store_with_multiple_processes(tmpdir):
+    """
+    Any number of processes can read from the same store at the same time.
+    """
+    store = AdjointSourceStore(os.path.join(str(tmpdir), "store.sqlite"))
+    store.update([("key_%i" % _i, _get_adjoint_source(_i))
+                  for _i in range(100)])
+
+    # Stores can be pickled but the connection is not.
+    assert pickle.loads(pickle.dumps(store)).filename == store.filename
+
+    pool = multiprocessing.Pool(4)
+    try:
+        misfits = pool.map(_read_misfits,
+                           [(store, range(_i, 100, 4)) for _i in range(4)])
+    finally:
+        pool.close()
+        pool.join()
+
+    assert sorted(sum(misfits, [])) == [float(_i) for _i in range(100)]
@@ -12,6 +12,7 @@ Test cases for everything related to the adjoint source calculations.
 import inspect
 import numpy as np
 import os
+import pytest
 
 import obspy
 from scipy.io import loadmat
@@ -112,6 +113,57 @@ def test_time_frequency_transform():
     np.testing.assert_allclose(np.angle(tfs), np.angle(tfs_matlab))
 
 
+def test_time_frequency_fft():
+    """
+    The FFT helper of the time frequency module must be identical to a
+    normal FFT for all lengths including those with large prime factors.
+    """
+    np.random.seed(12345)
+    # 1801 is prime and 1803 = 3 * 601.
+    for n in (451, 1801, 1803):
+        x = np.random.randn(3, n) + 1j * np.random.randn(3, n)
+        np.testing.assert_allclose(time_frequency._fft(x), np.fft.fft(x),
+                                   rtol=1E-9, atol=1E-9)
+        np.testing.assert_allclose(time_frequency._ifft(x), np.fft.ifft(x),
+                                   rtol=1E-9, atol=1E-9)
+        # Zero padding.
+        np.testing.assert_allclose(time_frequency._fft(x, n=2 * n - 1),
+                                   np.fft.fft(x, n=2 * n - 1),
+                                   rtol=1E-9, atol=1E-9)
+
+
+def test_time_frequency_cc_difference():
+    """
+    Tests the batched time frequency cross correlation against a window by
+    window computation.
+    """
+    t, u = utils.get_dispersed_wavetrain(dt=5.0)
+    _, u0 = utils.get_dispersed_wavetrain(
+        dt=5.0, a=3.91, b=0.87, c=0.8, body_wave_factor=0.015,
+        body_wave_freq_scale=1.0 / 2.2)
+    width = 10.0
+
+    tau, nu, tfs = time_frequency.time_frequency_cc_difference(
+        t, u, u0, width)
+
+    dt = t[1] - t[0]
+    cc_freqs = np.fft.fftfreq(len(tau), d=dt)
+    freqs = np.fft.fftfreq(len(t), d=dt)
+    threshold = np.abs(u).max() * 1E-2
+    expected = np.zeros((len(t), len(t)), dtype=np.complex128)
+    for k in xrange(len(t)):
+        w = utils.gaussian_window(t - tau[k], width)
+        if min(np.abs(w * u).max(), np.abs(w * u0).max()) < threshold:
+            continue
+        cc = np.fft.fft(utils.cross_correlation(w * u0, w * u))
+        expected[k] = np.interp(freqs, cc_freqs[np.argsort(cc_freqs)],
+                                cc[np.argsort(cc_freqs)])
+    expected *= dt / np.sqrt(2.0 * np.pi)
+
+    np.testing.assert_allclose(tfs, expected, rtol=1E-7,
+                               atol=np.abs(expected).max() * 1E-10)
+
+
 def test_adjoint_time_frequency_phase_misfit_source_plot(tmpdir):
     """
     Tests the plot for a time-frequency misfit adjoint source.
@@ -150,3 +202,21 @@ def test_time_frequency_adjoint_source():
         desired=adj_src_baseline,
         atol=1E-5 * abs(adj_src_baseline).max(),
         rtol=1E-5)
+
+
+def test_time_frequency_misfit_only():
+    """
+    Only calculating the misfit results in the same misfit but no adjoint
+    source.
+    """
+    obs, syn = obspy.read(os.path.join(data_dir, "adj_src_test.mseed")).traces
+    ret_val = ad_src_tf_phase_misfit.adsrc_tf_phase_misfit(
+        obs.times(), obs.data, syn.data, 20.0, 100.0, compute="misfit")
+
+    assert round(ret_val["misfit_value"], 4) == 0.7147
+    assert ret_val["adjoint_source"] is None
+    assert not ret_val["details"]["messages"]
+
+    with pytest.raises(ValueError):
+        ad_src_tf_phase_misfit.adsrc_tf_phase_misfit(
+            obs.times(), obs.data, syn.data, 20.0, 100.0, compute="other")
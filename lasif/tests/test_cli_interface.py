@@ -275,12 +275,17 @@ def test_plotting_functions(cli):
     # Misc plotting functionality.
     with mock.patch(vs + "plot_raydensity") as patch:
         cli.run("lasif plot_raydensity")
-    patch.assert_called_once_with(plot_stations=False)
+    patch.assert_called_once_with(plot_stations=False, processes=None)
     assert patch.call_count == 1
 
     with mock.patch(vs + "plot_raydensity") as patch:
         cli.run("lasif plot_raydensity --plot_stations")
-    patch.assert_called_once_with(plot_stations=True)
+    patch.assert_called_once_with(plot_stations=True, processes=None)
+    assert patch.call_count == 1
+
+    with mock.patch(vs + "plot_raydensity") as patch:
+        cli.run("lasif plot_raydensity --processes=2")
+    patch.assert_called_once_with(plot_stations=False, processes=2)
     assert patch.call_count == 1
 
 
@@ -492,7 +497,8 @@ def test_calculate_all_adjoint_sources(cli):
                       "GCMT_event_TURKEY_Mag_5.1_2010-3-24-14-11")
     assert out.stderr == ""
     p.assert_called_once_with(
-        "1", "GCMT_event_TURKEY_Mag_5.1_2010-3-24-14-11")
+        "1", "GCMT_event_TURKEY_Mag_5.1_2010-3-24-14-11", backend=None,
+        processes=None)
     assert p.call_count == 1
 
 
@@ -506,10 +512,39 @@ def test_finalize_adjoint_sources(cli):
                       "GCMT_event_TURKEY_Mag_5.1_2010-3-24-14-11")
     assert out.stderr == ""
     p.assert_called_once_with(
-        "1", "GCMT_event_TURKEY_Mag_5.1_2010-3-24-14-11")
+        "1", "GCMT_event_TURKEY_Mag_5.1_2010-3-24-14-11", backend=None,
+        processes=None)
     assert p.call_count == 1
 
 
+def test_convert_synthetics(cli):
+    """
+    Simple mock test.
+    """
+    ac = "lasif.components.actions.ActionsComponent."
+    cli.run("lasif create_new_iteration 1 8.0 100.0 SES3D_4_1")
+
+    with mock.patch(ac + "convert_synthetics") as p:
+        out = cli.run("lasif convert_synthetics 1")
+    assert out.stderr == ""
+    p.assert_called_once_with("1", None, backend=None, processes=None)
+
+    with mock.patch(ac + "convert_synthetics") as p:
+        out = cli.run("lasif convert_synthetics 1 "
+                      "GCMT_event_TURKEY_Mag_5.1_2010-3-24-14-11 "
+                      "--parallel_backend=multiprocessing --processes=2")
+    assert out.stderr == ""
+    p.assert_called_once_with(
+        "1", ["GCMT_event_TURKEY_Mag_5.1_2010-3-24-14-11"],
+        backend="multiprocessing", processes=2)
+
+    # Unknown events are an error.
+    with mock.patch(ac + "convert_synthetics") as p:
+        out = cli.run("lasif convert_synthetics 1 some_event")
+    assert "not part of iteration" in out.stdout
+    assert p.call_count == 0
+
+
 def test_launch_misfit_gui(cli):
     with mock.patch("lasif.misfit_gui.misfit_gui.launch") as patch:
         cli.run("lasif launch_misfit_gui")
@@ -549,7 +584,8 @@ def test_preprocessing_event_limiting_works(cli):
     with mock.patch(ac + "preprocess_data") as patch:
         cli.run("lasif preprocess_data 1")
     assert patch.call_count == 1
-    patch.assert_called_once_with("1", None)
+    patch.assert_called_once_with("1", None, backend=None, processes=None,
+                                  resume_from=None)
 
     # One specified event should result in one event.
     with mock.patch(ac + "preprocess_data") as patch:
@@ -557,7 +593,8 @@ def test_preprocessing_event_limiting_works(cli):
                 "GCMT_event_TURKEY_Mag_5.1_2010-3-24-14-11")
     assert patch.call_count == 1
     patch.assert_called_once_with(
-        "1", ["GCMT_event_TURKEY_Mag_5.1_2010-3-24-14-11"])
+        "1", ["GCMT_event_TURKEY_Mag_5.1_2010-3-24-14-11"], backend=None,
+        processes=None, resume_from=None)
 
     # Multiple result in multiple.
     with mock.patch(ac + "preprocess_data") as patch:
@@ -567,7 +604,23 @@ def test_preprocessing_event_limiting_works(cli):
     assert patch.call_count == 1
     patch.assert_called_once_with(
         "1", ["GCMT_event_TURKEY_Mag_5.1_2010-3-24-14-11",
-              "GCMT_event_TURKEY_Mag_5.9_2011-5-19-20-15"])
+              "GCMT_event_TURKEY_Mag_5.9_2011-5-19-20-15"], backend=None,
+        processes=None, resume_from=None)
+
+    # The parallel backend is passed on.
+    with mock.patch(ac + "preprocess_data") as patch:
+        cli.run("lasif preprocess_data 1 "
+                "--parallel_backend=multiprocessing --processes=4")
+    assert patch.call_count == 1
+    patch.assert_called_once_with("1", None, backend="multiprocessing",
+                                  processes=4, resume_from=None)
+
+    # As is the logfile to resume from.
+    with mock.patch(ac + "preprocess_data") as patch:
+        cli.run("lasif preprocess_data 1 --resume_from=previous.log")
+    assert patch.call_count == 1
+    patch.assert_called_once_with("1", None, backend=None, processes=None,
+                                  resume_from="previous.log")
 
     out = cli.run("lasif preprocess_data 1 blub wub").stdout
     assert "Event 'blub' not found." in out
@@ -615,8 +668,9 @@ def test_validate_data(cli):
 
     # Have the raypath check fail.
     with mock.patch('lasif.components.validator.ValidatorComponent'
-                    '.is_event_station_raypath_within_boundaries') as p:
-        p.return_value = False
+                    '.are_event_station_raypaths_within_boundaries') as p:
+        p.side_effect = lambda event_name, lats, lngs, **kwargs: \
+            np.zeros(len(lats), dtype=np.bool_)
         out = cli.run("lasif validate_data --full")
         assert "Some files failed the raypath in domain checks." in out.stdout
         # Created script that deletes the extraneous files.
@@ -12,6 +12,7 @@ Test suite for the domain definitions in LASIF.
 from __future__ import absolute_import
 
 import copy
+import numpy as np
 
 from lasif import domain
 from .testing_helpers import images_are_identical, reset_matplotlib
@@ -34,6 +35,60 @@ def test_global_domain_point_in_domain():
     assert d.point_in_domain(0, 180)
 
 
+def test_global_domain_points_in_domain():
+    """
+    Global domains contain every point.
+    """
+    d = domain.GlobalDomain()
+    mask = d.points_in_domain(longitudes=[0, 180, -180],
+                              latitudes=[0, 90, -90])
+    assert mask.dtype == np.bool_
+    assert mask.tolist() == [True, True, True]
+    assert d.points_in_domain(longitudes=np.zeros((2, 3)),
+                              latitudes=np.zeros((2, 3))).shape == (2, 3)
+
+
+def test_spherical_section_points_in_domain():
+    """
+    Tests the vectorized point in domain checks against points known to be
+    inside, in the boundary, or outside of unrotated and rotated domains.
+    """
+    kwargs = {"min_latitude": -30, "max_latitude": 40, "min_longitude": -30,
+              "max_longitude": 60, "boundary_width_in_degree": 2.0}
+
+    # Without the boundaries, latitudes from -28 to 38 and longitudes from
+    # -28 to 58 are inside.
+    d = domain.RectangularSphericalSection(**kwargs)
+    lats = [0.0, 37.9, -27.9, 39.0, -29.0, 0.0, 0.0, 0.0, 50.0]
+    lngs = [0.0, 57.9, -27.9, 0.0, 0.0, 59.0, -29.0, 100.0, 0.0]
+    expected = [True, True, True, False, False, False, False, False, False]
+    mask = d.points_in_domain(longitudes=lngs, latitudes=lats)
+    assert mask.dtype == np.bool_
+    assert mask.tolist() == expected
+    # The shape of the coordinates is retained.
+    assert d.points_in_domain(
+        longitudes=np.array(lngs[:8]).reshape((2, 4)),
+        latitudes=np.array(lats[:8]).reshape((2, 4))).tolist() == \
+        [expected[:4], expected[4:8]]
+
+    # Rotating around the z-axis shifts the longitudes. Longitudes from 2 to
+    # 88 are now inside.
+    d = domain.RectangularSphericalSection(
+        rotation_axis=[0, 0, 1], rotation_angle_in_degree=30.0, **kwargs)
+    lats = [0.0, 0.0, 37.0, 0.0, 0.0, 39.0, 0.0]
+    lngs = [31.0, 87.0, 45.0, 0.0, 89.0, 45.0, -150.0]
+    assert d.points_in_domain(longitudes=lngs, latitudes=lats).tolist() == \
+        [True, True, True, False, False, False, False]
+
+    # Longitudes from 122 to 208 across the date line.
+    d = domain.RectangularSphericalSection(
+        rotation_axis=[0, 0, 1], rotation_angle_in_degree=150.0, **kwargs)
+    lats = [0.0, 10.0, 0.0, 0.0, 0.0]
+    lngs = [-170.0, 150.0, 125.0, -140.0, 0.0]
+    assert d.points_in_domain(longitudes=lngs, latitudes=lats).tolist() == \
+        [True, True, True, False, False]
+
+
 def test_plotting_global_domain(tmpdir):
     """
     Tests the plotting of a global domain.
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Test suite for the great circle binner.
+
+:copyright:
+    Lion Krischer (krischer@geophysik.uni-muenchen.de), 2015
+:license:
+    GNU General Public License, Version 3
+    (http://www.gnu.org/copyleft/gpl.html)
+"""
+import numpy as np
+
+from lasif.tools import great_circle_binner
+from lasif.tools.great_circle_binner import GreatCircleBinner
+from lasif.utils import Point
+
+
+def test_adding_points():
+    """
+    Points are binned to the closest bin and points outside are skipped.
+    """
+    binner = GreatCircleBinner(0, 10, 11, 0, 20, 21)
+    assert binner.bins.shape == (21, 11)
+
+    binner.add_point(Point(5.0, 10.0))
+    binner.add_points([5.0, 5.2, 4.6, 0.0, 10.0, -0.1, 5.0],
+                      [10.0, 9.8, 10.4, 0.0, 20.0, 5.0, 20.1])
+    assert binner.bins.sum() == 6
+    assert binner.bins[10, 5] == 4
+    assert binner.bins[0, 0] == 1
+    assert binner.bins[20, 10] == 1
+    assert binner.bins.dtype == np.uint32
+
+
+def test_adding_greatcircles(monkeypatch):
+    """
+    Adding many great circles at once is identical to adding them one after
+    the other, independent of the chunk size.
+    """
+    np.random.seed(12345)
+    lats_1 = np.random.uniform(-10, 50, 50)
+    lngs_1 = np.random.uniform(-20, 80, 50)
+    lats_2 = np.random.uniform(-10, 50, 50)
+    lngs_2 = np.random.uniform(-20, 80, 50)
+
+    single = GreatCircleBinner(0, 40, 100, 0, 60, 150)
+    for lat_1, lng_1, lat_2, lng_2 in zip(lats_1, lngs_1, lats_2, lngs_2):
+        single.add_greatcircle(Point(lat_1, lng_1), Point(lat_2, lng_2),
+                               max_npts=500)
+    assert single.bins.sum() > 0
+
+    for chunk_npts in (100, 10000, 10 ** 7):
+        monkeypatch.setattr(great_circle_binner, "CHUNK_NPTS", chunk_npts)
+        multiple = GreatCircleBinner(0, 40, 100, 0, 60, 150)
+        multiple.add_greatcircles(lats_1, lngs_1, lats_2, lngs_2,
+                                  max_npts=500)
+        np.testing.assert_array_equal(single.bins, multiple.bins)
+
+
+def test_adding_greatcircles_in_parallel(monkeypatch):
+    """
+    The parallel backends result in the same bins as the serial one and
+    report the progress.
+    """
+    monkeypatch.setattr(great_circle_binner, "CHUNK_NPTS", 5000)
+    np.random.seed(12345)
+    coordinates = np.random.uniform(-10, 50, (4, 100))
+
+    serial = GreatCircleBinner(0, 40, 100, 0, 60, 150)
+    serial.add_greatcircles(*coordinates, max_npts=500)
+
+    progress = []
+    parallel = GreatCircleBinner(0, 40, 100, 0, 60, 150)
+    parallel.add_greatcircles(
+        *coordinates, max_npts=500, backend="multiprocessing", processes=2,
+        progress_callback=lambda done, total: progress.append((done, total)))
+    np.testing.assert_array_equal(serial.bins, parallel.bins)
+
+    # 10 great circles per chunk.
+    assert len(progress) == 10
+    assert [_i[0] for _i in progress] == range(10, 101, 10)
+    assert set(_i[1] for _i in progress) == set([100])
+
+
+def test_calculate_raydensity():
+    """
+    Tests the headless ray density calculation for a rotated domain.
+    """
+    from lasif.domain import RectangularSphericalSection
+    from lasif import rotations
+
+    domain = RectangularSphericalSection(
+        min_latitude=-20, max_latitude=20, min_longitude=-20,
+        max_longitude=20, min_depth_in_km=0, max_depth_in_km=100,
+        rotation_axis=[0, 0, 1], rotation_angle_in_degree=30,
+        boundary_width_in_degree=2)
+    event = {"latitude": 0.0, "longitude": 20.0}
+    stations = {"A.A": {"latitude": 10.0, "longitude": 40.0},
+                "B.B": {"latitude": -10.0, "longitude": 30.0}}
+
+    binner = great_circle_binner.calculate_raydensity(
+        [(event, stations), (event, {})], domain, lat_lng_count=101,
+        backend="serial")
+    assert binner.bins.shape == (101, 101)
+
+    # Identical to binning the great circles in the unrotated domain.
+    expected = GreatCircleBinner(-20, 20, 101, -20, 20, 101)
+    lats, lngs = rotations.rotate_lat_lon_array(
+        [0.0, 0.0, 10.0, -10.0], [20.0, 20.0, 40.0, 30.0], [0, 0, 1], -30)
+    expected.add_greatcircles(lats[:2], lngs[:2], lats[2:], lngs[2:])
+    assert expected.bins.sum() > 0
+    np.testing.assert_array_equal(binner.bins, expected.bins)
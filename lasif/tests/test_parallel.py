@@ -9,10 +9,14 @@ Test suite for the parallel helper methods.
     GNU Lesser General Public License, Version 3
     (http://www.gnu.org/copyleft/lesser.html)
 """
+import mock
 import os
+import pytest
+import threading
 import warnings
 
-from lasif.tools.parallel_helpers import function_info, distribute_across_ranks
+from lasif.tools.parallel_helpers import function_info, \
+    distribute_across_ranks, get_backend, imap_unordered, mpi_imap_unordered
 
 
 def test_function_info_decorator():
@@ -108,7 +112,8 @@ def __random_fct(a, b, c=0):
     return a / b
 
 
-def test_distribute_across_ranks(tmpdir):
+@pytest.mark.parametrize("backend", ["auto", "serial", "multiprocessing"])
+def test_distribute_across_ranks(tmpdir, backend):
     """
     Test the distribute across ranks method at least a bit. This test
     naturally only runs without MPI.
@@ -124,7 +129,8 @@ def test_distribute_across_ranks(tmpdir):
 
     results = distribute_across_ranks(
         function=__random_fct, items=list(input_generator()),
-        get_name=lambda x: str(x), logfile=logfile)
+        get_name=lambda x: str(x), logfile=logfile, backend=backend,
+        processes=2)
 
     assert os.path.exists(logfile)
 
@@ -153,3 +159,201 @@ def test_distribute_across_ranks(tmpdir):
     assert results[2].warnings == []
     assert results[2].exception is None
     assert results[2].traceback is None
+
+
+def test_distribute_across_ranks_backends_produce_same_logfile(tmpdir):
+    """
+    The multiprocessing backend must result in the same logfile as the
+    serial one, apart from the order of the items and the tracebacks.
+    """
+    items = [{"a": _i, "b": _i % 4} for _i in range(50)]
+
+    logs = []
+    for backend in ("serial", "multiprocessing"):
+        logfile = os.path.join(str(tmpdir), "%s.txt" % backend)
+        results = distribute_across_ranks(
+            function=__random_fct, items=items, get_name=lambda x: str(x),
+            logfile=logfile, backend=backend, processes=3)
+        assert len(results) == 50
+        assert sorted(_i["a"] for _i in (_j.func_args for _j in results)) == \
+            list(range(50))
+        with open(logfile, "rt") as fh:
+            logs.append(sorted(_i.strip().splitlines()[0] for _i in
+                               fh.read().split("============")[1:]))
+    assert logs[0] == logs[1]
+
+
+def test_distribute_across_ranks_streaming_and_resuming(tmpdir):
+    """
+    Streaming does not keep the results. Resuming only processes the items
+    that failed or are missing in the previous logfile.
+    """
+    items = [{"a": _i, "b": _i % 4} for _i in range(20)]
+    logfile = os.path.join(str(tmpdir), "log.txt")
+
+    results = distribute_across_ranks(
+        function=__random_fct, items=items, get_name=lambda x: str(x),
+        logfile=logfile, stream=True)
+    assert results is None
+    with open(logfile, "rt") as fh:
+        log = fh.read()
+    assert log.count("============") == 20
+    assert log.count(" - SUCCESS") == 15
+
+    # Cut off the logfile in the middle of the last entry as would happen
+    # if a run dies.
+    with open(logfile, "wt") as fh:
+        fh.write(log[:-5])
+
+    results = distribute_across_ranks(
+        function=__random_fct, items=items, get_name=lambda x: str(x),
+        logfile=logfile, resume_from=logfile)
+    # The five failed items and the cut off one are processed again.
+    assert len(results) == 6
+    with open(logfile, "rt") as fh:
+        assert fh.read().count("============") == 20
+
+
+def test_get_backend():
+    """
+    Tests the selection of the parallel backend.
+    """
+    # Not launched with MPI.
+    assert get_backend() == "serial"
+    assert get_backend(None) == "serial"
+    assert get_backend("auto") == "serial"
+    assert get_backend("multiprocessing") == "multiprocessing"
+    assert get_backend("mpi") == "mpi"
+
+    with pytest.raises(ValueError):
+        get_backend("threads")
+
+
+def test_mpi_imap_unordered():
+    """
+    Without MPI all items are processed serially on rank 0.
+    """
+    results = list(mpi_imap_unordered(lambda x: x ** 2, range(20)))
+    assert sorted(results) == [_i ** 2 for _i in range(20)]
+
+    assert list(mpi_imap_unordered(lambda x: x, [])) == []
+
+
+class _FakeMPI(object):
+    """
+    Minimal stand-in for mpi4py's MPI module. Each thread is one rank.
+    """
+    ANY_SOURCE = -1
+
+    class Status(object):
+        def Get_source(self):
+            return self.source
+
+    class Comm(object):
+        def __init__(self, world, rank):
+            self.world = world
+            self.rank = rank
+            self.size = len(world.inboxes)
+
+        def send(self, obj, dest, tag):
+            with self.world.condition:
+                self.world.inboxes[dest].append((self.rank, tag, obj))
+                self.world.condition.notify_all()
+
+        def _find(self, source, tag):
+            for message in self.world.inboxes[self.rank]:
+                if source in (message[0], _FakeMPI.ANY_SOURCE) and \
+                        message[1] == tag:
+                    return message
+
+        def Iprobe(self, source, tag):
+            with self.world.condition:
+                return self._find(source, tag) is not None
+
+        def recv(self, source, tag, status=None):
+            with self.world.condition:
+                while self._find(source, tag) is None:
+                    self.world.condition.wait(0.1)
+                message = self._find(source, tag)
+                self.world.inboxes[self.rank].remove(message)
+            if status is not None:
+                status.source = message[0]
+            return message[2]
+
+    def __init__(self, size):
+        self.inboxes = [[] for _ in range(size)]
+        self.condition = threading.Condition()
+        self.local = threading.local()
+
+    @property
+    def COMM_WORLD(self):
+        return self.local.comm
+
+
+def _run_fake_mpi(size, function, items):
+    """
+    Runs mpi_imap_unordered() on the given number of fake ranks and returns
+    the results and the exception of each rank.
+    """
+    fake_mpi = _FakeMPI(size)
+    outcomes = [None] * size
+
+    def run(rank):
+        fake_mpi.local.comm = _FakeMPI.Comm(fake_mpi, rank)
+        try:
+            outcomes[rank] = (list(mpi_imap_unordered(function, items)),
+                              None)
+        except Exception as e:
+            outcomes[rank] = (None, e)
+
+    threads = [threading.Thread(target=run, args=(_i,))
+               for _i in range(size)]
+    with mock.patch("lasif.tools.parallel_helpers.MPI", fake_mpi):
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join(30)
+    assert not any(thread.is_alive() for thread in threads)
+    return outcomes
+
+
+@pytest.mark.parametrize("size", [2, 3, 5])
+def test_mpi_imap_unordered_with_multiple_ranks(size):
+    """
+    All items are processed exactly once and the results are only yielded
+    on rank 0.
+    """
+    outcomes = _run_fake_mpi(size, lambda x: x ** 2, range(50))
+    assert sorted(outcomes[0][0]) == [_i ** 2 for _i in range(50)]
+    assert outcomes[1:] == [([], None)] * (size - 1)
+
+
+@pytest.mark.parametrize("size", [2, 3, 5])
+@pytest.mark.parametrize("failing_item", [0, 17, 49])
+def test_mpi_imap_unordered_with_exceptions(size, failing_item, capsys):
+    """
+    An exception on any rank stops all ranks instead of having them wait
+    for each other forever. Rank 0 raises the original exception.
+    """
+    def function(item):
+        if item == failing_item:
+            raise ValueError("Item %i failed." % item)
+        return item
+
+    outcomes = _run_fake_mpi(size, function, range(50))
+    assert [_i[0] for _i in outcomes] == [None] * size
+    assert isinstance(outcomes[0][1], ValueError)
+    assert str(outcomes[0][1]) == "Item %i failed." % failing_item
+    for _, exception in outcomes[1:]:
+        assert isinstance(exception, (ValueError, RuntimeError))
+
+
+@pytest.mark.parametrize("backend", ["auto", "serial", "multiprocessing"])
+def test_imap_unordered(backend):
+    """
+    All backends call the function once for each item.
+    """
+    results = list(imap_unordered(lambda x: x ** 2, list(range(50)),
+                                  backend=backend, processes=3))
+    assert sorted(results) == [_i ** 2 for _i in range(50)]
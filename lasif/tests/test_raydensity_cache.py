@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Test suite for the cache of the binned raypaths.
+
+:copyright:
+    Lion Krischer (krischer@geophysik.uni-muenchen.de), 2015
+:license:
+    GNU General Public License, Version 3
+    (http://www.gnu.org/copyleft/gpl.html)
+"""
+import copy
+import mock
+import numpy as np
+import os
+import warnings
+
+from lasif.domain import RectangularSphericalSection
+from lasif.tools import great_circle_binner
+from lasif.tools.raydensity_cache import RaydensityCache
+
+
+def _get_station_events():
+    domain = RectangularSphericalSection(
+        min_latitude=-20, max_latitude=20, min_longitude=-20,
+        max_longitude=20, rotation_axis=[0, 0, 1],
+        rotation_angle_in_degree=30)
+    event_1 = {"event_name": "EVENT_1", "latitude": 0.0, "longitude": 20.0}
+    event_2 = {"event_name": "EVENT_2", "latitude": 5.0, "longitude": 45.0}
+    stations = {"A.A": {"latitude": 10.0, "longitude": 40.0},
+                "B.B": {"latitude": -10.0, "longitude": 30.0}}
+    return domain, [(event_1, stations), (event_2, copy.deepcopy(stations))]
+
+
+def _calculate(station_events, domain, cache):
+    return great_circle_binner.calculate_raydensity(
+        station_events, domain, lat_lng_count=101, backend="serial",
+        cache=cache).bins
+
+
+def test_raydensity_cache(tmpdir):
+    """
+    Only events that are not cached are binned and the results are
+    identical to not using a cache.
+    """
+    domain, station_events = _get_station_events()
+    folder = os.path.join(str(tmpdir), "RAYDENSITY")
+    expected = _calculate(station_events, domain, None)
+    assert expected.sum() > 0
+
+    # Only cache the first event.
+    np.testing.assert_array_equal(
+        _calculate(station_events[:1], domain, RaydensityCache(folder)),
+        _calculate(station_events[:1], domain, None))
+    assert os.listdir(folder) == ["EVENT_1"]
+    assert len(os.listdir(os.path.join(folder, "EVENT_1"))) == 1
+
+    # Only the second event is binned now.
+    original = great_circle_binner.GreatCircleBinner._get_histogram
+    with mock.patch("lasif.tools.great_circle_binner.GreatCircleBinner."
+                    "_get_histogram", autospec=True,
+                    side_effect=original) as p:
+        bins = _calculate(station_events, domain, RaydensityCache(folder))
+    np.testing.assert_array_equal(bins, expected)
+    assert p.call_count == 1
+    assert sorted(os.listdir(folder)) == ["EVENT_1", "EVENT_2"]
+
+    # Everything is cached.
+    with mock.patch("lasif.tools.great_circle_binner.GreatCircleBinner."
+                    "_get_histogram") as p:
+        bins = _calculate(station_events, domain, RaydensityCache(folder))
+    np.testing.assert_array_equal(bins, expected)
+    assert p.call_count == 0
+
+    # Changing the stations of an event invalidates it and the outdated
+    # histogram is removed.
+    del station_events[0][1]["B.B"]
+    expected = _calculate(station_events, domain, None)
+    with mock.patch("lasif.tools.great_circle_binner.GreatCircleBinner."
+                    "_get_histogram", autospec=True,
+                    side_effect=original) as p:
+        bins = _calculate(station_events, domain, RaydensityCache(folder))
+    np.testing.assert_array_equal(bins, expected)
+    assert p.call_count == 1
+    assert len(os.listdir(os.path.join(folder, "EVENT_1"))) == 1
+
+    # Nothing is written to a read-only cache.
+    station_events[0][1]["C.C"] = {"latitude": 0.0, "longitude": 0.0}
+    cache = RaydensityCache(folder, read_only=True)
+    filename = cache._get_filename(station_events[0][0],
+                                   station_events[0][1], domain, 101, 3000)
+    _calculate(station_events, domain, cache)
+    assert not os.path.exists(filename)
+    assert len(os.listdir(os.path.join(folder, "EVENT_1"))) == 1
+
+
+def test_failing_cache_writes_are_not_fatal(tmpdir):
+    """
+    The ray density is still calculated if the histograms cannot be
+    cached.
+    """
+    domain, station_events = _get_station_events()
+    expected = _calculate(station_events, domain, cache=None)
+
+    cache = RaydensityCache(str(tmpdir))
+    with mock.patch("lasif.tools.raydensity_cache.atomic_write") as p:
+        p.side_effect = IOError("No space left on device")
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter("always")
+            bins = _calculate(station_events, domain, cache=cache)
+    assert p.call_count == 2
+    w = [_i for _i in w if "ray density histogram" in str(_i.message)]
+    assert len(w) == 2
+    assert "No space left on device" in str(w[0].message)
+    np.testing.assert_array_equal(bins, expected)
+    assert not os.listdir(str(tmpdir))
+
+
+def test_raydensity_cache_keys():
+    """
+    The key changes with everything the binned raypaths depend on.
+    """
+    domain, station_events = _get_station_events()
+    event, stations = station_events[0]
+    cache = RaydensityCache("folder")
+
+    filename = cache._get_filename(event, stations, domain, 101, 3000)
+    assert os.path.dirname(filename) == os.path.join("folder", "EVENT_1")
+    assert filename.endswith(".npz")
+    assert filename == cache._get_filename(
+        copy.deepcopy(event), copy.deepcopy(stations), domain, 101, 3000)
+
+    moved_event = dict(event, latitude=1.0)
+    moved_stations = copy.deepcopy(stations)
+    moved_stations["A.A"]["longitude"] = 41.0
+    rotated_domain = copy.deepcopy(domain)
+    rotated_domain.rotation_angle_in_degree = 20
+    others = [
+        cache._get_filename(moved_event, stations, domain, 101, 3000),
+        cache._get_filename(event, moved_stations, domain, 101, 3000),
+        cache._get_filename(event, station_events[1][1], rotated_domain, 101,
+                            3000),
+        cache._get_filename(event, stations, domain, 201, 3000),
+        cache._get_filename(event, stations, domain, 101, 2000)]
+    assert len(set(others + [filename])) == 6
+
+    assert RaydensityCache(None)._get_filename(
+        event, stations, domain, 101, 3000) is None
@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Test suite for the response spectra cache.
+
+:copyright:
+    Lion Krischer (krischer@geophysik.uni-muenchen.de), 2015
+:license:
+    GNU General Public License, Version 3
+    (http://www.gnu.org/copyleft/gpl.html)
+"""
+import inspect
+import mock
+import numpy as np
+import obspy
+from obspy.io.xseed import Parser
+import os
+import shutil
+import warnings
+
+from lasif.tools import response_cache
+from lasif.tools.response_cache import ResponseCache
+
+data_dir = os.path.join(os.path.dirname(os.path.abspath(
+    inspect.getfile(inspect.currentframe()))), "data")
+
+
+def _get_station_file(tmpdir):
+    """
+    Copies the StationXML test file to a folder the file format can be
+    determined from.
+    """
+    folder = os.path.join(str(tmpdir), "STATIONS", "StationXML")
+    os.makedirs(folder)
+    filename = os.path.join(folder, "IRIS_single_channel_with_response.xml")
+    shutil.copy(os.path.join(data_dir, "station_files", "stationxml",
+                             "IRIS_single_channel_with_response.xml"),
+                filename)
+    return filename
+
+
+def _get_trace(starttime, seed_id="IU.ANMO.10.BHZ"):
+    """
+    Tapered sine with a period of 20 seconds at a sampling rate of 2 Hz.
+    """
+    data = np.sin(np.arange(1000) * 2.0 * np.pi / 40.0) * np.hanning(1000)
+    tr = obspy.Trace(data=data)
+    tr.stats.network, tr.stats.station, tr.stats.location, \
+        tr.stats.channel = seed_id.split(".")
+    tr.stats.delta = 0.5
+    tr.stats.starttime = starttime
+    return tr
+
+
+def test_response_removal_matches_obspy(tmpdir):
+    """
+    The cached correction must result in the same data as ObsPy's
+    instrument correction.
+    """
+    station_file = _get_station_file(tmpdir)
+    pre_filt = (0.005, 0.01, 0.1, 0.2)
+
+    tr = _get_trace(obspy.UTCDateTime(2012, 3, 14))
+    expected = tr.copy()
+    expected.attach_response(obspy.read_inventory(station_file))
+    expected.remove_response(output="VEL", pre_filt=pre_filt,
+                             zero_mean=False, taper=False)
+
+    cache = ResponseCache(os.path.join(str(tmpdir), "RESPONSES"))
+    cache.remove_response(tr, station_file, pre_filt=pre_filt,
+                          output_units="VEL", water_level=60.0)
+
+    # The spectra are stored in single precision.
+    np.testing.assert_allclose(tr.data, expected.data, rtol=1E-5,
+                               atol=1E-5 * np.abs(expected.data).max())
+
+
+def _assert_matches_obspy_simulate(tmpdir, file_format, filename, seed_id,
+                                   starttime):
+    """
+    Compares the cached correction with ObsPy's evalresp based instrument
+    correction for the given SEED or RESP file.
+    """
+    folder = os.path.join(str(tmpdir), "STATIONS", file_format)
+    os.makedirs(folder)
+    station_file = os.path.join(folder, os.path.basename(filename))
+    shutil.copy(filename, station_file)
+    pre_filt = (0.005, 0.01, 0.1, 0.2)
+
+    tr = _get_trace(starttime, seed_id=seed_id)
+    expected = tr.copy()
+    if file_format == "SEED":
+        seedresp_file = Parser(station_file)
+    else:
+        seedresp_file = station_file
+    # Same pre-filter taper as Trace.remove_response() and no detrending.
+    expected.simulate(seedresp={"filename": seedresp_file, "units": "VEL",
+                                "date": starttime},
+                      pre_filt=pre_filt, water_level=60.0, zero_mean=False,
+                      taper=False, sacsim=True, pitsasim=False)
+
+    cache = ResponseCache(os.path.join(str(tmpdir), "RESPONSES"))
+    cache.remove_response(tr, station_file, pre_filt=pre_filt,
+                          output_units="VEL", water_level=60.0)
+
+    # The spectra are stored in single precision.
+    np.testing.assert_allclose(tr.data, expected.data, rtol=1E-5,
+                               atol=1E-5 * np.abs(expected.data).max())
+
+
+def test_response_removal_matches_obspy_for_seed_files(tmpdir):
+    """
+    Tests the correction with a dataless SEED file against ObsPy.
+    """
+    _assert_matches_obspy_simulate(
+        tmpdir, "SEED",
+        os.path.join(data_dir, "station_files", "seed", "dataless.IU_PAB"),
+        "IU.PAB.00.BHE", obspy.UTCDateTime(2005, 1, 1))
+
+
+def test_response_removal_matches_obspy_for_resp_files(tmpdir):
+    """
+    Tests the correction with a RESP file against ObsPy.
+    """
+    _assert_matches_obspy_simulate(
+        tmpdir, "RESP",
+        os.path.join(data_dir, "station_files", "resp", "RESP.G.FDF.00.BHZ"),
+        "G.FDF.00.BHZ", obspy.UTCDateTime(2012, 3, 14))
+
+
+def test_spectra_are_cached_per_channel_epoch(tmpdir):
+    """
+    Traces recorded during the same channel epoch share the same spectrum.
+    """
+    station_file = _get_station_file(tmpdir)
+    folder = os.path.join(str(tmpdir), "RESPONSES")
+    kwargs = {"station_file": station_file,
+              "pre_filt": (0.005, 0.01, 0.1, 0.2), "output_units": "VEL",
+              "water_level": 60.0}
+
+    tr = _get_trace(obspy.UTCDateTime(2012, 3, 14))
+    ResponseCache(folder).remove_response(tr, **kwargs)
+    assert len(os.listdir(os.path.join(folder, "IU.ANMO.10.BHZ"))) == 1
+
+    # A later event and a new instance use the cached spectrum.
+    tr_2 = _get_trace(obspy.UTCDateTime(2012, 6, 1))
+    with mock.patch("lasif.tools.response_cache.calculate_spectrum") as p:
+        ResponseCache(folder).remove_response(tr_2, **kwargs)
+    assert p.call_count == 0
+    np.testing.assert_allclose(tr_2.data, tr.data)
+
+    # Different processing parameters require a new spectrum.
+    tr_3 = _get_trace(obspy.UTCDateTime(2012, 3, 14))
+    tr_3.stats.delta = 0.25
+    ResponseCache(folder).remove_response(tr_3, **kwargs)
+    assert len(os.listdir(os.path.join(folder, "IU.ANMO.10.BHZ"))) == 2
+
+    # Nothing is written to a read-only cache.
+    tr_4 = _get_trace(obspy.UTCDateTime(2012, 3, 14))
+    tr_4.stats.delta = 0.1
+    ResponseCache(folder, read_only=True).remove_response(tr_4, **kwargs)
+    assert len(os.listdir(os.path.join(folder, "IU.ANMO.10.BHZ"))) == 2
+
+
+def test_failing_cache_writes_are_not_fatal(tmpdir):
+    """
+    The response is still removed if the spectrum cannot be cached.
+    """
+    station_file = _get_station_file(tmpdir)
+    kwargs = {"station_file": station_file,
+              "pre_filt": (0.005, 0.01, 0.1, 0.2), "output_units": "VEL",
+              "water_level": 60.0}
+    expected = _get_trace(obspy.UTCDateTime(2012, 3, 14))
+    ResponseCache(None).remove_response(expected, **kwargs)
+
+    tr = _get_trace(obspy.UTCDateTime(2012, 3, 14))
+    with mock.patch("lasif.tools.response_cache.atomic_write") as p:
+        p.side_effect = IOError("No space left on device")
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter("always")
+            ResponseCache(os.path.join(str(tmpdir), "RESPONSES")) \
+                .remove_response(tr, **kwargs)
+    assert p.call_count == 1
+    assert len(w) == 1
+    assert "No space left on device" in str(w[0].message)
+    np.testing.assert_allclose(tr.data, expected.data)
+
+
+def test_get_channel_epoch(tmpdir):
+    """
+    Tests the determination of the channel epochs.
+    """
+    station_file = _get_station_file(tmpdir)
+    start, end = response_cache.get_channel_epoch(
+        "IU.ANMO.10.BHZ", obspy.UTCDateTime(2012, 3, 14), station_file)
+    inv = obspy.read_inventory(station_file)
+    channel = inv[0][0][0]
+    assert start == channel.start_date.timestamp
+    assert end == (channel.end_date.timestamp if channel.end_date else None)
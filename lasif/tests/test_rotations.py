@@ -248,6 +248,153 @@ def test_RotateData():
                                          5)
 
 
+def test_GetSphericalUnitVectorsArray():
+    """
+    The vectorized unit vectors are identical to the ones of single points.
+    """
+    lats = np.linspace(-90.0, 90.0, 7)
+    lons = np.linspace(-180.0, 180.0, 7)
+    bases = rotations.get_spherical_unit_vectors_array(lats, lons)
+    assert bases.shape == (7, 3, 3)
+    for lat, lon, basis in zip(lats, lons, bases):
+        np.testing.assert_array_almost_equal(
+            basis, rotations.get_spherical_unit_vectors(lat, lon))
+
+
+def _rotate_lat_lon_reference(lat, lon, rotation_axis, angle):
+    """
+    Rotates a single point by rotating its position vector.
+    """
+    xyz = rotations.rotate_vector(
+        rotations.lat_lon_radius_to_xyz(lat, lon, 1.0), rotation_axis, angle)
+    return rotations.xyz_to_lat_lon_radius(xyz)[:2]
+
+
+def _assert_longitudes_almost_equal(actual, desired, decimal):
+    """
+    Compares longitudes regardless of their branch cut.
+    """
+    diff = (np.asarray(actual) - np.asarray(desired) + 180.0) % 360.0 - 180.0
+    np.testing.assert_array_almost_equal(diff, np.zeros_like(diff), decimal)
+
+
+def test_RotateLatLonArray():
+    """
+    Test the vectorized lat/lon rotation on a sphere.
+    """
+    # Rotations around the rotation axis of the earth only shift the
+    # longitudes.
+    new_lats, new_lons = rotations.rotate_lat_lon_array(
+        [0.0, 10.0, -30.0, 45.0], [0.0, 20.0, -90.0, 100.0], [0, 0, 1], 90)
+    assert new_lats.shape == (4,)
+    assert new_lons.shape == (4,)
+    np.testing.assert_array_almost_equal(new_lats, [0.0, 10.0, -30.0, 45.0])
+    _assert_longitudes_almost_equal(new_lons, [90.0, 110.0, 0.0, -170.0], 5)
+
+    # Rotate the north pole to the equator and move the points along the
+    # Greenwich meridian. Points on the rotation axis do not move.
+    new_lats, new_lons = rotations.rotate_lat_lon_array(
+        [90.0, 0.0, 45.0], [0.0, 90.0, 0.0], [0, 1, 0], 90)
+    np.testing.assert_array_almost_equal(new_lats, [0.0, 0.0, -45.0])
+    _assert_longitudes_almost_equal(new_lons, [0.0, 90.0, 0.0], 5)
+
+    # Rotate the north pole to the equator, the other way round.
+    new_lats, new_lons = rotations.rotate_lat_lon_array(
+        [90.0], [0.0], [0, 1, 0], -90)
+    np.testing.assert_array_almost_equal(new_lats, [0.0])
+    _assert_longitudes_almost_equal(new_lons, [180.0], 5)
+
+    # Arbitrary axes are compared to rotating the position vector of each
+    # point.
+    lats = np.linspace(-80.0, 80.0, 20)
+    lons = np.linspace(-170.0, 170.0, 20)
+    for axis, angle in (([0, 0, 1], 77.7), ([123, 345.0, 0.234], -55.66),
+                        ([1, 0, 0], 180.0), ([1, 2, 3], 44.0)):
+        new_lats, new_lons = rotations.rotate_lat_lon_array(
+            lats, lons, axis, angle)
+        expected = np.array([_rotate_lat_lon_reference(lat, lon, axis, angle)
+                             for lat, lon in zip(lats, lons)])
+        np.testing.assert_array_almost_equal(new_lats, expected[:, 0], 4)
+        _assert_longitudes_almost_equal(new_lons, expected[:, 1], 4)
+
+
+def test_RotateDataArray():
+    """
+    Test the rotations.rotate_data_array() function.
+    """
+    np.random.seed(12345)
+    north_data = np.random.randn(3, 50)
+    east_data = np.random.randn(3, 50)
+    vertical_data = np.random.randn(3, 50)
+
+    # A rotation around the rotation axis of the earth with sources at the
+    # equator does not change anything.
+    new_north_data, new_east_data, new_vertical_data = \
+        rotations.rotate_data_array(north_data, east_data, vertical_data,
+                                    [0.0, 0.0, 0.0], [123.45, -10.0, 50.0],
+                                    [0, 0, 1], 77.7)
+    assert new_north_data.shape == (3, 50)
+    assert new_east_data.shape == (3, 50)
+    assert new_vertical_data.shape == (3, 50)
+    np.testing.assert_array_almost_equal(new_north_data, north_data, 5)
+    np.testing.assert_array_almost_equal(new_east_data, east_data, 5)
+    np.testing.assert_array_almost_equal(new_vertical_data, vertical_data, 5)
+
+    # Data along the Greenwich meridian does not change with a rotation
+    # around the "East Pole".
+    new_north_data, new_east_data, new_vertical_data = \
+        rotations.rotate_data_array(north_data, east_data, vertical_data,
+                                    [0.0, 10.0, -20.0], [0.0, 0.0, 0.0],
+                                    [0, 1, 0], 55.0)
+    np.testing.assert_array_almost_equal(new_north_data, north_data, 5)
+    np.testing.assert_array_almost_equal(new_east_data, east_data, 5)
+    np.testing.assert_array_almost_equal(new_vertical_data, vertical_data, 5)
+
+    # A rotation of 180 degree around the x-axis inverts the north and east
+    # components of points on the 90 degree meridian.
+    new_north_data, new_east_data, new_vertical_data = \
+        rotations.rotate_data_array(north_data, east_data, vertical_data,
+                                    [0.0, 20.0, -30.0], [90.0, 90.0, 90.0],
+                                    [1, 0, 0], 180.0)
+    np.testing.assert_array_almost_equal(new_north_data, -north_data, 5)
+    np.testing.assert_array_almost_equal(new_east_data, -east_data, 5)
+    np.testing.assert_array_almost_equal(new_vertical_data, vertical_data, 5)
+
+    # Arbitrary rotations are compared to rotating the local unit vectors
+    # of each point and projecting them onto the ones at the new location.
+    north_data = np.random.randn(10, 50)
+    east_data = np.random.randn(10, 50)
+    vertical_data = np.random.randn(10, 50)
+    lats = np.linspace(-70.0, 70.0, 10)
+    lons = np.linspace(-160.0, 160.0, 10)
+    axis = [123, 345.0, 0.234]
+    new_north_data, new_east_data, new_vertical_data = \
+        rotations.rotate_data_array(north_data, east_data, vertical_data,
+                                    lats, lons, axis, 77.7)
+    for _i in range(10):
+        e_theta, e_phi, e_r = rotations.get_spherical_unit_vectors(
+            lats[_i], lons[_i])
+        new_lat, new_lon = _rotate_lat_lon_reference(lats[_i], lons[_i],
+                                                     axis, 77.7)
+        new_bases = rotations.get_spherical_unit_vectors(new_lat, new_lon)
+        new_bases = [-new_bases[0], new_bases[1], new_bases[2]]
+        rotated = [rotations.rotate_vector(_j, axis, 77.7).ravel()
+                   for _j in (-e_theta, e_phi, e_r)]
+        data = (north_data[_i], east_data[_i], vertical_data[_i])
+        expected = [sum(np.dot(_v, np.ravel(_b)) * _d
+                        for _v, _d in zip(rotated, data))
+                    for _b in new_bases]
+        np.testing.assert_array_almost_equal(new_north_data[_i],
+                                             expected[0], 4)
+        np.testing.assert_array_almost_equal(new_east_data[_i],
+                                             expected[1], 4)
+        np.testing.assert_array_almost_equal(new_vertical_data[_i],
+                                             expected[2], 4)
+        # The vertical component never changes.
+        np.testing.assert_array_almost_equal(new_vertical_data[_i],
+                                             vertical_data[_i], 5)
+
+
 def test_RotateMomentTensor():
     """
     Tests the moment tensor rotations.
@@ -212,3 +212,27 @@ def test_OtherComponentsAreNotInverted():
         3.39320707E-07, 3.44629825E-07, 3.50957549E-07, 3.57983453E-07,
         3.65361842E-07, 3.72732785E-07])
     np.testing.assert_almost_equal(tr_r.data[-10:], r_data)
+
+
+def test_reading_sample_range():
+    """
+    Only reading a range of samples results in the same data as slicing the
+    full trace.
+    """
+    filename = os.path.join(data_dir, "File_phi")
+    tr = read_SES3D(filename)[0]
+
+    tr_range = read_SES3D(filename, sample_range=(100, 250))[0]
+    assert tr_range.stats.npts == 150
+    assert tr_range.data.dtype == np.float32
+    np.testing.assert_array_equal(tr_range.data, tr.data[100:250])
+    np.testing.assert_almost_equal(
+        tr_range.stats.starttime - tr.stats.starttime, 100 * tr.stats.delta)
+
+    # Same semantics as Python slices.
+    with open(filename, "rb") as open_file:
+        file_object = StringIO(open_file.read())
+    tr_range = read_SES3D(file_object, sample_range=(-10, None))[0]
+    np.testing.assert_array_equal(tr_range.data, tr.data[-10:])
+    tr_range = read_SES3D(filename, sample_range=(3000, 5000))[0]
+    np.testing.assert_array_equal(tr_range.data, tr.data[3000:])
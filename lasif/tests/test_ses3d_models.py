@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Test cases for the SES3D model handling.
+
+:copyright:
+    Lion Krischer (krischer@geophysik.uni-muenchen.de), 2016
+:license:
+    GNU General Public License, Version 3
+    (http://www.gnu.org/copyleft/gpl.html)
+"""
+import math
+import numpy as np
+import os
+import pytest
+
+from lasif.ses3d_models import RawSES3DModelHandler
+
+
+# Elements per subdomain, subdomains per direction, and the lagrange
+# polynomial degree of the test model.
+ELEMENTS = (3, 2, 2)
+SUBDOMAINS = (2, 3, 2)
+LPD = 4
+
+
+def _write_boxfile(filename):
+    """
+    Writes a boxfile for the test model.
+    """
+    lines = ["header"] * 14
+    lines.append(str(SUBDOMAINS[0] * SUBDOMAINS[1] * SUBDOMAINS[2]))
+    lines.extend(str(_i) for _i in SUBDOMAINS)
+    lines.append("-" * 20)
+    # The physical extent of each subdomain.
+    extent = (math.radians(10.0), math.radians(10.0), 100000.0)
+    count = 0
+    for k in xrange(SUBDOMAINS[2]):
+        for j in xrange(SUBDOMAINS[1]):
+            for i in xrange(SUBDOMAINS[0]):
+                count += 1
+                lines.append(str(count))
+                lines.append("%i %i %i" % (i + 1, j + 1, k + 1))
+                # Neighbouring subdomains share the boundary index in the
+                # boxfiles.
+                for idx, n in zip((i, j, k), ELEMENTS):
+                    lines.append("%i %i" % (idx * (n - 1),
+                                            idx * (n - 1) + n - 1))
+                for idx, e in zip((i, j), extent[:2]):
+                    lines.append("%f %f" % (math.radians(40.0) + idx * e,
+                                            math.radians(40.0) +
+                                            (idx + 1) * e))
+                lines.append("%f %f" % (6371000.0 - (k + 1) * extent[2],
+                                        6371000.0 - k * extent[2]))
+                lines.append("-" * 20)
+    with open(filename, "wt") as fh:
+        fh.write("\n".join(lines))
+
+
+def _read_single_box_reference(filename):
+    """
+    Straightforward reading of a single box including the removal of the
+    duplicates.
+    """
+    lpd = LPD
+    shape = ELEMENTS + (lpd + 1,) * 3
+    with open(filename, "rb") as open_file:
+        field = np.ndarray(shape, buffer=open_file.read()[4:-4],
+                           dtype="float32", order="F")
+    new_shape = [_i * _j for _i, _j in zip(shape[:3], shape[3:])]
+    field = np.rollaxis(np.rollaxis(field, 3, 1), 3, lpd + 1)
+    field = field.reshape(new_shape, order="C")
+    for axis, count in enumerate(new_shape):
+        mask = np.ones(count, dtype="bool")
+        mask[::lpd + 1][1:] = False
+        field = field.compress(mask, axis=axis)
+    return field[:, :, ::-1]
+
+
+@pytest.fixture
+def model_dir(tmpdir):
+    """
+    Creates a SES3D model with random values.
+    """
+    np.random.seed(12345)
+    _write_boxfile(os.path.join(str(tmpdir), "boxfile"))
+    count = SUBDOMAINS[0] * SUBDOMAINS[1] * SUBDOMAINS[2]
+    size = np.prod(ELEMENTS) * (LPD + 1) ** 3
+    for component in ("lambda", "mu", "rhoinv", "B"):
+        for _i in xrange(count):
+            values = np.random.random(size).astype(np.float32) + 1.0
+            marker = np.array([size * 4], dtype=np.int32).tostring()
+            with open(os.path.join(str(tmpdir), "%s%i" % (component, _i)),
+                      "wb") as fh:
+                fh.write(marker)
+                fh.write(values.tostring())
+                fh.write(marker)
+    return str(tmpdir)
+
+
+def test_reading_model(model_dir):
+    """
+    Tests that the merged components are identical to the individually read
+    and merged subdomains.
+    """
+    handler = RawSES3DModelHandler(model_dir, domain=None)
+    assert handler.lagrange_polynomial_degree == LPD
+    assert sorted(handler.components.keys()) == \
+        ["B", "lambda", "mu", "rhoinv"]
+
+    handler.parse_component("mu")
+    data = handler.parsed_components["mu"]
+    assert data.dtype == np.float32
+    assert data.shape == tuple(
+        _i * _j * LPD + 1 for _i, _j in zip(ELEMENTS, SUBDOMAINS))
+
+    expected = np.empty_like(data)
+    for _i, domain in enumerate(handler.setup["subdomains"]):
+        x_min, y_min, z_min = [
+            LPD * domain["boundaries_%s" % _j][0] for _j in "xyz"]
+        box = _read_single_box_reference(
+            handler.components["mu"]["filenames"][_i])
+        expected[x_min: x_min + box.shape[0],
+                 y_min: y_min + box.shape[1],
+                 z_min: z_min + box.shape[2]] = box
+    np.testing.assert_array_equal(data, expected)
+
+    # Derived components.
+    handler.parse_component("vsh")
+    np.testing.assert_allclose(
+        handler.parsed_components["vsh"],
+        np.sqrt(handler.parsed_components["mu"] *
+                handler.parsed_components["rhoinv"]) / 1000.0)
+
+
+def test_get_slice(model_dir):
+    """
+    Slices read on demand must be identical to the slices of the parsed
+    components.
+    """
+    lazy = RawSES3DModelHandler(model_dir, domain=None)
+    handler = RawSES3DModelHandler(model_dir, domain=None)
+    for component in ("mu", "vp", "vsv"):
+        handler.parse_component(component)
+        data = handler.parsed_components[component]
+
+        for z_index in xrange(data.shape[2]):
+            np.testing.assert_array_equal(
+                lazy.get_slice(component, z_index=z_index),
+                data[:, :, z_index])
+        for x_index in (0, 5, data.shape[0] - 1):
+            for y_index in (0, 4, 8, data.shape[1] - 1):
+                np.testing.assert_array_equal(
+                    lazy.get_slice(component, x_index=x_index,
+                                   y_index=y_index),
+                    data[x_index, y_index, :])
+        np.testing.assert_array_equal(
+            lazy.get_slice(component, x_index=3, z_index=4),
+            data[3, :, 4])
+
+        # Negative indices count from the end.
+        np.testing.assert_array_equal(
+            lazy.get_slice(component, z_index=-1), data[:, :, -1])
+        np.testing.assert_array_equal(
+            lazy.get_slice(component, x_index=-2, y_index=-data.shape[1]),
+            data[-2, 0, :])
+
+        # Out of range indices raise for the parsed and the lazy path.
+        for model in (lazy, handler):
+            with pytest.raises(IndexError):
+                model.get_slice(component, z_index=data.shape[2])
+            with pytest.raises(IndexError):
+                model.get_slice(component, z_index=-data.shape[2] - 1)
+            with pytest.raises(IndexError):
+                model.get_slice(component, x_index=data.shape[0])
+
+    # Nothing has been parsed.
+    assert lazy.parsed_components == {}
+
+    with pytest.raises(ValueError):
+        lazy.get_slice("vs", z_index=0)
+
+
+def test_component_cache(model_dir, tmpdir):
+    """
+    Tests the on-disc cache of parsed and derived components.
+    """
+    cache_dir = os.path.join(str(tmpdir), "cache")
+    handler = RawSES3DModelHandler(model_dir, domain=None,
+                                   cache_directory=cache_dir)
+    handler.parse_component("vsv")
+    expected = handler.parsed_components["vsv"]
+    assert sorted(os.listdir(cache_dir)) == [
+        "B.json", "B.npy", "mu.json", "mu.npy", "rhoinv.json",
+        "rhoinv.npy", "vsv.json", "vsv.npy"]
+
+    # A new handler loads the component from the cache as a memory map.
+    handler = RawSES3DModelHandler(model_dir, domain=None,
+                                   cache_directory=cache_dir)
+    handler.parse_component("vsv")
+    assert isinstance(handler.parsed_components["vsv"], np.memmap)
+    assert handler.parsed_components["vsv"].dtype == np.float32
+    np.testing.assert_array_equal(handler.parsed_components["vsv"], expected)
+    # The real components have not been needed.
+    assert sorted(handler.parsed_components.keys()) == ["vsv"]
+
+    # Slices also use the cache.
+    handler = RawSES3DModelHandler(model_dir, domain=None,
+                                   cache_directory=cache_dir)
+    np.testing.assert_array_equal(handler.get_slice("vsv", z_index=3),
+                                  expected[:, :, 3])
+    assert sorted(handler.parsed_components.keys()) == ["vsv"]
+
+    # Changing any of the source files invalidates the cache.
+    filename = os.path.join(model_dir, "B3")
+    values = np.memmap(filename, dtype=np.float32, mode="r+", offset=4,
+                       shape=(np.prod(ELEMENTS) * (LPD + 1) ** 3,))
+    values *= 2.0
+    values.flush()
+    del values
+    os.utime(filename, (os.path.getatime(filename),
+                        os.path.getmtime(filename) + 10))
+
+    handler = RawSES3DModelHandler(model_dir, domain=None,
+                                   cache_directory=cache_dir)
+    handler.parse_component("vsv")
+    assert not isinstance(handler.parsed_components["vsv"], np.memmap)
+    assert not np.all(handler.parsed_components["vsv"] == expected)
+    assert isinstance(handler.parsed_components["mu"], np.memmap)
+    assert not isinstance(handler.parsed_components["B"], np.memmap)
+
+    reference = RawSES3DModelHandler(model_dir, domain=None)
+    reference.parse_component("vsv")
+    np.testing.assert_array_equal(handler.parsed_components["vsv"],
+                                  reference.parsed_components["vsv"])
+
+    # Read-only caches are not written.
+    cache_dir = os.path.join(str(tmpdir), "cache_2")
+    handler = RawSES3DModelHandler(model_dir, domain=None,
+                                   cache_directory=cache_dir,
+                                   read_only_cache=True)
+    handler.parse_component("rho")
+    assert not os.path.exists(cache_dir)
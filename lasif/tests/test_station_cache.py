@@ -12,6 +12,7 @@ things need to happen in order. Better then nothing.
     GNU General Public License, Version 3
     (http://www.gnu.org/copyleft/gpl.html)
 """
+import glob
 import inspect
 import itertools
 import os
@@ -375,3 +376,151 @@ def test_station_cache_readonly_mode(tmpdir):
                                  read_only=True)
     new = station_cache.get_values()
     assert original == new
+
+
+def test_parallel_indexing(tmpdir, monkeypatch, recwarn):
+    """
+    Indexing with a process pool must result in the same cache as indexing
+    in a single process.
+    """
+    from lasif.tools.cache_helpers import file_info_cache
+
+    # Most generic way to get the actual data directory.
+    data_dir = os.path.join(os.path.dirname(os.path.abspath(inspect.getfile(
+        inspect.currentframe()))), "data", "station_files")
+
+    values = []
+    # A huge threshold results in the files being indexed serially.
+    for name, threshold in (("serial", 10000), ("parallel", 0)):
+        directory = os.path.join(str(tmpdir), name)
+        cache_file = os.path.join(directory, "cache.sqlite")
+        seed_directory = os.path.join(directory, "SEED")
+        resp_directory = os.path.join(directory, "RESP")
+        stationxml_directory = os.path.join(directory, "StationXML")
+        os.makedirs(seed_directory)
+        os.makedirs(resp_directory)
+
+        shutil.copy(os.path.join(data_dir, "seed", "dataless.IU_PAB"),
+                    os.path.join(seed_directory, "dataless.IU_PAB"))
+        shutil.copy(os.path.join(data_dir, "seed", "dataless.BW_FURT"),
+                    os.path.join(seed_directory, "dataless.BW_FURT"))
+        for filename in glob.glob(os.path.join(data_dir, "resp", "RESP.*")):
+            shutil.copy(filename, resp_directory)
+        # Invalid file to make sure warnings are passed on.
+        shutil.copy(os.path.join(data_dir, "seed", "dataless.IU_PAB"),
+                    os.path.join(resp_directory, "RESP.iu_pab"))
+
+        # Pretend to have two CPUs so a pool is used for the parallel case.
+        monkeypatch.setattr(file_info_cache, "PARALLEL_INDEXING_THRESHOLD",
+                            threshold)
+        monkeypatch.setattr(file_info_cache.multiprocessing, "cpu_count",
+                            lambda: 2)
+        # Multiple small batches.
+        monkeypatch.setattr(file_info_cache, "BULK_INSERT_BATCH_SIZE", 2)
+
+        recwarn.clear()
+        station_cache = StationCache(cache_file, directory, seed_directory,
+                                     resp_directory, stationxml_directory,
+                                     read_only=False)
+        assert station_cache.file_count == 6
+        messages = [str(_w.message) for _w in recwarn.list]
+        assert len(messages) == 1
+        assert "Not a valid RESP file?" in messages[0]
+
+        values.append(sorted(
+            [(os.path.relpath(_i.pop("filename"), directory),
+              sorted(_i.items())) for _i in station_cache.get_values()]))
+
+    assert values[0] == values[1]
+
+
+def test_unchanged_files_are_not_indexed_again(tmpdir, monkeypatch):
+    """
+    Files with a new modification time but the same content must not be
+    indexed again and the new modification time must be stored.
+    """
+    # Most generic way to get the actual data directory.
+    data_dir = os.path.join(os.path.dirname(os.path.abspath(inspect.getfile(
+        inspect.currentframe()))), "data", "station_files")
+
+    directory = str(tmpdir)
+    cache_file = os.path.join(directory, "cache.sqlite")
+    seed_directory = os.path.join(directory, "SEED")
+    resp_directory = os.path.join(directory, "RESP")
+    stationxml_directory = os.path.join(directory, "StationXML")
+    os.makedirs(resp_directory)
+
+    resp_file = os.path.join(resp_directory, "RESP.G.FDF.00.BHE")
+    shutil.copy(os.path.join(data_dir, "resp", "RESP.G.FDF.00.BHE"),
+                resp_file)
+
+    extracted_files = []
+    original_fct = StationCache._extract_index_values_resp
+
+    def extract(filename):
+        extracted_files.append(filename)
+        return original_fct(filename)
+
+    monkeypatch.setattr(StationCache, "_extract_index_values_resp",
+                        staticmethod(extract))
+
+    def get_last_modified():
+        return station_cache.db_cursor.execute(
+            "SELECT last_modified FROM files").fetchall()
+
+    station_cache = StationCache(cache_file, directory, seed_directory,
+                                 resp_directory, stationxml_directory,
+                                 read_only=False)
+    assert extracted_files == [resp_file]
+    assert get_last_modified() == [(os.path.getmtime(resp_file),)]
+
+    # Only change the modification time.
+    mtime = os.path.getmtime(resp_file) + 10.0
+    os.utime(resp_file, (mtime, mtime))
+    assert get_last_modified() != [(os.path.getmtime(resp_file),)]
+
+    station_cache = StationCache(cache_file, directory, seed_directory,
+                                 resp_directory, stationxml_directory,
+                                 read_only=False)
+    assert extracted_files == [resp_file]
+    assert get_last_modified() == [(os.path.getmtime(resp_file),)]
+    assert len(station_cache.get_channels()) == 1
+
+
+def test_file_hashing(tmpdir):
+    """
+    Tests the streaming file hashing used by all caches.
+    """
+    from binascii import crc32
+    import zlib
+    from lasif.tools.cache_helpers.file_info_cache import get_file_hash
+
+    filename = os.path.join(str(tmpdir), "data")
+    data = os.urandom(10000)
+    with open(filename, "wb") as fh:
+        fh.write(data)
+
+    # Small buffer to force multiple reads.
+    buf = bytearray(333)
+    assert get_file_hash(filename, buf=buf) == crc32(data)
+    assert get_file_hash(filename) == crc32(data)
+    assert get_file_hash(filename, hash_function="adler32", buf=buf) == \
+        zlib.adler32(data)
+
+    # Sampled mode only takes the beginning, the end, and the size into
+    # account.
+    sampled_hash = get_file_hash(filename, sample_size=1000, buf=buf)
+    assert sampled_hash != crc32(data)
+    with open(filename, "r+b") as fh:
+        fh.seek(5000, 0)
+        fh.write(b"\x00" * 100)
+    assert get_file_hash(filename, sample_size=1000, buf=buf) == sampled_hash
+    assert get_file_hash(filename, buf=buf) != crc32(data)
+    with open(filename, "r+b") as fh:
+        fh.seek(9990, 0)
+        fh.write(b"\x00" * 10)
+    assert get_file_hash(filename, sample_size=1000, buf=buf) != sampled_hash
+
+    # Files smaller than twice the sample size are always fully hashed.
+    assert get_file_hash(filename, sample_size=5000) == \
+        get_file_hash(filename)
@@ -10,6 +10,7 @@ Test suite for some utility functions.
     (http://www.gnu.org/copyleft/gpl.html)
 """
 import inspect
+import mock
 import numpy as np
 from obspy import UTCDateTime
 from obspy.io.xseed import Parser
@@ -60,6 +61,32 @@ def test_channel_in_parser():
         parser_object, channel_id, endtime - 100, endtime) is True
 
 
+def test_read_station_file():
+    """
+    Station files are only parsed once per process unless they change.
+    """
+    filename = os.path.join(data_dir, "station_files", "seed",
+                            "dataless.IU_PAB")
+    utils._STATION_FILE_CACHE.clear()
+
+    parser = utils.read_station_file(filename)
+    assert isinstance(parser, Parser)
+    assert utils.read_station_file(filename) is parser
+    assert len(utils._STATION_FILE_CACHE) == 1
+
+    # A modified file is read again.
+    mtime = os.path.getmtime(filename)
+    with mock.patch("os.path.getmtime", return_value=mtime + 1):
+        assert utils.read_station_file(filename) is not parser
+    assert len(utils._STATION_FILE_CACHE) == 2
+
+    # The least recently used ones are dropped.
+    with mock.patch("lasif.utils.STATION_FILE_CACHE_SIZE", 1):
+        assert utils.read_station_file(filename) is parser
+    assert list(utils._STATION_FILE_CACHE.values()) == [parser]
+    utils._STATION_FILE_CACHE.clear()
+
+
 def test_greatcircle_points_generator():
     """
     Tests the greatcircle discrete point generator.
@@ -74,3 +101,81 @@ def test_greatcircle_points_generator():
     points = list(utils.greatcircle_points(
         utils.Point(0, 0), utils.Point(0, 90), max_npts=110))
     assert len(points) == 110
+
+
+def test_greatcircle_points_array():
+    """
+    Tests the vectorized greatcircle point generator.
+    """
+    lats, lngs = utils.greatcircle_points_array(
+        [0.0, 10.0, 5.0], [0.0, -20.0, 5.0], [0.0, 40.0, 5.0],
+        [90.0, 50.0, 5.0], npts=25)
+    assert lats.shape == (3, 25)
+    assert lngs.shape == (3, 25)
+
+    # Along the equator.
+    np.testing.assert_array_almost_equal(lats[0], np.zeros(25))
+    np.testing.assert_array_almost_equal(lngs[0], np.linspace(0, 90, 25))
+
+    # Identical points.
+    np.testing.assert_array_almost_equal(lats[2], 5.0 * np.ones(25))
+    np.testing.assert_array_almost_equal(lngs[2], 5.0 * np.ones(25))
+
+    # Close to the points on the ellipsoid.
+    points = list(utils.greatcircle_points(
+        utils.Point(10.0, -20.0), utils.Point(40.0, 50.0), max_npts=25))
+    np.testing.assert_allclose(lats[1], [_i.lat for _i in points], atol=0.2)
+    np.testing.assert_allclose(lngs[1], [_i.lng for _i in points], atol=0.2)
+
+
+def test_greatcircle_points_flat():
+    """
+    Tests the flat greatcircle point generator.
+    """
+    # Along the equator and two identical points.
+    lats, lngs = utils.greatcircle_points_flat(
+        [0.0, 5.0], [0.0, 5.0], [0.0, 5.0], [45.0, 5.0], max_extension=90.0,
+        max_npts=91)
+    points = list(utils.greatcircle_points(
+        utils.Point(0.0, 0.0), utils.Point(0.0, 45.0), max_extension=90.0,
+        max_npts=91))
+    points += list(utils.greatcircle_points(
+        utils.Point(5.0, 5.0), utils.Point(5.0, 5.0), max_extension=90.0,
+        max_npts=91))
+    assert lats.shape == lngs.shape == (len(points),)
+    np.testing.assert_allclose(lats, [_i.lat for _i in points], atol=1E-6)
+    np.testing.assert_allclose(lngs, [_i.lng for _i in points], atol=1E-6)
+
+    # Without a maximum extension, every great circle has max_npts points.
+    lats, lngs = utils.greatcircle_points_flat(
+        [0.0, 10.0, 5.0], [0.0, -20.0, 5.0], [0.0, 40.0, 5.0],
+        [90.0, 50.0, 5.0], max_npts=20)
+    assert lats.shape == lngs.shape == (60,)
+    expected = utils.greatcircle_points_array(
+        [0.0, 10.0, 5.0], [0.0, -20.0, 5.0], [0.0, 40.0, 5.0],
+        [90.0, 50.0, 5.0], npts=20)
+    np.testing.assert_allclose(lats, expected[0].ravel())
+    np.testing.assert_allclose(lngs, expected[1].ravel())
+
+
+def test_atomic_write(tmpdir):
+    """
+    The file only appears once it is completely written.
+    """
+    filename = os.path.join(str(tmpdir), "folder", "file.txt")
+    with utils.atomic_write(filename) as fh:
+        fh.write(b"data")
+        assert not os.path.exists(filename)
+    with open(filename, "rb") as fh:
+        assert fh.read() == b"data"
+
+    # Failed writes leave the existing file untouched.
+    try:
+        with utils.atomic_write(filename) as fh:
+            fh.write(b"other")
+            raise ValueError
+    except ValueError:
+        pass
+    with open(filename, "rb") as fh:
+        assert fh.read() == b"data"
+    assert os.listdir(os.path.dirname(filename)) == ["file.txt"]
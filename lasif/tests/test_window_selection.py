@@ -10,10 +10,12 @@ Test suite for the window selection.
     (http://www.gnu.org/copyleft/gpl.html)
 """
 import inspect
+import numpy as np
 import obspy
 import os
 
-from lasif.window_selection import select_windows
+from lasif.window_selection import select_windows, \
+    _sliding_cross_correlation
 
 # Data path.
 DATA = os.path.join(os.path.dirname(os.path.abspath(
@@ -69,3 +71,34 @@ def test_select_windows():
                          obspy.UTCDateTime(2000, 8, 21, 17, 19, 24, 800000))]
 
     assert windows == expected_windows
+
+
+def test_sliding_cross_correlation():
+    """
+    The batched sliding window cross correlation must be identical to
+    correlating each pair of tapered windows.
+    """
+    data = obspy.read(os.path.join(DATA, "LA.AA10..BHZ.mseed"))[0].data
+    synth = obspy.read(os.path.join(DATA, "LA.AA10_.___.z.bz2"))[0].data
+
+    window_length = 267
+    taper = np.hanning(window_length)
+    start_indices = np.arange(0, len(data) - window_length + 1, 3)
+
+    synth_ptp, time_shift, max_cc = _sliding_cross_correlation(
+        data, synth, taper, start_indices)
+
+    for i, start_idx in enumerate(start_indices):
+        data_window = data[start_idx: start_idx + window_length] * taper
+        synthetic_window = synth[start_idx: start_idx + window_length] * taper
+        cc = np.correlate(data_window, synthetic_window, mode="full")
+
+        assert synth_ptp[i] == synthetic_window.ptp()
+        assert time_shift[i] == cc.argmax() - window_length + 1
+        np.testing.assert_allclose(
+            max_cc[i], cc.max() / np.sqrt((synthetic_window ** 2).sum() *
+                                          (data_window ** 2).sum()))
+
+    # Works for no windows.
+    assert [len(_i) for _i in _sliding_cross_correlation(
+        data, synth, taper, [])] == [0, 0, 0]
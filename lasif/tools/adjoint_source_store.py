@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Consolidated on-disc store of the calculated adjoint sources.
+
+All adjoint sources of an event and an iteration are kept in a single SQLite
+file instead of one file per window. Each window is a single row with the
+adjoint source as a raw binary array so storing and loading it does not
+involve much more than a primary key lookup. The misfit values are
+additionally kept in a separate, lightweight table so they can be queried
+without touching any adjoint source. This also works for windows for which
+only the misfit has been calculated.
+
+Any number of processes can read from a store at the same time but only a
+single one must write to it. Parallel calculations thus return the new
+adjoint sources to the main process, e.g. rank 0 of an MPI run, which
+writes them all at once with :meth:`AdjointSourceStore.update`. A busy
+timeout makes readers wait for a running write instead of failing.
+
+:copyright:
+    Lion Krischer (krischer@geophysik.uni-muenchen.de), 2015
+:license:
+    GNU General Public License, Version 3
+    (http://www.gnu.org/copyleft/gpl.html)
+"""
+import cPickle
+import numpy as np
+import os
+import sqlite3
+
+
+# Version of the stored entries. Entries written with a different version
+# are ignored and overwritten.
+ADJOINT_SOURCE_STORE_VERSION = 1
+
+# Seconds to wait for a lock held by another process.
+STORE_TIMEOUT = 600.0
+
+
+class AdjointSourceStore(object):
+    """
+    Dictionary like store of adjoint sources, keyed by window.
+
+    Values are dictionaries with ``"adjoint_source"``, ``"misfit_value"``,
+    and ``"details"`` keys, just as returned by the misfit functions.
+
+    The connection is opened lazily and reopened in forked child processes
+    so instances can be passed to all parallel backends. Only one process
+    must write to a store at any time.
+
+    :param filename: The SQLite file. It will be created if necessary.
+    :param timeout: Seconds to wait for locks held by other processes.
+    """
+    def __init__(self, filename, timeout=STORE_TIMEOUT):
+        self.filename = filename
+        self.timeout = timeout
+        self.__connection = None
+        self.__pid = None
+
+    def __getstate__(self):
+        return {"filename": self.filename, "timeout": self.timeout}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    @staticmethod
+    def get_key(channel_id, starttime, endtime, taper, taper_percentage,
+                ad_src_type):
+        """
+        Returns the key of a window.
+
+        >>> AdjointSourceStore.get_key("BW.A..BHZ", "2012-01-01T00:00",
+        ...                            "2012-01-01T00:01", "cosine", 0.05,
+        ...                            "L2Norm")
+        'BW.A..BHZ_2012-01-01T00:00_2012-01-01T00:01_cosine_0.05_L2Norm'
+        """
+        return "%s_%s_%s_%s_%.2f_%s" % (
+            channel_id, str(starttime), str(endtime), str(taper),
+            taper_percentage, ad_src_type)
+
+    @property
+    def _conn(self):
+        """
+        Lazy init of the connection, once per process.
+        """
+        if self.__connection is not None and self.__pid == os.getpid():
+            return self.__connection
+
+        folder = os.path.dirname(self.filename)
+        try:
+            if folder and not os.path.exists(folder):
+                os.makedirs(folder)
+        except OSError:
+            # Another process might have just created it.
+            if not os.path.exists(folder):
+                raise
+
+        conn = sqlite3.connect(self.filename, timeout=self.timeout)
+        with conn:
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS adjoint_sources(
+                key TEXT PRIMARY KEY,
+                version INTEGER,
+                misfit_value REAL,
+                dtype TEXT,
+                adjoint_source BLOB,
+                details BLOB
+            );""")
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS misfits(
+                key TEXT PRIMARY KEY,
+                version INTEGER,
+                misfit_value REAL
+            );""")
+        self.__connection = conn
+        self.__pid = os.getpid()
+        return conn
+
+    def __getitem__(self, key):
+        row = self._conn.execute("""
+        SELECT misfit_value, dtype, adjoint_source, details
+        FROM adjoint_sources
+        WHERE key = ? AND version = ?
+        LIMIT 1;
+        """, (key, ADJOINT_SOURCE_STORE_VERSION)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        misfit_value, dtype, adjoint_source, details = row
+        return {
+            "adjoint_source": np.frombuffer(adjoint_source,
+                                            dtype=str(dtype)).copy(),
+            "misfit_value": misfit_value,
+            "details": cPickle.loads(bytes(details))}
+
+    def __setitem__(self, key, value):
+        with self._conn as conn:
+            self._set_item(conn, key, value)
+
+    def __delitem__(self, key):
+        with self._conn as conn:
+            conn.execute("DELETE FROM adjoint_sources WHERE key = ?;",
+                         (key,))
+            conn.execute("DELETE FROM misfits WHERE key = ?;", (key,))
+
+    def __contains__(self, key):
+        return self._conn.execute("""
+        SELECT 1 FROM adjoint_sources
+        WHERE key = ? AND version = ?
+        LIMIT 1;
+        """, (key, ADJOINT_SOURCE_STORE_VERSION)).fetchone() is not None
+
+    def __len__(self):
+        return self._conn.execute("""
+        SELECT COUNT(*) FROM adjoint_sources WHERE version = ?;
+        """, (ADJOINT_SOURCE_STORE_VERSION,)).fetchone()[0]
+
+    def get(self, key, default=None):
+        """
+        Returns the adjoint source of a window or ``default`` if it is not
+        stored or cannot be read anymore.
+        """
+        try:
+            return self[key]
+        except (KeyError, ValueError, TypeError, cPickle.UnpicklingError):
+            return default
+
+    def keys(self):
+        """
+        Returns the sorted keys of all stored windows.
+        """
+        return [_i[0] for _i in self._conn.execute("""
+        SELECT key FROM adjoint_sources WHERE version = ? ORDER BY key;
+        """, (ADJOINT_SOURCE_STORE_VERSION,))]
+
+    def update(self, values):
+        """
+        Stores any number of windows in a single transaction.
+
+        :param values: Iterable of ``(key, value)`` tuples. Values without an
+            adjoint source only store the misfit value, just as
+            :meth:`set_misfit` does.
+        """
+        with self._conn as conn:
+            for key, value in values:
+                if value["adjoint_source"] is None:
+                    self._set_misfit(conn, key, value["misfit_value"])
+                else:
+                    self._set_item(conn, key, value)
+
+    def get_misfit(self, key):
+        """
+        Returns the misfit value of a window or None if it is not stored.
+        """
+        row = self._conn.execute("""
+        SELECT misfit_value FROM misfits
+        WHERE key = ? AND version = ?
+        LIMIT 1;
+        """, (key, ADJOINT_SOURCE_STORE_VERSION)).fetchone()
+        return row[0] if row else None
+
+    def set_misfit(self, key, misfit_value):
+        """
+        Stores only the misfit value of a window.
+        """
+        with self._conn as conn:
+            self._set_misfit(conn, key, misfit_value)
+
+    @classmethod
+    def _set_item(cls, conn, key, value):
+        adjoint_source = np.require(value["adjoint_source"],
+                                    requirements="C")
+        conn.execute("""
+        INSERT OR REPLACE INTO adjoint_sources
+            (key, version, misfit_value, dtype, adjoint_source, details)
+        VALUES (?, ?, ?, ?, ?, ?);
+        """, (key, ADJOINT_SOURCE_STORE_VERSION,
+              float(value["misfit_value"]), adjoint_source.dtype.str,
+              sqlite3.Binary(adjoint_source.tobytes()),
+              sqlite3.Binary(cPickle.dumps(value["details"], protocol=2))))
+        cls._set_misfit(conn, key, value["misfit_value"])
+
+    @staticmethod
+    def _set_misfit(conn, key, misfit_value):
+        conn.execute("""
+        INSERT OR REPLACE INTO misfits (key, version, misfit_value)
+        VALUES (?, ?, ?);
+        """, (key, ADJOINT_SOURCE_STORE_VERSION, float(misfit_value)))
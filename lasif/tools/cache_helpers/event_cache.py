@@ -35,7 +35,8 @@ class EventCache(FileInfoCache):
     RESP files: RESP.*
     StationXML: *.xml
     """
-    def __init__(self, cache_db_file, event_folder, root_folder, read_only):
+    def __init__(self, cache_db_file, event_folder, root_folder, read_only,
+                 hash_function="crc32", hash_sample_size=None):
         self.index_values = [
             ("filename", "TEXT"),
             ("event_name", "TEXT"),
@@ -61,7 +62,9 @@ class EventCache(FileInfoCache):
                                          root_folder=root_folder,
                                          read_only=read_only,
                                          pretty_name="Event Cache",
-                                         show_progress=False)
+                                         show_progress=False,
+                                         hash_function=hash_function,
+                                         hash_sample_size=hash_sample_size)
 
     def _find_files_quakeml(self):
         return glob.glob(os.path.join(self.event_folder, "*.xml"))
@@ -73,12 +73,21 @@ Example implementation:
 from __future__ import absolute_import
 
 from binascii import crc32
+import collections
+import io
 from itertools import izip
+import multiprocessing
 import os
 import progressbar
 import sqlite3
 import time
 import warnings
+import zlib
+
+try:
+    from os import scandir
+except ImportError:
+    scandir = None
 
 from lasif import LASIFWarning
 
@@ -90,23 +99,137 @@ FILES_TABLE_DEFINITION = (
     (u"filename", u"TEXT"),
     (u"filesize", u"INTEGER"),
     (u"last_modified", u"REAL"),
-    (u"crc32_hash", u"INTEGER")
+    (u"crc32_hash", u"INTEGER"),
+    (u"inode", u"INTEGER")
 )
 
+# Number of files to be (re)indexed above which the indexing is distributed
+# across all available CPUs if the number of processes is not explicitly set.
+PARALLEL_INDEXING_THRESHOLD = 250
+
+# Number of indexed files written to the database in a single transaction.
+BULK_INSERT_BATCH_SIZE = 500
+
+# The cache currently being updated. Forked worker processes use it to
+# access the indexing methods.
+_CURRENT_CACHE = None
+
+# Available hash functions. Each must be callable as ``f(data, value)`` to
+# continue hashing from a previous value.
+HASH_FUNCTIONS = {
+    "crc32": crc32,
+    "adler32": zlib.adler32
+}
+
+# Size of the buffer used to stream files through the hash function.
+HASH_BUFFER_SIZE = 1024 * 1024
+
+
+def get_file_hash(filename, hash_function="crc32", sample_size=None,
+                  buf=None):
+    """
+    Calculates the hash of a file by streaming it through a fixed size
+    buffer. The file is thus never completely read into memory.
+
+    :param filename: The file to hash.
+    :param hash_function: The name of the hash function. One of the keys of
+        ``HASH_FUNCTIONS``.
+    :param sample_size: If given and the file is larger than twice the
+        sample size, only the first and last ``sample_size`` bytes as well
+        as the file size will be hashed. Only use this for large files that
+        are never modified in place.
+    :param buf: A ``bytearray`` to read the file into. It will be reused if
+        given, otherwise a new one will be allocated.
+
+    >>> import tempfile
+    >>> with tempfile.NamedTemporaryFile() as fh:
+    ...     fh.write(b"hello world")
+    ...     fh.flush()
+    ...     get_file_hash(fh.name, buf=bytearray(4)) == crc32(b"hello world")
+    True
+    """
+    hash_function = HASH_FUNCTIONS[hash_function]
+    if buf is None:
+        buf = bytearray(HASH_BUFFER_SIZE)
+
+    with io.open(filename, "rb", buffering=0) as fh:
+        if sample_size:
+            filesize = os.fstat(fh.fileno()).st_size
+            if filesize > 2 * sample_size:
+                value = hash_function(str(filesize))
+                for offset in (0, filesize - sample_size):
+                    fh.seek(offset, 0)
+                    value = _hash_stream(fh, hash_function, buf, value,
+                                         sample_size)
+                return value
+        return _hash_stream(fh, hash_function, buf, hash_function(b""))
+
+
+def _hash_stream(fh, hash_function, buf, value, size=None):
+    """
+    Streams the file object through the hash function. Reads until the end
+    of the file or, if given, at most ``size`` bytes.
+    """
+    while size is None or size > 0:
+        count = fh.readinto(buf)
+        if not count:
+            break
+        if size is not None:
+            count = min(count, size)
+            size -= count
+        value = hash_function(buffer(buf, 0, count), value)
+    return value
+
+
+class IndexResult(collections.namedtuple(
+    "IndexResult", ["filename", "filetype", "filepath_id", "unchanged",
+                    "indices", "error", "last_modified", "filesize",
+                    "inode", "filehash", "warnings"])):
+    """
+    Namedtuple with the result of indexing a single file.
+
+    ``unchanged`` is True if the file has the same hash as the existing
+    database entry and has thus not been indexed again. ``error`` is the
+    error message in case the indexing failed and ``warnings`` a list of
+    ``(message, category)`` tuples of all warnings raised during indexing.
+    """
+    pass
+
 
 class FileInfoCache(object):
     """
     Object able to cache information about arbitrary files on the filesystem.
 
     Intended to be subclassed.
+
+    :param processes: The number of processes used to index files. ``None``
+        uses all available CPUs if enough files have to be indexed and a
+        single process otherwise.
+    :param hash_function: The name of the hash function used to detect
+        changed files. One of the keys of ``HASH_FUNCTIONS``.
+    :param hash_sample_size: If given, files larger than twice this number
+        of bytes are only hashed by their size and their first and last
+        ``hash_sample_size`` bytes. Much faster for large files but will not
+        detect changes in the middle of a file.
     """
     def __init__(self, cache_db_file, root_folder,
-                 read_only, pretty_name, show_progress=True):
+                 read_only, pretty_name, show_progress=True, processes=None,
+                 hash_function="crc32", hash_sample_size=None):
         self.cache_db_file = cache_db_file
         self.root_folder = root_folder
         self.read_only = read_only
         self.show_progress = show_progress
         self.pretty_name = pretty_name
+        self.processes = processes
+        self.hash_function = hash_function
+        self.hash_sample_size = hash_sample_size
+
+        if self.hash_function not in HASH_FUNCTIONS:
+            raise ValueError("Hash function '%s' not known. Available: %s" % (
+                self.hash_function, ", ".join(sorted(HASH_FUNCTIONS))))
+
+        # Buffer reused for hashing all files.
+        self._hash_buffer = None
 
         # Will be filled in _init_database() method.
         self.db_cursor = None
@@ -352,86 +475,95 @@ class FileInfoCache(object):
         for key, value in self.files.iteritems():
             self.files[key] = list(filenames.intersection(set(value)))
 
+    def _stat_files(self):
+        """
+        Gets the size, the last modified time, and the inode of all files.
+
+        Each directory is only scanned once. Returns a dictionary with the
+        relative filenames as keys and ``(size, mtime, inode)`` tuples as
+        values. Files that no longer exist are not part of it.
+        """
+        directories = {}
+        for filenames in self.files.itervalues():
+            for filename in filenames:
+                directory, basename = os.path.split(filename)
+                directories.setdefault(directory, set()).add(basename)
+
+        stats = {}
+        for directory, basenames in directories.iteritems():
+            abs_directory = os.path.join(self.root_folder, directory)
+            if scandir is not None:
+                try:
+                    entries = [(_i.name, _i.stat()) for _i in
+                               scandir(abs_directory) if _i.name in basenames]
+                except OSError:
+                    continue
+            else:
+                entries = []
+                for basename in basenames:
+                    try:
+                        entries.append((basename, os.stat(
+                            os.path.join(abs_directory, basename))))
+                    except OSError:
+                        continue
+            for basename, st in entries:
+                stats[os.path.join(directory, basename)] = \
+                    (st.st_size, st.st_mtime, st.st_ino)
+        return stats
+
     def update(self):
         """
         Updates the database.
+
+        All files are first compared to the database by their size, last
+        modified time, and inode. Only files for which these differ are
+        hashed and files with a changed hash are indexed again. Everything
+        is written to the database in batches, each in a single
+        transaction. If enough files have to be indexed, the indexing is
+        distributed across a pool of processes.
         """
         # Get all files first.
         self._get_all_files_by_filename()
 
         # Get all files currently in the database and reshape into a
         # dictionary. The dictionary key is the filename and the value a tuple
-        # of (id, last_modified, crc32 hash).
-        db_files = self.db_cursor.execute("SELECT * FROM files").fetchall()
-        db_files = {_i[1]: (_i[0], _i[3], _i[4]) for _i in db_files}
-
-        # Count all files
-        filecount = 0
+        # of (id, (filesize, last_modified, inode), crc32 hash).
+        db_files = self.db_cursor.execute(
+            "SELECT id, filename, filesize, last_modified, inode, crc32_hash "
+            "FROM files").fetchall()
+        db_files = {_i[1]: (_i[0], tuple(_i[2:5]), _i[5]) for _i in db_files}
+
+        stats = self._stat_files()
+
+        # Assemble everything that potentially has to be (re)indexed. Each
+        # job is a tuple of (absolute filename, filetype, (size, mtime,
+        # inode), file id, old hash). The file id and old hash are None for
+        # new files.
+        jobs = []
         for filetype in self.filetypes:
-            filecount += len(self.files[filetype])
-
-        # XXX: Check which files have the correct mtime outside the loop.
-        # Then the case when the caches already exist should be much faster
-        # (and the average case as well...)
-
-        # Use a progressbar if the filecount is large so something appears on
-        # screen.
-        pbar = None
-        update_interval = 1
-        current_file_count = 0
-        start_time = time.time()
-        try:
-            # Store the old working directory and change to the root folder
-            # to get relative pathnames.
-            org_directory = os.getcwd()
-            os.chdir(self.root_folder)
-
-            # Now update all filetypes separately.
-            for filetype in self.filetypes:
-                for filename in self.files[filetype]:
-                    current_file_count += 1
-                    # Only show the progressbar if more then 3.5 seconds have
-                    # passed.
-                    if not pbar and self.show_progress and \
-                            (time.time() - start_time > 3.5):
-                        widgets = [
-                            "Updating %s: " % self.pretty_name,
-                            progressbar.Percentage(),
-                            progressbar.Bar(), "", progressbar.ETA()]
-                        pbar = progressbar.ProgressBar(
-                            widgets=widgets, maxval=filecount).start()
-                        update_interval = max(int(filecount / 100), 1)
-                        pbar.update(current_file_count)
-                    if pbar and not current_file_count % update_interval:
-                        pbar.update(current_file_count)
-                    if filename in db_files:
-                        # Delete the file from the list of files to keep
-                        # track of files no longer available.
-                        this_file = db_files[filename]
-                        del db_files[filename]
-                        abs_filename = os.path.abspath(filename)
-
-                        last_modified = os.path.getmtime(abs_filename)
-                        # If the last modified time is identical to a
-                        # second, do nothing.
-                        if abs(last_modified - this_file[1]) < 1.0:
-                            continue
-                        # Otherwise check the hash.
-                        with open(abs_filename, "rb") as open_file:
-                            hash_value = crc32(open_file.read())
-                        if hash_value == this_file[2]:
-                            # XXX: Update last modified times, otherwise it
-                            # will hash again and again.
-                            continue
-                        self._update_file(abs_filename, filetype,
-                                          this_file[0])
-                    else:
-                        self._update_file(os.path.abspath(filename),
-                                          filetype)
-        finally:
-            os.chdir(org_directory)
-        if pbar:
-            pbar.finish()
+            for filename in self.files[filetype]:
+                if filename not in stats:
+                    continue
+                abs_filename = os.path.abspath(
+                    os.path.join(self.root_folder, filename))
+                stat = stats[filename]
+                if filename in db_files:
+                    # Delete the file from the list of files to keep
+                    # track of files no longer available.
+                    this_file = db_files[filename]
+                    del db_files[filename]
+
+                    # Nothing to do if the metadata did not change.
+                    if stat == this_file[1]:
+                        continue
+                    # Otherwise the hash will be checked before reindexing.
+                    jobs.append((abs_filename, filetype, stat, this_file[0],
+                                 this_file[2]))
+                else:
+                    jobs.append((abs_filename, filetype, stat, None, None))
+
+        if jobs:
+            self._index_files(jobs)
 
         # Remove all files no longer part of the cache DB.
         if db_files:
@@ -439,14 +571,89 @@ class FileInfoCache(object):
                 print("Removing %i no longer existing files from the "
                       "cache database. This might take a while ..." %
                       len(db_files))
-            query = "DELETE FROM files WHERE filename IN (%s);" % \
-                ",".join(["'%s'" % _i for _i in db_files])
-            self.db_cursor.execute(query)
+            self.db_cursor.executemany(
+                "DELETE FROM files WHERE filename = ?;",
+                [(_i,) for _i in db_files])
         self.db_conn.commit()
 
         # Update the self.files dictionary, this time from the database.
         self._get_all_files_from_database()
 
+    def _index_files(self, jobs):
+        """
+        Indexes all files and writes the results to the database.
+
+        :param jobs: List of (absolute filename, filetype, (size, mtime,
+            inode), file id, old hash) tuples. The file id and the old hash
+            have to be ``None`` for files not yet in the database.
+        """
+        processes = self.processes
+        if processes is None:
+            if len(jobs) >= PARALLEL_INDEXING_THRESHOLD:
+                processes = multiprocessing.cpu_count()
+            else:
+                processes = 1
+
+        # Use a progressbar if the filecount is large so something appears on
+        # screen.
+        filecount = len(jobs)
+        pbar = None
+        update_interval = 1
+        start_time = time.time()
+
+        pool = None
+        global _CURRENT_CACHE
+        try:
+            if processes > 1:
+                # The workers are forked and thus inherit the reference to
+                # this instance. This avoids pickling the cache which would
+                # not work due to the database connection.
+                _CURRENT_CACHE = self
+                pool = multiprocessing.Pool(processes=processes)
+                chunksize = max(1, min(
+                    50, int(filecount / (processes * 8))))
+                results = pool.imap_unordered(_index_file, jobs,
+                                              chunksize=chunksize)
+            else:
+                results = (self._index_file(*_i) for _i in jobs)
+
+            batch = []
+            for current_file_count, result in enumerate(results, 1):
+                # Only show the progressbar if more then 3.5 seconds have
+                # passed.
+                if not pbar and self.show_progress and \
+                        (time.time() - start_time > 3.5):
+                    widgets = [
+                        "Updating %s: " % self.pretty_name,
+                        progressbar.Percentage(),
+                        progressbar.Bar(), "", progressbar.ETA()]
+                    pbar = progressbar.ProgressBar(
+                        widgets=widgets, maxval=filecount).start()
+                    update_interval = max(int(filecount / 100), 1)
+                    pbar.update(current_file_count)
+                if pbar and not current_file_count % update_interval:
+                    pbar.update(current_file_count)
+
+                batch.append(result)
+                if len(batch) >= BULK_INSERT_BATCH_SIZE:
+                    self._write_index_results(batch)
+                    batch = []
+            if batch:
+                self._write_index_results(batch)
+        except:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+                pool = None
+            raise
+        finally:
+            _CURRENT_CACHE = None
+            if pool is not None:
+                pool.close()
+                pool.join()
+        if pbar:
+            pbar.finish()
+
     def get_values(self):
         """
         Returns a list of dictionaries containing all indexed values for every
@@ -506,82 +713,143 @@ class FileInfoCache(object):
 
         return all_values
 
-    def _update_file(self, filename, filetype, filepath_id=None):
-        """
-        Updates or creates a new entry for the given file. If id is given, it
-        will be interpreted as an update, otherwise as a fresh record.
+    def _index_file(self, filename, filetype, stat, filepath_id=None,
+                    old_hash=None):
         """
-        abs_filename = filename
-        rel_filename = os.path.relpath(abs_filename, self.root_folder)
-        # Remove all old indices for the file if it is an update.
-        if filepath_id is not None:
-            self.db_cursor.execute("DELETE FROM indices WHERE "
-                                   "filepath_id = %i" % filepath_id)
-            self.db_conn.commit()
+        Extracts the indices from a single file. Does not touch the database
+        and is thus safe to be called in the worker processes.
 
-        # Get all indices from the file.
-        try:
-            indices = getattr(self, "_extract_index_values_%s" %
-                                    filetype)(abs_filename)
-        except Exception as e:
-            msg = "Failed to index '%s' of type '%s' due to: %s" % (
-                abs_filename, filetype, str(e)
-            )
-            warnings.warn(msg, LASIFWarning)
+        If ``old_hash`` is given and the file's hash did not change,
+        the file will not be indexed again. ``stat`` is the ``(size, mtime,
+        inode)`` tuple of the file which will be stored in the database.
 
-            # If it is an update, also remove the file from the file list.
-            if filepath_id is not None:
-                self.db_cursor.execute(
-                    "DELETE FROM files WHERE filename='%s';" % rel_filename)
-                self.db_conn.commit()
+        Returns an :class:`IndexResult`. All warnings are captured and will
+        be raised again once the result is written to the database.
+        """
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter("always")
+
+            if self._hash_buffer is None:
+                self._hash_buffer = bytearray(HASH_BUFFER_SIZE)
+            filehash = get_file_hash(
+                filename, hash_function=self.hash_function,
+                sample_size=self.hash_sample_size, buf=self._hash_buffer)
+
+            indices = None
+            error = None
+            unchanged = old_hash is not None and filehash == old_hash
+
+            if not unchanged:
+                try:
+                    indices = getattr(self, "_extract_index_values_%s" %
+                                      filetype)(filename)
+                except Exception as e:
+                    error = str(e)
+
+        return IndexResult(
+            filename=filename,
+            filetype=filetype,
+            filepath_id=filepath_id,
+            unchanged=unchanged,
+            indices=indices,
+            error=error,
+            filesize=stat[0],
+            last_modified=stat[1],
+            inode=stat[2],
+            filehash=filehash,
+            warnings=[(str(_i.message), _i.category) for _i in w])
+
+    def _write_index_results(self, results):
+        """
+        Writes a batch of index results to the database in a single
+        transaction.
 
-            return
+        :param results: List of :class:`IndexResult` objects.
+        """
+        index_query = "INSERT INTO indices(%s, filepath_id) VALUES(%s);" % (
+            ",".join([_i[0] for _i in self.index_values]),
+            ",".join(["?"] * (len(self.index_values) + 1)))
+
+        removed_files = []
+        updated_files = []
+        touched_files = []
+        all_indices = []
+
+        for result in results:
+            # Raise all warnings that occured while indexing.
+            for message, category in result.warnings:
+                warnings.warn(message, category)
+
+            # Only store the new metadata. Otherwise the file would be
+            # hashed again and again.
+            if result.unchanged:
+                touched_files.append((
+                    result.last_modified, result.filesize, result.inode,
+                    result.filepath_id))
+                continue
 
-        if not indices:
-            msg = ("Could not extract any index from file '%s' of type '%s'. "
-                   "The file will be skipped." % (abs_filename, filetype))
-            warnings.warn(msg, LASIFWarning)
+            if result.error is not None:
+                msg = "Failed to index '%s' of type '%s' due to: %s" % (
+                    result.filename, result.filetype, result.error)
+                warnings.warn(msg, LASIFWarning)
+            elif not result.indices:
+                msg = ("Could not extract any index from file '%s' of type "
+                       "'%s'. The file will be skipped." % (
+                           result.filename, result.filetype))
+                warnings.warn(msg, LASIFWarning)
+            else:
+                if result.filepath_id is not None:
+                    filepath_id = result.filepath_id
+                    updated_files.append((
+                        result.last_modified, result.filesize, result.inode,
+                        result.filehash, filepath_id))
+                else:
+                    # Inserted one at a time to get the id. Still fast as
+                    # it is not committed.
+                    self.db_cursor.execute(
+                        "INSERT into files(filename, last_modified, "
+                        "filesize, inode, crc32_hash) "
+                        "VALUES(?, ?, ?, ?, ?);", (
+                            os.path.relpath(result.filename,
+                                            self.root_folder),
+                            result.last_modified, result.filesize,
+                            result.inode, result.filehash))
+                    filepath_id = self.db_cursor.lastrowid
+                # Append the file's path id to every index.
+                all_indices.extend(list(_i) + [filepath_id]
+                                   for _i in result.indices)
+                continue
 
             # If it is an update, also remove the file from the file list.
-            if filepath_id is not None:
-                self.db_cursor.execute(
-                    "DELETE FROM files WHERE filename='%s';" % rel_filename)
-                self.db_conn.commit()
+            if result.filepath_id is not None:
+                removed_files.append((result.filepath_id,))
+
+        # Removing a file will also remove all its indices.
+        if removed_files:
+            self.db_cursor.executemany(
+                "DELETE FROM files WHERE id = ?;", removed_files)
+        # Remove all old indices of updated files.
+        if updated_files:
+            self.db_cursor.executemany(
+                "DELETE FROM indices WHERE filepath_id = ?;",
+                [(_i[-1],) for _i in updated_files])
+            self.db_cursor.executemany(
+                "UPDATE files SET last_modified = ?, filesize = ?, "
+                "inode = ?, crc32_hash = ? WHERE id = ?;", updated_files)
+        if touched_files:
+            self.db_cursor.executemany(
+                "UPDATE files SET last_modified = ?, filesize = ?, "
+                "inode = ? WHERE id = ?;", touched_files)
+        if all_indices:
+            self.db_cursor.executemany(index_query, all_indices)
 
-            return
-
-        # Get the hash
-        with open(abs_filename, "rb") as open_file:
-            filehash = crc32(open_file.read())
-
-        # Add or update the file.
-        if filepath_id is not None:
-            self.db_cursor.execute(
-                "UPDATE files SET last_modified=%f, "
-                "filesize=%i, "
-                "crc32_hash=%i WHERE id=%i;" % (os.path.getmtime(abs_filename),
-                                                os.path.getsize(abs_filename),
-                                                filehash, filepath_id))
-            self.db_conn.commit()
-        else:
-            self.db_cursor.execute(
-                "INSERT into files(filename, last_modified, filesize, "
-                " crc32_hash) VALUES"
-                "('%s', %f, %i, %i);" % (
-                    rel_filename, os.path.getmtime(abs_filename),
-                    os.path.getsize(abs_filename), filehash))
-            self.db_conn.commit()
-            filepath_id = self.db_cursor.lastrowid
-
-        # Append the file's path id to every index.
-        for index in indices:
-            index.append(filepath_id)
+        self.db_conn.commit()
 
-        sql_insert_string = "INSERT INTO indices(%s, filepath_id) VALUES(%s);"
 
-        self.db_conn.executemany(sql_insert_string % (
-            ",".join([_i[0] for _i in self.index_values]),
-            ",".join(["?"] * (len(indices[0])))),
-            indices)
+def _index_file(job):
+    """
+    Indexes a single file in a worker process.
 
-        self.db_conn.commit()
+    Must be a module level function as otherwise it could not be pickled.
+    """
+    return _CURRENT_CACHE._index_file(*job)
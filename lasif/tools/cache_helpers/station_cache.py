@@ -44,7 +44,8 @@ class StationCache(FileInfoCache):
     StationXML: *.xml
     """
     def __init__(self, cache_db_file, root_folder, seed_folder, resp_folder,
-                 stationxml_folder, read_only, show_progress=True):
+                 stationxml_folder, read_only, show_progress=True,
+                 hash_function="crc32", hash_sample_size=None):
         self.index_values = [
             ("channel_id", "TEXT"),
             ("start_date", "INTEGER"),
@@ -67,7 +68,9 @@ class StationCache(FileInfoCache):
                                            root_folder=root_folder,
                                            read_only=read_only,
                                            pretty_name="Station Cache",
-                                           show_progress=show_progress)
+                                           show_progress=show_progress,
+                                           hash_function=hash_function,
+                                           hash_sample_size=hash_sample_size)
 
     def _find_files_seed(self):
         return glob.glob(os.path.join(self.seed_folder, "dataless.*"))
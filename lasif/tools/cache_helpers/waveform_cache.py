@@ -20,6 +20,21 @@ import warnings
 from .file_info_cache import FileInfoCache
 
 
+# The values indexed for each channel in a waveform file.
+WAVEFORM_INDEX_VALUES = [
+    ("network", "TEXT"),
+    ("station", "TEXT"),
+    ("location", "TEXT"),
+    ("channel", "TEXT"),
+    ("channel_id", "TEXT"),
+    ("starttime_timestamp", "REAL"),
+    ("endtime_timestamp", "REAL"),
+    ("latitude", "REAL"),
+    ("longitude", "REAL"),
+    ("elevation_in_m", "REAL"),
+    ("local_depth_in_m", "REAL")]
+
+
 class WaveformCache(FileInfoCache):
     """
     Cache taking care of a single waveform directory.
@@ -29,26 +44,20 @@ class WaveformCache(FileInfoCache):
 
     def __init__(self, cache_db_file, root_folder, waveform_folder, read_only,
                  pretty_name, show_progress=True,
-                 synthetic_info=None):
+                 synthetic_info=None, hash_function="crc32",
+                 hash_sample_size=None):
         """
         :param synthetic_info: Special argument. If given it must be a
             dictionary with the following keys: "starttime_timestamp" and
             "endtime_timestamp". These are assumed to be constant for the
             folder and will be used everywhere greatly speeding up the
             parsing of synthetic files.
+        :param hash_function: Passed on to
+            :class:`~lasif.tools.cache_helpers.file_info_cache.FileInfoCache`.
+        :param hash_sample_size: Passed on to
+            :class:`~lasif.tools.cache_helpers.file_info_cache.FileInfoCache`.
         """
-        self.index_values = [
-            ("network", "TEXT"),
-            ("station", "TEXT"),
-            ("location", "TEXT"),
-            ("channel", "TEXT"),
-            ("channel_id", "TEXT"),
-            ("starttime_timestamp", "REAL"),
-            ("endtime_timestamp", "REAL"),
-            ("latitude", "REAL"),
-            ("longitude", "REAL"),
-            ("elevation_in_m", "REAL"),
-            ("local_depth_in_m", "REAL")]
+        self.index_values = list(WAVEFORM_INDEX_VALUES)
 
         self.filetypes = ["waveform"]
 
@@ -59,7 +68,9 @@ class WaveformCache(FileInfoCache):
                                             root_folder=root_folder,
                                             read_only=read_only,
                                             pretty_name=pretty_name,
-                                            show_progress=show_progress)
+                                            show_progress=show_progress,
+                                            hash_function=hash_function,
+                                            hash_sample_size=hash_sample_size)
 
     def get_files_for_station(self, network, station):
         """
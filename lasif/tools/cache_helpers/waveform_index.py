@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Project wide waveform index.
+
+Consolidates the indices of all per-folder waveform caches into a single
+database keyed by event, data type, and tag. The per-folder caches still
+take care of detecting new, changed, and removed files - this index is
+filled from them and enables project wide queries with single SQL
+statements instead of opening one database per folder. The modification
+times of each per-folder cache and its waveform folder are stored so
+outdated entries can be detected with a ``stat`` per folder.
+
+:copyright:
+    Lion Krischer (krischer@geophysik.uni-muenchen.de), 2016
+:license:
+    GNU General Public License, Version 3
+    (http://www.gnu.org/copyleft/gpl.html)
+"""
+from __future__ import absolute_import
+
+import collections
+from itertools import izip
+import os
+import sqlite3
+
+from .waveform_cache import WAVEFORM_INDEX_VALUES
+
+
+class WaveformIndex(object):
+    """
+    Single database containing the waveform indices of all events, data
+    types, and tags of a project.
+
+    The tag is the processing tag for processed data, the long iteration
+    name for synthetics, and an empty string for raw data.
+
+    :param index_db_file: The database file. Will be created if it does not
+        exist.
+    :param root_folder: The project root folder. All filenames are stored
+        relative to it.
+    :param read_only: Open the database in read-only mode.
+    """
+    def __init__(self, index_db_file, root_folder, read_only=False):
+        self.index_db_file = index_db_file
+        self.root_folder = root_folder
+        self.read_only = read_only
+
+        self.index_values = list(WAVEFORM_INDEX_VALUES)
+
+        if self.read_only:
+            if not os.path.exists(self.index_db_file):
+                raise ValueError("Waveform index '%s' does not exist and "
+                                 "cannot be created in read-only mode." %
+                                 self.index_db_file)
+            # Same approach as for the read-only file info caches.
+            self._fd = os.open(self.index_db_file, os.O_RDONLY)
+            self.db_conn = sqlite3.connect("/dev/fd/%d" % self._fd)
+        else:
+            self.db_conn = sqlite3.connect(self.index_db_file)
+        self.db_cursor = self.db_conn.cursor()
+        self.db_cursor.execute("PRAGMA foreign_keys = ON;")
+
+        if not self.read_only:
+            self.db_cursor.execute("PRAGMA synchronous = OFF;")
+            self._init_database()
+
+    def __del__(self):
+        if getattr(self, "db_conn", None):
+            try:
+                self.db_conn.close()
+            except sqlite3.Error:
+                pass
+        if hasattr(self, "_fd"):
+            try:
+                os.close(self._fd)
+            except OSError:
+                pass
+
+    def _init_database(self):
+        """
+        Creates the tables and indices if they do not yet exist.
+        """
+        self.db_cursor.execute("""
+            CREATE TABLE IF NOT EXISTS sources (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                event TEXT,
+                data_type TEXT,
+                tag TEXT,
+                cache_db_file TEXT,
+                last_modified REAL,
+                folder_last_modified REAL,
+                UNIQUE(event, data_type, tag)
+            );""")
+        # Indices created before the folders have been tracked.
+        columns = [_i[1] for _i in self.db_cursor.execute(
+            "PRAGMA table_info(sources);")]
+        if "folder_last_modified" not in columns:
+            self.db_cursor.execute(
+                "ALTER TABLE sources ADD COLUMN folder_last_modified REAL;")
+        self.db_cursor.execute("""
+            CREATE TABLE IF NOT EXISTS waveforms (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                source_id INTEGER,
+                event TEXT,
+                data_type TEXT,
+                tag TEXT,
+                filename TEXT,
+                %s,
+                FOREIGN KEY(source_id) REFERENCES sources(id)
+                    ON DELETE CASCADE
+            );""" % ",\n".join("%s %s" % _i for _i in self.index_values))
+        self.db_cursor.execute("""
+            CREATE INDEX IF NOT EXISTS waveforms_event_network_station
+            ON waveforms(event, network, station);""")
+        self.db_cursor.execute("""
+            CREATE INDEX IF NOT EXISTS waveforms_data_type_tag_event
+            ON waveforms(data_type, tag, event);""")
+        self.db_cursor.execute("""
+            CREATE INDEX IF NOT EXISTS waveforms_source_id
+            ON waveforms(source_id);""")
+        self.db_conn.commit()
+
+    def is_up_to_date(self, event, data_type, tag, cache_db_file,
+                      folder=None):
+        """
+        Checks if the given per-folder cache has already been imported and
+        did not change since.
+
+        :param folder: If given, the waveform folder of the cache must not
+            have changed either, i.e. no files have been added or removed.
+        """
+        row = self.db_cursor.execute(
+            "SELECT cache_db_file, last_modified, folder_last_modified "
+            "FROM sources WHERE event = ? AND data_type = ? AND tag = ?;",
+            (event, data_type, tag or "")).fetchone()
+        if row is None or not os.path.exists(cache_db_file):
+            return False
+        if folder is not None and (not os.path.exists(folder) or
+                                   row[2] != os.path.getmtime(folder)):
+            return False
+        return row[0] == cache_db_file and \
+            row[1] == os.path.getmtime(cache_db_file)
+
+    def import_cache(self, event, data_type, tag, cache_db_file,
+                     folder=None):
+        """
+        Imports the contents of a per-folder waveform cache, replacing
+        anything previously stored for the same event, data type, and tag.
+
+        The cache is attached to the index database and copied with a
+        single SQL statement.
+
+        :param event: The event name.
+        :param data_type: ``"raw"``, ``"processed"``, or ``"synthetic"``.
+        :param tag: The processing tag or the long iteration name.
+        :param cache_db_file: The database file of the per-folder cache.
+        :param folder: The waveform folder of the per-folder cache.
+        """
+        tag = tag or ""
+        folder_last_modified = os.path.getmtime(folder) \
+            if folder and os.path.exists(folder) else None
+        # Attaching does not work within a transaction.
+        self.db_conn.commit()
+        self.db_cursor.execute("ATTACH DATABASE ? AS source;",
+                               (cache_db_file,))
+        try:
+            self.db_cursor.execute(
+                "DELETE FROM sources WHERE event = ? AND data_type = ? AND "
+                "tag = ?;", (event, data_type, tag))
+            self.db_cursor.execute(
+                "INSERT INTO sources(event, data_type, tag, cache_db_file, "
+                "last_modified, folder_last_modified) "
+                "VALUES(?, ?, ?, ?, ?, ?);",
+                (event, data_type, tag, cache_db_file,
+                 os.path.getmtime(cache_db_file), folder_last_modified))
+            source_id = self.db_cursor.lastrowid
+            names = [_i[0] for _i in self.index_values]
+            self.db_cursor.execute(
+                """
+                INSERT INTO waveforms(source_id, event, data_type, tag,
+                                      filename, %s)
+                SELECT ?, ?, ?, ?, source.files.filename, %s
+                FROM source.indices
+                INNER JOIN source.files
+                ON source.indices.filepath_id = source.files.id;
+                """ % (", ".join(names),
+                       ", ".join("source.indices.%s" % _i for _i in names)),
+                (source_id, event, data_type, tag))
+            self.db_conn.commit()
+        except:
+            self.db_conn.rollback()
+            raise
+        finally:
+            self.db_cursor.execute("DETACH DATABASE source;")
+
+    def remove_missing_sources(self):
+        """
+        Removes everything whose per-folder cache no longer exists.
+
+        Returns the number of removed event/data type/tag combinations.
+        """
+        sources = self.db_cursor.execute(
+            "SELECT id, cache_db_file FROM sources;").fetchall()
+        missing = [(_i[0],) for _i in sources if not os.path.exists(_i[1])]
+        if missing:
+            self.db_cursor.executemany("DELETE FROM sources WHERE id = ?;",
+                                       missing)
+            self.db_conn.commit()
+        return len(missing)
+
+    def remove_source(self, event, data_type, tag):
+        """
+        Removes everything stored for the given event, data type, and tag.
+        """
+        self.db_cursor.execute(
+            "DELETE FROM sources WHERE event = ? AND data_type = ? AND "
+            "tag = ?;", (event, data_type, tag or ""))
+        self.db_conn.commit()
+
+    def get_values(self, data_type, tag=None, event=None, network=None,
+                   station=None):
+        """
+        Returns a list of dictionaries, one for each indexed channel. Each
+        dictionary has the same keys as the per-folder cache values plus
+        the ``"event"`` key.
+
+        :param data_type: The data type.
+        :param tag: The processing tag or the long iteration name.
+        :param event: If given, restrict to this event.
+        :param network: If given, restrict to this network.
+        :param station: If given, restrict to this station.
+        """
+        conditions = [("data_type", data_type), ("tag", tag or "")]
+        for key, value in (("event", event), ("network", network),
+                           ("station", station)):
+            if value is not None:
+                conditions.append((key, value))
+
+        names = ["event"] + [_i[0] for _i in self.index_values]
+        query = "SELECT %s, filename FROM waveforms WHERE %s;" % (
+            ", ".join(names), " AND ".join("%s = ?" % _i[0]
+                                           for _i in conditions))
+
+        all_values = []
+        for _i in self.db_cursor.execute(query, [_j[1] for _j in conditions]):
+            values = {key: value for (key, value) in izip(names, _i)}
+            values["filename"] = os.path.abspath(os.path.join(
+                self.root_folder, _i[-1]))
+            all_values.append(values)
+        return all_values
+
+    def get_stations(self, data_type, tag=None):
+        """
+        Returns a dictionary with the event names as keys and the set of
+        station ids (``NET.STA``) with data of the given type as values.
+
+        :param data_type: The data type.
+        :param tag: The processing tag or the long iteration name.
+        """
+        stations = collections.defaultdict(set)
+        for event, network, station in self.db_cursor.execute(
+                "SELECT DISTINCT event, network, station FROM waveforms "
+                "WHERE data_type = ? AND tag = ?;", (data_type, tag or "")):
+            stations[event].add("%s.%s" % (network, station))
+        return dict(stations)
@@ -14,7 +14,13 @@ Useful for ray-density plots.
 from collections import namedtuple
 import numpy as np
 
-from lasif.utils import greatcircle_points
+from lasif.utils import greatcircle_points_flat
+
+
+# Approximate number of points sampled and binned at once when adding many
+# great circles. Limits the memory usage. The great circles are handed to
+# the workers of the parallel backends in chunks of that size.
+CHUNK_NPTS = 2000000
 
 
 class Range(namedtuple("Range", ["min", "max", "count"])):
@@ -40,24 +46,263 @@ class GreatCircleBinner(object):
         """
         Adds a single point an increments the value at that point by one.
         """
+        self.add_points([point.lat], [point.lng])
+
+    def add_points(self, lats, lngs):
+        """
+        Adds any number of points and increments the value at each of them
+        by one.
+
+        :param lats: The latitudes of the points.
+        :param lngs: The longitudes of the points.
+        """
+        counts = np.bincount(self._get_bin_indices(lats, lngs),
+                             minlength=self.bins.size)
+        self.bins += counts.reshape(self.bins.shape).astype(self.bins.dtype)
+
+    def _get_bin_indices(self, lats, lngs):
+        """
+        Returns the indices of the bins of all points inside the range in
+        the flattened bins array.
+        """
+        lats = np.asarray(lats, dtype=np.float64)
+        lngs = np.asarray(lngs, dtype=np.float64)
+
         # Skip points outside of the range.
-        if not (self.lngs.min <= point.lng <= self.lngs.max) or \
-                not (self.lats.min <= point.lat <= self.lats.max):
-            return
+        mask = (self.lngs.min <= lngs) & (lngs <= self.lngs.max) & \
+            (self.lats.min <= lats) & (lats <= self.lats.max)
+        lats = lats[mask]
+        lngs = lngs[mask]
 
-        lng_index = int(round(((point.lng - self.lngs.min) / self.lngs.range) *
-                              (self.lngs.count - 1)))
-        lat_index = int(round(((point.lat - self.lats.min) / self.lats.range) *
-                              (self.lats.count - 1)))
-        self.bins[lng_index, lat_index] += 1
+        # Round half up, the indices are never negative.
+        lng_index = np.floor((lngs - self.lngs.min) / self.lngs.range *
+                             (self.lngs.count - 1) + 0.5).astype(np.int64)
+        lat_index = np.floor((lats - self.lats.min) / self.lats.range *
+                             (self.lats.count - 1) + 0.5).astype(np.int64)
+        return lng_index * self.lats.count + lat_index
 
     def add_greatcircle(self, point_1, point_2, max_npts=3000):
-        for point in greatcircle_points(point_1, point_2, self.max_range,
-                                        max_npts):
-            self.add_point(point)
+        self.add_greatcircles([point_1.lat], [point_1.lng], [point_2.lat],
+                              [point_2.lng], max_npts=max_npts)
+
+    def add_greatcircles(self, lats_1, lngs_1, lats_2, lngs_2,
+                         max_npts=3000, backend="serial", processes=None,
+                         progress_callback=None):
+        """
+        Adds any number of great circles, each from point 1 to point 2.
+
+        The great circles are binned in chunks of about ``CHUNK_NPTS``
+        points. Each chunk results in a sparse histogram which is added to
+        the bins as soon as it arrives so the work can be distributed with
+        any backend of :func:`~lasif.tools.parallel_helpers.imap_unordered`.
+        With the MPI backend, this has to be called on all ranks and only
+        the bins on rank 0 will contain the great circles.
+
+        :param lats_1: The latitudes of the first points.
+        :param lngs_1: The longitudes of the first points.
+        :param lats_2: The latitudes of the second points.
+        :param lngs_2: The longitudes of the second points.
+        :param max_npts: The number of points of a great circle as long as
+            the larger extent of the binned region.
+        :param backend: The parallel backend.
+        :param processes: The number of processes for the multiprocessing
+            backend. Defaults to the number of CPUs.
+        :param progress_callback: Called with the number of binned and the
+            total number of great circles after each chunk.
+        """
+        from lasif.tools.parallel_helpers import imap_unordered
+
+        coordinates = np.empty((len(lats_1), 4), dtype=np.float64)
+        for _i, values in enumerate((lats_1, lngs_1, lats_2, lngs_2)):
+            coordinates[:, _i] = values
+
+        def _bin_chunk(chunk):
+            return len(chunk), self._get_histogram(chunk, max_npts)
+
+        done = 0
+        for count, histogram in imap_unordered(
+                _bin_chunk, _split_greatcircles(coordinates, max_npts),
+                backend=backend, processes=processes):
+            self.add_histogram(*histogram)
+            done += count
+            if progress_callback is not None:
+                progress_callback(done, len(coordinates))
+        return self.bins
+
+    def add_histogram(self, indices, counts):
+        """
+        Adds a sparse histogram to the bins.
+
+        :param indices: The unique indices of the bins in the flattened bins
+            array.
+        :param counts: The values added to these bins.
+        """
+        self.bins[np.unravel_index(indices, self.bins.shape)] += \
+            np.require(counts, dtype=self.bins.dtype)
+
+    def _get_histogram(self, coordinates, max_npts):
+        """
+        Bins great circles and returns the resulting sparse histogram as
+        accepted by :meth:`add_histogram`.
+
+        :param coordinates: Array with the latitudes and longitudes of the
+            first and second points of each great circle as its columns.
+        """
+        counts = np.bincount(
+            self._get_bin_indices(*greatcircle_points_flat(
+                coordinates[:, 0], coordinates[:, 1], coordinates[:, 2],
+                coordinates[:, 3], max_extension=self.max_range,
+                max_npts=max_npts)),
+            minlength=self.bins.size)
+        indices = np.flatnonzero(counts)
+        return indices, counts[indices].astype(self.bins.dtype)
 
     @property
     def coordinates(self):
         return np.meshgrid(
             np.linspace(self.lngs.min, self.lngs.max, self.lngs.count),
             np.linspace(self.lats.min, self.lats.max, self.lats.count))
+
+
+def _split_greatcircles(coordinates, max_npts):
+    """
+    Splits the coordinates of great circles into chunks of about
+    ``CHUNK_NPTS`` points.
+    """
+    step = max(1, CHUNK_NPTS // max_npts)
+    return [coordinates[_i: _i + step]
+            for _i in xrange(0, len(coordinates), step)]
+
+
+def _merge_histograms(histograms, size):
+    """
+    Merges any number of sparse histograms of bins arrays of the given size
+    into a single one.
+    """
+    if len(histograms) == 1:
+        return histograms[0]
+    counts = np.bincount(
+        np.concatenate([_i[0] for _i in histograms]),
+        weights=np.concatenate([_i[1] for _i in histograms]),
+        minlength=size)
+    indices = np.flatnonzero(counts)
+    return indices, counts[indices].astype(histograms[0][1].dtype)
+
+
+def calculate_raydensity(station_events, domain, lat_lng_count=None,
+                         backend="multiprocessing", processes=None,
+                         progress_callback=None, cache=None, max_npts=3000):
+    """
+    Bins the great circles of all event-station pairs in a domain.
+
+    Returns the :class:`GreatCircleBinner` with the binned great circles.
+    The bins and their coordinates are given in the unrotated domain. With
+    the MPI backend, this has to be called on all ranks and only the bins
+    returned on rank 0 contain the great circles.
+
+    :param station_events: List of ``(event, stations)`` tuples. ``event``
+        is a dictionary with at least the ``"latitude"`` and ``"longitude"``
+        keys and ``stations`` a dictionary of such dictionaries.
+    :param domain: The domain.
+    :type domain: :class:`~lasif.domain.RectangularSphericalSection`
+    :param lat_lng_count: The number of bins along both axes. Defaults to
+        a value depending on the number of great circles.
+    :param backend: The parallel backend. See
+        :func:`~lasif.tools.parallel_helpers.imap_unordered`.
+    :param processes: The number of processes for the multiprocessing
+        backend. Defaults to the number of CPUs.
+    :param progress_callback: Called with the number of binned and the
+        total number of great circles.
+    :param cache: If given, the bins of each event are read from it if
+        possible and otherwise calculated and written to it. The events
+        then also need the ``"event_name"`` key.
+    :type cache: :class:`~lasif.tools.raydensity_cache.RaydensityCache`
+    :param max_npts: The number of points of a great circle as long as
+        the larger extent of the domain.
+    """
+    from lasif.tools.parallel_helpers import imap_unordered
+
+    coordinates = [_get_coordinates(event, stations, domain)
+                   for event, stations in station_events]
+    total = sum(len(_i) for _i in coordinates)
+
+    # The granularity of the latitude/longitude discretization for the
+    # raypaths. Attempt to get a somewhat meaningful result in any case.
+    if lat_lng_count is None:
+        if total < 10000:
+            lat_lng_count = 2000
+        else:
+            lat_lng_count = 3000
+
+    binner = GreatCircleBinner(
+        domain.min_latitude, domain.max_latitude, lat_lng_count,
+        domain.min_longitude, domain.max_longitude, lat_lng_count)
+
+    # Only bin the events which are not cached. The histograms of the
+    # chunks of each of these events are collected until all have arrived
+    # so the events can be cached.
+    chunks = []
+    pending = {}
+    done = 0
+    for _i, (event, stations) in enumerate(station_events):
+        if not len(coordinates[_i]):
+            continue
+        histogram = None
+        if cache is not None:
+            histogram = cache.load(event, stations, domain, lat_lng_count,
+                                   max_npts)
+        if histogram is not None:
+            binner.add_histogram(*histogram)
+            done += len(coordinates[_i])
+            continue
+        event_chunks = _split_greatcircles(coordinates[_i], max_npts)
+        pending[_i] = (len(event_chunks), [])
+        chunks.extend((_i, _j) for _j in event_chunks)
+
+    if done and progress_callback is not None:
+        progress_callback(done, total)
+
+    def _bin_chunk(item):
+        return item[0], len(item[1]), binner._get_histogram(item[1],
+                                                            max_npts)
+
+    for _i, count, histogram in imap_unordered(
+            _bin_chunk, chunks, backend=backend, processes=processes):
+        binner.add_histogram(*histogram)
+        done += count
+        if progress_callback is not None:
+            progress_callback(done, total)
+
+        if cache is None:
+            continue
+        chunk_count, histograms = pending[_i]
+        histograms.append(histogram)
+        if len(histograms) == chunk_count:
+            event, stations = station_events[_i]
+            cache.save(event, stations, domain, lat_lng_count, max_npts,
+                       _merge_histograms(histograms, binner.bins.size))
+            del pending[_i]
+    return binner
+
+
+def _get_coordinates(event, stations, domain):
+    """
+    Returns an array with the latitudes and longitudes of the event and
+    each station as its four columns. They are rotated to the unrotated
+    domain if necessary.
+    """
+    from lasif import rotations
+
+    coordinates = np.array(
+        [(event["latitude"], event["longitude"], _i["latitude"],
+          _i["longitude"]) for _i in stations.itervalues()],
+        dtype=np.float64).reshape((-1, 4))
+
+    if domain.rotation_angle_in_degree:
+        for _i in (0, 2):
+            coordinates[:, _i], coordinates[:, _i + 1] = \
+                rotations.rotate_lat_lon_array(
+                    coordinates[:, _i], coordinates[:, _i + 1],
+                    domain.rotation_axis,
+                    -1.0 * domain.rotation_angle_in_degree)
+    return coordinates
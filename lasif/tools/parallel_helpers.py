@@ -1,8 +1,9 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 """
-Helpers for embarrassingly parallel calculations using MPI. All functions
-works just fine when running on one core and not started with MPI.
+Helpers for embarrassingly parallel calculations using MPI or a local pool
+of processes. All functions works just fine when running on one core and not
+started with MPI.
 
 :copyright:
     Lion Krischer (krischer@geophysik.uni-muenchen.de), 2014-2015
@@ -12,9 +13,10 @@ works just fine when running on one core and not started with MPI.
 """
 import collections
 import colorama
+import cPickle
 import functools
 import inspect
-import itertools
+import multiprocessing
 import os
 import sys
 import traceback
@@ -23,6 +25,50 @@ import warnings
 from mpi4py import MPI
 
 
+# The available backends for distribute_across_ranks(). "auto" uses MPI if
+# launched with more than one MPI process and otherwise runs serially.
+BACKENDS = ["auto", "serial", "multiprocessing", "mpi"]
+
+# Upper limit for the number of items handed to a worker of the
+# multiprocessing backend at once. Smaller chunks balance the load better.
+POOL_MAX_CHUNKSIZE = 10
+
+# The function executed by the workers of the multiprocessing backend. It is
+# set before the workers are forked and thus does not have to be pickled
+# which does not work for the dynamically loaded project specific functions.
+_POOL_FUNCTION = None
+
+# Upper limit for the number of items handed to an MPI worker at once. The
+# chunks get smaller towards the end so all ranks finish at about the same
+# time.
+MPI_MAX_CHUNKSIZE = 10
+
+# Up to this many MPI ranks, rank 0 also processes items in between handing
+# out work to the other ranks. With more ranks it exclusively serves the
+# workers so they never wait for it.
+MPI_WORKING_MASTER_MAX_RANKS = 3
+
+# Tags of the messages exchanged between the MPI master and its workers.
+_TAG_RESULTS = 1
+_TAG_WORK = 2
+
+# Sent by the MPI master instead of a chunk of items if any rank raised.
+_ABORT = "abort"
+
+
+class _MPIWorkerFailure(object):
+    """
+    Sent by an MPI worker instead of its results if the function raised.
+    The exception is replaced if it cannot be pickled.
+    """
+    def __init__(self, exception):
+        try:
+            cPickle.dumps(exception, protocol=2)
+        except Exception:
+            exception = RuntimeError(repr(exception))
+        self.exception = exception
+
+
 class FunctionInfo(collections.namedtuple(
     "FunctionInfo", ["func_args", "result", "warnings", "exception",
                      "traceback"])):
@@ -124,11 +170,53 @@ def _execute_wrapped_function(func, parameters):
     return function_info()(func)(**parameters)
 
 
-def distribute_across_ranks(function, items, get_name, logfile):
+def _execute_and_log(func, get_name, keep_result, parameters):
+    """
+    Executes the wrapped function for a single item and already formats its
+    logfile entry so only that has to be sent back if the result is not
+    kept.
+
+    Returns a tuple with the FunctionInfo, or None if ``keep_result`` is
+    False, and the logfile entry.
+    """
+    result = _execute_wrapped_function(func, parameters)
+    entry = _format_log_entry(result, get_name)
+    return (result if keep_result else None), entry
+
+
+def _execute_pool_function(item):
+    """
+    Executes the function of the multiprocessing backend for a single item.
+    """
+    return _POOL_FUNCTION(item)
+
+
+def get_backend(backend="auto"):
+    """
+    Returns the name of the backend that will actually be used.
+
+    :param backend: One of the names in ``BACKENDS``. ``"auto"`` or
+        ``None`` result in ``"mpi"`` if launched with more than one MPI
+        process and ``"serial"`` otherwise.
+    """
+    if backend is None or backend == "auto":
+        return "mpi" if MPI.COMM_WORLD.size > 1 else "serial"
+    if backend not in BACKENDS:
+        raise ValueError("Backend '%s' not known. Available backends: %s" % (
+            backend, ", ".join(BACKENDS)))
+    return backend
+
+
+def distribute_across_ranks(function, items, get_name, logfile,
+                            backend="auto", processes=None, stream=False,
+                            resume_from=None):
     """
     Calls a function once for each item.
 
-    It will be distributed across MPI ranks if launched with MPI.
+    It will be distributed across MPI ranks if launched with MPI or across a
+    pool of local processes if the multiprocessing backend is chosen. The
+    results are appended to the logfile as soon as they arrive on rank 0 so
+    the logfile is complete up to the point of failure if a run dies.
 
     :param function: The function to be executed for each item.
     :param items: The function will be executed once for each item. It
@@ -138,90 +226,319 @@ def distribute_across_ranks(function, items, get_name, logfile):
     :param get_name: Function to extract a name for each item to be able to
         produce better logfiles.
     :param logfile: The logfile to write.
+    :param backend: The backend used to execute the function. One of
+        ``"auto"``, ``"serial"``, ``"multiprocessing"``, and ``"mpi"``. All
+        but the MPI backend only run on rank 0.
+    :param processes: The number of processes for the multiprocessing
+        backend. Defaults to the number of CPUs.
+    :param stream: If True, the results are not kept in memory. Only their
+        logfile entries are sent back to rank 0 and None is returned.
+    :param resume_from: The logfile of a previous, possibly incomplete,
+        run. Items that have been processed successfully or with warnings in
+        that run are skipped and their entries are copied to the new
+        logfile. Failed items are processed again. May be the same file as
+        ``logfile``.
     """
-    def split(container, count):
-        """
-        Simple and elegant function splitting a container into count
-        equal chunks.
-
-        Order is not preserved but for the use case at hand this is
-        potentially an advantage as data sitting in the same folder thus
-        have a higher at being processed at the same time thus the disc
-        head does not have to jump around so much. Of course very
-        architecture dependent.
-        """
-        return [container[_i::count] for _i in range(count)]
-
-    # Rank zero collects what needs to be done and distributes it across
-    # all cores.
-    if MPI.COMM_WORLD.rank == 0:
-        total_length = len(items)
-        items = split(items, MPI.COMM_WORLD.size)
-    else:
-        items = None
+    backend = get_backend(backend)
 
-    # Now each rank knows what it has to process. This still works
-    # nicely with only one core, the overhead is negligible.
-    items = MPI.COMM_WORLD.scatter(items, root=0)
+    if MPI.COMM_WORLD.rank == 0:
+        previous_entries = []
+        if resume_from and os.path.exists(resume_from):
+            previous_entries = [
+                _i for _i in _read_logfile(resume_from) if _i[1] != "failed"]
+            finished = set(_i[0] for _i in previous_entries)
+            items = [_i for _i in items if get_name(
+                inspect.getcallargs(function, **_i)) not in finished]
+
+    task = functools.partial(_execute_and_log, function, get_name,
+                             not stream)
+    outputs = imap_unordered(task, items, backend=backend,
+                             processes=processes)
+
+    # Nothing arrives on the other ranks.
+    if MPI.COMM_WORLD.rank != 0:
+        for _ in outputs:
+            pass
+        return
 
     results = []
+    counts = collections.Counter()
+    with open(logfile, "wt") as fh:
+        for entry in previous_entries:
+            fh.write(entry[2])
+            counts[entry[1]] += 1
+        fh.flush()
+
+        for result, entry in outputs:
+            fh.write(entry[2])
+            fh.flush()
+            counts[entry[1]] += 1
+            if not stream:
+                results.append(result)
+            print("Processed %i of %i items (%i failed, %i with warnings)." % (
+                sum(counts.values()), len(items) + len(previous_entries),
+                counts["failed"], counts["warning"]))
+
+    _print_summary(counts, logfile)
+
+    if stream:
+        return
+    return results
 
-    for _i, item in enumerate(items):
-        results.append(_execute_wrapped_function(function, item))
 
-        if MPI.COMM_WORLD.rank == 0:
-            print("Approximately %i of %i items have been processed." % (
-                min((_i + 1) * MPI.COMM_WORLD.size, total_length),
-                total_length))
+def imap_unordered(function, items, backend="auto", processes=None):
+    """
+    Calls ``function(item)`` for each item with the chosen backend and
+    yields the results on rank 0 in the order they arrive.
+
+    In contrast to :func:`distribute_across_ranks` the function is neither
+    wrapped nor are its results logged so it should not raise. An exception
+    stops the whole calculation and is raised on rank 0. It must be
+    available on all ranks respectively in all processes; the items and
+    results must be picklable.
+
+    Has to be called on all ranks if the MPI backend is used. All other
+    backends only run on rank 0. Nothing is yielded on the other ranks.
+
+    :param function: Function called with a single item.
+    :param items: The items. Only rank 0 needs to pass them.
+    :param backend: The backend. See :func:`distribute_across_ranks`.
+    :param processes: The number of processes for the multiprocessing
+        backend. Defaults to the number of CPUs.
+    """
+    backend = get_backend(backend)
 
-    results = MPI.COMM_WORLD.gather(results, root=0)
+    if backend == "mpi":
+        return mpi_imap_unordered(function, items)
+    elif MPI.COMM_WORLD.rank != 0:
+        return iter([])
+    elif backend == "multiprocessing" and \
+            (processes or multiprocessing.cpu_count()) > 1:
+        return _imap_pool(function, items, processes)
+    return (function(_i) for _i in items)
 
-    if MPI.COMM_WORLD.rank != 0:
+
+def _imap_pool(function, items, processes=None):
+    """
+    Executes the function for all items on a pool of local processes and
+    yields the results in the order they arrive.
+
+    The items are handed out in small chunks to whichever worker is idle.
+    """
+    global _POOL_FUNCTION
+
+    processes = processes or multiprocessing.cpu_count()
+    chunksize = max(1, min(POOL_MAX_CHUNKSIZE,
+                           len(items) // (4 * processes)))
+
+    _POOL_FUNCTION = function
+    pool = multiprocessing.Pool(processes=processes)
+    try:
+        for result in pool.imap_unordered(_execute_pool_function, items,
+                                          chunksize=chunksize):
+            yield result
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+        _POOL_FUNCTION = None
+
+
+def _get_chunksize(remaining, workers):
+    """
+    Size of the next chunk of items handed to an MPI worker. Decreases with
+    the number of remaining items.
+
+    >>> _get_chunksize(1000, 4)
+    10
+    >>> _get_chunksize(50, 4)
+    3
+    >>> _get_chunksize(3, 4)
+    1
+    """
+    return max(1, min(MPI_MAX_CHUNKSIZE, remaining // (4 * workers)))
+
+
+def mpi_imap_unordered(function, items):
+    """
+    Dynamically distributes ``function(item)`` for each item across all MPI
+    ranks and yields the results on rank 0 in the order they arrive.
+
+    Rank 0 is the master. It hands out small chunks of items to the other
+    ranks whenever they ask for more work and collects the results of the
+    previous chunk with each request. Thus slow items do not hold up the
+    rest of the work as they would with a static split. Runs serially if
+    not launched with MPI.
+
+    Has to be called on all ranks. The function must be available on all
+    ranks; the items and results must be picklable. Nothing is yielded on
+    ranks other than 0.
+
+    If the function raises on any rank, no further items are handed out,
+    all workers are stopped, and the exception is raised on rank 0 as well
+    as on the rank it occurred on. All other ranks raise a
+    ``RuntimeError`` so no rank waits forever for the others, e.g. in a
+    barrier.
+
+    :param function: Function called with a single item.
+    :param items: The items. Only rank 0 needs to pass them, they are
+        ignored on all other ranks.
+    """
+    comm = MPI.COMM_WORLD
+
+    if comm.size == 1:
+        for item in items:
+            yield function(item)
         return
 
-    results = list(itertools.chain.from_iterable(results))
+    # Workers ask for work and send the results of the previous chunk.
+    if comm.rank != 0:
+        results = []
+        failure = None
+        while True:
+            comm.send(results, dest=0, tag=_TAG_RESULTS)
+            chunk = comm.recv(source=0, tag=_TAG_WORK)
+            if chunk is None:
+                break
+            elif chunk == _ABORT:
+                if failure is not None:
+                    raise failure
+                raise RuntimeError("Stopped as another MPI rank raised an "
+                                   "exception.")
+            try:
+                results = [function(item) for item in chunk]
+            except Exception as e:
+                # Rank 0 re-raises the exception but the traceback is
+                # only available here.
+                traceback.print_exc()
+                failure = e
+                results = _MPIWorkerFailure(e)
+        return
 
-    successful_file_count = 0
-    warning_file_count = 0
-    failed_file_count = 0
-    total_file_count = len(results)
+    items = list(items)
+    index = 0
+    workers = comm.size - 1
+    master_works = comm.size <= MPI_WORKING_MASTER_MAX_RANKS
+    status = MPI.Status()
+    # Workers without any more work. They are only released once all
+    # results are in so they can still be stopped if any rank raises.
+    idle = []
+
+    while len(idle) < workers:
+        # Process a single item while no worker is waiting.
+        if master_works and index < len(items) and not comm.Iprobe(
+                source=MPI.ANY_SOURCE, tag=_TAG_RESULTS):
+            index += 1
+            try:
+                result = function(items[index - 1])
+            except Exception:
+                _abort_mpi_workers(comm, workers - len(idle), idle)
+                raise
+            yield result
+            continue
+
+        results = comm.recv(source=MPI.ANY_SOURCE, tag=_TAG_RESULTS,
+                            status=status)
+        if isinstance(results, _MPIWorkerFailure):
+            idle.append(status.Get_source())
+            _abort_mpi_workers(comm, workers - len(idle), idle)
+            raise results.exception
+
+        chunksize = _get_chunksize(len(items) - index, comm.size)
+        chunk = items[index:index + chunksize]
+        index += len(chunk)
+        if chunk:
+            comm.send(chunk, dest=status.Get_source(), tag=_TAG_WORK)
+        else:
+            idle.append(status.Get_source())
 
-    # Log the results.
-    with open(logfile, "wt") as fh:
         for result in results:
-            fh.write("\n============\nItem: %s" % get_name(result.func_args))
-            has_exception = False
-            has_warning = False
-            if result.exception:
-                has_exception = True
-                fh.write("\n")
-                fh.write(result.traceback)
-            elif result.warnings:
-                has_warning = True
-                for w in result.warnings:
-                    fh.write("\nWarning: %s\n" % str(w))
-            else:
-                fh.write(" - SUCCESS")
-
-            if has_exception:
-                failed_file_count += 1
-            elif has_warning:
-                warning_file_count += 1
-            else:
-                successful_file_count += 1
-
-        print("\nFinished processing %i items. See the logfile for "
-              "details.\n" % total_file_count)
-        print("\t%s%i files failed being processed.%s" %
-              (colorama.Fore.RED, failed_file_count,
-               colorama.Fore.RESET))
-        print("\t%s%i files raised warnings while being processed.%s" %
-              (colorama.Fore.YELLOW, warning_file_count,
-               colorama.Fore.RESET))
-        print("\t%s%i files have been processed without errors or warnings%s" %
-              (colorama.Fore.GREEN, successful_file_count,
-               colorama.Fore.RESET))
-
-        print("\nLogfile written to '%s'." % os.path.relpath(logfile))
+            yield result
 
-    return results
+    for rank in idle:
+        comm.send(None, dest=rank, tag=_TAG_WORK)
+
+
+def _abort_mpi_workers(comm, busy, idle):
+    """
+    Tells all MPI workers to stop. The idle ones right away, the given
+    number of busy ones once they ask for more work.
+    """
+    for rank in idle:
+        comm.send(_ABORT, dest=rank, tag=_TAG_WORK)
+    status = MPI.Status()
+    for _ in range(busy):
+        comm.recv(source=MPI.ANY_SOURCE, tag=_TAG_RESULTS, status=status)
+        comm.send(_ABORT, dest=status.Get_source(), tag=_TAG_WORK)
+
+
+def _format_log_entry(result, get_name):
+    """
+    Formats the logfile entry of a single result.
+
+    Returns a tuple with the name of the item, its status (``"success"``,
+    ``"warning"``, or ``"failed"``), and the text of the entry.
+    """
+    name = get_name(result.func_args)
+    text = "\n============\nItem: %s" % name
+    if result.exception:
+        status = "failed"
+        text += "\n"
+        text += result.traceback
+    elif result.warnings:
+        status = "warning"
+        for w in result.warnings:
+            text += "\nWarning: %s\n" % str(w)
+    else:
+        status = "success"
+        text += " - SUCCESS"
+    return name, status, text
+
+
+def _read_logfile(logfile):
+    """
+    Reads the entries of a logfile written by distribute_across_ranks().
+
+    Returns a list of tuples just like the ones returned by
+    _format_log_entry(). An entry cut off by a dying run does not carry a
+    success marker and thus counts as failed.
+    """
+    separator = "\n============\nItem: "
+    with open(logfile, "rt") as fh:
+        content = fh.read()
+
+    entries = []
+    for text in content.split(separator)[1:]:
+        first_line, _, rest = text.partition("\n")
+        if first_line.endswith(" - SUCCESS") and not rest:
+            name = first_line[:-len(" - SUCCESS")]
+            status = "success"
+        elif rest.startswith("Warning: "):
+            name = first_line
+            status = "warning"
+        else:
+            name = first_line
+            status = "failed"
+        entries.append((name, status, separator + text))
+    return entries
+
+
+def _print_summary(counts, logfile):
+    """
+    Prints a summary of the outcome counts.
+    """
+    print("\nFinished processing %i items. See the logfile for "
+          "details.\n" % sum(counts.values()))
+    print("\t%s%i files failed being processed.%s" %
+          (colorama.Fore.RED, counts["failed"],
+           colorama.Fore.RESET))
+    print("\t%s%i files raised warnings while being processed.%s" %
+          (colorama.Fore.YELLOW, counts["warning"],
+           colorama.Fore.RESET))
+    print("\t%s%i files have been processed without errors or warnings%s" %
+          (colorama.Fore.GREEN, counts["success"],
+           colorama.Fore.RESET))
+
+    print("\nLogfile written to '%s'." % os.path.relpath(logfile))
@@ -114,14 +114,17 @@ def add_new_events(comm, count, min_magnitude, max_magnitude, min_year=None,
     # Filtering catalog to only contain events in the domain.
     print("Filtering to only include events inside domain...")
     # Coordinates and the Catalog will have the same order!
+    origins = [_i.preferred_origin() or _i.origins[0] for _i in cat]
+    all_coordinates = [(_i.latitude, _i.longitude) for _i in origins]
+    in_domain = comm.query.points_in_domain(
+        [_i[0] for _i in all_coordinates], [_i[1] for _i in all_coordinates])
     temp_cat = Catalog()
     coordinates = []
-    for event in cat:
-        org = event.preferred_origin() or event.origins[0]
-        if not comm.query.point_in_domain(org.latitude, org.longitude):
+    for event, coods, is_in_domain in zip(cat, all_coordinates, in_domain):
+        if not is_in_domain:
             continue
         temp_cat.events.append(event)
-        coordinates.append((org.latitude, org.longitude))
+        coordinates.append(coods)
     cat = temp_cat
 
     chosen_events = []
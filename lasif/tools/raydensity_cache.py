@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+On-disc cache of the binned raypaths of single events.
+
+Binning the great circles of all event-station pairs is by far the most
+expensive part of a ray density plot. The binned raypaths of each event
+are thus stored in the project's cache folder and the ray density of the
+whole project is just their sum. Adding an event only requires binning the
+raypaths of that event. Events whose location or stations change, as well
+as changes of the domain and the grid, result in a different key and are
+thus automatically binned again.
+
+:copyright:
+    Lion Krischer (krischer@geophysik.uni-muenchen.de), 2015
+:license:
+    GNU General Public License, Version 3
+    (http://www.gnu.org/copyleft/gpl.html)
+"""
+import glob
+import hashlib
+import numpy as np
+import os
+import warnings
+
+from lasif.utils import atomic_write
+
+
+# Version of the cached bins. Increment it to invalidate all existing
+# caches if the way the raypaths are binned changes.
+RAYDENSITY_CACHE_VERSION = 1
+
+
+class RaydensityCache(object):
+    """
+    Stores the binned raypaths of single events as sparse histograms.
+
+    Each event has its own subfolder containing only the histogram for its
+    current stations, domain, and grid. Outdated histograms are removed
+    when a new one is written. The histograms are written to a temporary
+    file which is then renamed so any number of processes can use the same
+    cache folder at the same time.
+
+    :param folder: The folder storing the histograms. Nothing is cached if
+        None.
+    :param read_only: If True, existing histograms are used but no new ones
+        are written.
+    """
+    def __init__(self, folder, read_only=False):
+        self.folder = folder
+        self.read_only = read_only
+
+    def load(self, event, stations, domain, lat_lng_count, max_npts):
+        """
+        Returns the cached sparse histogram of an event as an
+        ``(indices, counts)`` tuple or None if it is not cached.
+
+        :param event: Dictionary with at least the ``"event_name"``,
+            ``"latitude"``, and ``"longitude"`` keys.
+        :param stations: Dictionary of dictionaries with at least the
+            ``"latitude"`` and ``"longitude"`` keys, keyed by station id.
+        :param domain: The domain.
+        :param lat_lng_count: The number of bins along both axes.
+        :param max_npts: The number of points of a great circle as long as
+            the larger extent of the domain.
+        """
+        filename = self._get_filename(event, stations, domain, lat_lng_count,
+                                      max_npts)
+        if not filename:
+            return None
+        try:
+            with open(filename, "rb") as fh:
+                data = np.load(fh)
+                return data["indices"], data["counts"]
+        except (IOError, OSError, ValueError, KeyError):
+            return None
+
+    def save(self, event, stations, domain, lat_lng_count, max_npts,
+             histogram):
+        """
+        Caches the sparse histogram of an event. See :meth:`load` for the
+        parameters.
+
+        :param histogram: ``(indices, counts)`` tuple as accepted by
+            :meth:`~lasif.tools.great_circle_binner.GreatCircleBinner
+            .add_histogram`.
+        """
+        filename = self._get_filename(event, stations, domain, lat_lng_count,
+                                      max_npts)
+        if not filename or self.read_only:
+            return
+        # Failing to cache a histogram must not fail the ray density plot.
+        try:
+            self._write_histogram(filename, histogram)
+        except (IOError, OSError) as e:
+            warnings.warn("Could not write cached ray density histogram "
+                          "'%s': %s" % (filename, str(e)))
+            return
+
+        # Remove outdated histograms of the same event.
+        for other in glob.glob(os.path.join(os.path.dirname(filename),
+                                            "*" + os.path.extsep + "npz")):
+            if other != filename:
+                try:
+                    os.remove(other)
+                except OSError:
+                    pass
+
+    def _get_filename(self, event, stations, domain, lat_lng_count,
+                      max_npts):
+        """
+        Returns the filename of a cached histogram or None if nothing is
+        cached.
+
+        The name is derived from everything the histogram depends on.
+        """
+        if not self.folder:
+            return None
+        key = repr((
+            RAYDENSITY_CACHE_VERSION,
+            float(event["latitude"]), float(event["longitude"]),
+            sorted((u"%s" % station_id, float(value["latitude"]),
+                    float(value["longitude"]))
+                   for station_id, value in stations.iteritems()),
+            float(domain.min_latitude), float(domain.max_latitude),
+            float(domain.min_longitude), float(domain.max_longitude),
+            tuple(float(_i) for _i in domain.rotation_axis),
+            float(domain.rotation_angle_in_degree),
+            int(lat_lng_count), int(max_npts)))
+        return os.path.join(
+            self.folder, event["event_name"],
+            hashlib.sha1(key.encode("utf-8")).hexdigest() +
+            os.path.extsep + "npz")
+
+    @staticmethod
+    def _write_histogram(filename, histogram):
+        """
+        Atomically writes a histogram to the cache.
+        """
+        indices, counts = histogram
+        with atomic_write(filename) as fh:
+            np.savez(fh, indices=np.require(indices, dtype=np.int64),
+                     counts=counts)
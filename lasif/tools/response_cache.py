@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+On-disc cache of the spectra used to remove instrument responses.
+
+All traces of a channel epoch that are processed with the same parameters
+need the same frequency response. Evaluating it is usually much more
+expensive than the actual deconvolution so the final deconvolution spectrum,
+including the pre-filter and the water level, is only calculated once and
+stored in the project's cache folder. Subsequent corrections of any event
+recorded during the same channel epoch are then just two FFTs.
+
+:copyright:
+    Lion Krischer (krischer@geophysik.uni-muenchen.de), 2015
+:license:
+    GNU General Public License, Version 3
+    (http://www.gnu.org/copyleft/gpl.html)
+"""
+import hashlib
+import numpy as np
+import os
+import warnings
+
+from lasif import LASIFNotFoundError
+from lasif.file_handling import simple_resp_parser
+from lasif.utils import atomic_write, read_station_file
+
+
+# Version of the cached spectra. Increment it to invalidate all existing
+# caches if the way the spectra are calculated changes.
+RESPONSE_CACHE_VERSION = 1
+
+# The channel epochs of the station files read by the current process,
+# keyed by the filename and its modification time.
+_CHANNEL_EPOCHS = {}
+
+
+class ResponseCache(object):
+    """
+    Removes instrument responses with the help of cached deconvolution
+    spectra.
+
+    Instances are cheap to pickle and can thus be passed to the workers of
+    all parallel backends. The spectra are written to a temporary file which
+    is then renamed so any number of processes can use the same cache folder
+    at the same time.
+
+    :param folder: The folder storing the spectra. Nothing is cached if
+        None.
+    :param read_only: If True, existing spectra are used but no new ones
+        are written.
+    """
+    def __init__(self, folder, read_only=False):
+        self.folder = folder
+        self.read_only = read_only
+
+    def remove_response(self, tr, station_file, pre_filt, output_units,
+                        water_level):
+        """
+        Removes the instrument response of a trace in place.
+
+        Equivalent to ObsPy's instrument correction with ``zero_mean=False``
+        and ``taper=False``.
+
+        :param tr: The trace.
+        :param station_file: The SEED, RESP, or StationXML file with the
+            response of the trace's channel. The format is determined by the
+            folder the file is in, just as in LASIF's ``STATIONS`` folder.
+        :param pre_filt: The four corner frequencies of the cosine taper
+            applied in the frequency domain.
+        :param output_units: ``"DISP"``, ``"VEL"``, or ``"ACC"``.
+        :param water_level: The water level in dB used when inverting the
+            response.
+        """
+        npts = tr.stats.npts
+        nfft = get_nfft(npts)
+        spectrum = self.get_spectrum(
+            channel_id=tr.id, time=tr.stats.starttime,
+            station_file=station_file, delta=tr.stats.delta, nfft=nfft,
+            pre_filt=pre_filt, output_units=output_units,
+            water_level=water_level)
+
+        data = np.fft.rfft(np.require(tr.data, dtype=np.float64), n=nfft)
+        data *= spectrum
+        data[-1] = abs(data[-1]) + 0.0j
+        tr.data = np.fft.irfft(data, n=nfft)[:npts]
+
+    def get_spectrum(self, channel_id, time, station_file, delta, nfft,
+                     pre_filt, output_units, water_level):
+        """
+        Returns the deconvolution spectrum for the given channel at the
+        given time. It is read from the cache if possible and otherwise
+        calculated and cached.
+
+        The spectrum has ``nfft // 2 + 1`` samples and has to be multiplied
+        with the real FFT of the data.
+        """
+        filename = self._get_filename(channel_id, time, station_file, delta,
+                                      nfft, pre_filt, output_units,
+                                      water_level)
+        if filename:
+            try:
+                return np.load(filename)
+            except (IOError, OSError, ValueError):
+                pass
+
+        spectrum = calculate_spectrum(
+            channel_id=channel_id, time=time, station_file=station_file,
+            delta=delta, nfft=nfft, pre_filt=pre_filt,
+            output_units=output_units, water_level=water_level)
+
+        if filename and not self.read_only:
+            # Failing to cache the spectrum must not fail the correction.
+            try:
+                self._write_spectrum(filename, spectrum)
+            except (IOError, OSError) as e:
+                warnings.warn("Could not write cached response spectrum "
+                              "'%s': %s" % (filename, str(e)))
+        return spectrum
+
+    def _get_filename(self, channel_id, time, station_file, delta, nfft,
+                      pre_filt, output_units, water_level):
+        """
+        Returns the filename of a cached spectrum or None if nothing is
+        cached.
+
+        The name is derived from everything the spectrum depends on. The
+        channel epoch is used instead of the time so the spectrum is valid
+        for all events recorded during that epoch.
+        """
+        if not self.folder:
+            return None
+        station_file = os.path.abspath(station_file)
+        key = repr((
+            RESPONSE_CACHE_VERSION, station_file,
+            os.path.getmtime(station_file), os.path.getsize(station_file),
+            channel_id, get_channel_epoch(channel_id, time, station_file),
+            int(nfft), float(delta),
+            tuple(float(_i) for _i in pre_filt) if pre_filt else None,
+            output_units.upper(), float(water_level)))
+        return os.path.join(
+            self.folder, channel_id,
+            hashlib.sha1(key.encode("utf-8")).hexdigest() +
+            os.path.extsep + "npy")
+
+    @staticmethod
+    def _write_spectrum(filename, spectrum):
+        """
+        Atomically writes a spectrum to the cache.
+        """
+        with atomic_write(filename) as fh:
+            np.save(fh, spectrum)
+
+
+def get_nfft(npts):
+    """
+    Returns the number of samples of the FFTs used for the deconvolution.
+
+    Identical to the length used by ObsPy's instrument corrections, i.e.
+    at least twice the number of samples to avoid wrap around effects, so
+    the results do not change compared to them.
+
+    >>> get_nfft(1000)
+    2000
+    >>> get_nfft(1001)
+    2004
+    """
+    from obspy.signal.util import _npts2nfft
+    return int(_npts2nfft(npts))
+
+
+def get_channel_epoch(channel_id, time, station_file):
+    """
+    Returns the start and end of the epoch of a channel at a certain time as
+    timestamps. The end is None for open epochs.
+
+    :param channel_id: The id of the channel.
+    :param time: The time.
+    :param station_file: The SEED, RESP, or StationXML file.
+    """
+    station_file = os.path.abspath(station_file)
+    key = (station_file, os.path.getmtime(station_file))
+    if key not in _CHANNEL_EPOCHS:
+        _CHANNEL_EPOCHS[key] = _read_channel_epochs(station_file)
+
+    time = time.timestamp
+    for _id, start, end in _CHANNEL_EPOCHS[key]:
+        if _id == channel_id and start <= time and (end is None or
+                                                    end >= time):
+            return start, end
+    raise LASIFNotFoundError(
+        "No epoch for channel '%s' at %s in station file '%s'." % (
+            channel_id, time, station_file))
+
+
+def _read_channel_epochs(station_file):
+    """
+    Returns a list of (channel_id, start, end) tuples for all channel epochs
+    in a station file.
+    """
+    def timestamp(value):
+        return value.timestamp if value else None
+
+    if "/StationXML/" in station_file:
+        inv = read_station_file(station_file)
+        return [
+            ("%s.%s.%s.%s" % (network.code, station.code,
+                              channel.location_code, channel.code),
+             timestamp(channel.start_date), timestamp(channel.end_date))
+            for network in inv for station in network for channel in station]
+    elif "/RESP/" in station_file:
+        channels = simple_resp_parser.get_inventory(station_file,
+                                                    remove_duplicates=True)
+    else:
+        channels = read_station_file(station_file).get_inventory()[
+            "channels"]
+    return [(_i["channel_id"], timestamp(_i["start_date"]),
+             timestamp(_i["end_date"])) for _i in channels]
+
+
+def calculate_spectrum(channel_id, time, station_file, delta, nfft,
+                       pre_filt, output_units, water_level):
+    """
+    Calculates the deconvolution spectrum without any caching.
+
+    It is the inverted, water leveled frequency response multiplied with
+    the cosine taper of the pre-filter, thus exactly what ObsPy multiplies
+    the spectrum of the data with during an instrument correction.
+    """
+    from obspy.signal.invsim import cosine_sac_taper, evalresp, \
+        invert_spectrum
+
+    if "/StationXML/" in station_file:
+        response = read_station_file(station_file).get_response(
+            channel_id, time)
+        response, freqs = response.get_evalresp_response(
+            t_samp=delta, nfft=nfft, output=output_units)
+    else:
+        network, station, location, channel = channel_id.split(".")
+        if "/RESP/" in station_file:
+            resp_file = station_file
+        else:
+            # evalresp needs RESP files which have to be extracted from
+            # SEED files.
+            resp_files = dict(read_station_file(station_file).get_resp())
+            try:
+                resp_file = resp_files["RESP." + channel_id]
+            except KeyError:
+                raise LASIFNotFoundError(
+                    "No response for channel '%s' in station file '%s'." % (
+                        channel_id, station_file))
+            resp_file.seek(0, 0)
+        response, freqs = evalresp(
+            t_samp=delta, nfft=nfft, filename=resp_file, date=time,
+            station=station, channel=channel, network=network,
+            locid=location, units=output_units, freq=True)
+
+    invert_spectrum(response, water_level)
+    if pre_filt:
+        response *= cosine_sac_taper(freqs, flimit=pre_filt)
+    return np.require(response, dtype=np.complex64)
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Binary container of converted synthetics.
+
+Synthetics, especially the ASCII files written by SES3D, are costly to read
+and SES3D synthetics additionally have to be mapped to ZNE and possibly
+rotated each time they are used. The container stores the final waveforms
+of all stations of an event and an iteration as raw binary arrays in a
+single SQLite file so reading a station is a single indexed query.
+
+Each station is stored together with a fingerprint of everything its
+waveforms were derived from. Stations whose fingerprint does not match
+anymore are ignored so outdated waveforms are never returned.
+
+:copyright:
+    Lion Krischer (krischer@geophysik.uni-muenchen.de), 2015
+:license:
+    GNU General Public License, Version 3
+    (http://www.gnu.org/copyleft/gpl.html)
+"""
+import numpy as np
+import obspy
+import os
+import sqlite3
+
+
+# Version of the stored waveforms. Stations written with a different
+# version are ignored and overwritten.
+SYNTHETICS_STORE_VERSION = 1
+
+# Seconds a writer waits for a lock held by another process.
+STORE_TIMEOUT = 600.0
+
+
+class SyntheticsStore(object):
+    """
+    Store of the converted synthetics of an event and an iteration.
+
+    The connection is opened lazily and reopened in forked child processes
+    so instances can be passed to all parallel backends.
+
+    :param filename: The SQLite file. It will be created if necessary.
+    :param timeout: Seconds to wait for locks held by other processes.
+    """
+    def __init__(self, filename, timeout=STORE_TIMEOUT):
+        self.filename = filename
+        self.timeout = timeout
+        self.__connection = None
+        self.__pid = None
+
+    def __getstate__(self):
+        return {"filename": self.filename, "timeout": self.timeout}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    @property
+    def _conn(self):
+        """
+        Lazy init of the connection, once per process.
+        """
+        if self.__connection is not None and self.__pid == os.getpid():
+            return self.__connection
+
+        conn = sqlite3.connect(self.filename, timeout=self.timeout)
+        with conn:
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS stations(
+                station_id TEXT PRIMARY KEY,
+                version INTEGER,
+                fingerprint TEXT
+            );""")
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS traces(
+                station_id TEXT,
+                channel_id TEXT,
+                starttime REAL,
+                delta REAL,
+                dtype TEXT,
+                data BLOB,
+                PRIMARY KEY (station_id, channel_id)
+            );""")
+        self.__connection = conn
+        self.__pid = os.getpid()
+        return conn
+
+    def __contains__(self, station_id):
+        return self._get_fingerprint(station_id) is not None
+
+    def __len__(self):
+        return self._conn.execute("""
+        SELECT COUNT(*) FROM stations WHERE version = ?;
+        """, (SYNTHETICS_STORE_VERSION,)).fetchone()[0]
+
+    def _get_fingerprint(self, station_id):
+        row = self._conn.execute("""
+        SELECT fingerprint FROM stations
+        WHERE station_id = ? AND version = ?
+        LIMIT 1;
+        """, (station_id, SYNTHETICS_STORE_VERSION)).fetchone()
+        return row[0] if row else None
+
+    def get_stations(self):
+        """
+        Returns the sorted ids of all stored stations.
+        """
+        return [_i[0] for _i in self._conn.execute("""
+        SELECT station_id FROM stations WHERE version = ?
+        ORDER BY station_id;
+        """, (SYNTHETICS_STORE_VERSION,))]
+
+    def get_stream(self, station_id, fingerprint=None):
+        """
+        Returns the waveforms of a station as a
+        :class:`~obspy.core.stream.Stream` object or None if the station is
+        not stored.
+
+        :param station_id: The id of the station in the form ``NET.STA``.
+        :param fingerprint: If given, None is also returned if the station
+            has been stored with a different fingerprint.
+        """
+        stored_fingerprint = self._get_fingerprint(station_id)
+        if stored_fingerprint is None or (
+                fingerprint is not None and
+                stored_fingerprint != fingerprint):
+            return None
+
+        st = obspy.Stream()
+        for channel_id, starttime, delta, dtype, data in \
+                self._conn.execute("""
+                SELECT channel_id, starttime, delta, dtype, data
+                FROM traces
+                WHERE station_id = ?
+                ORDER BY channel_id;
+                """, (station_id,)):
+            network, station, location, channel = channel_id.split(".")
+            st += obspy.Trace(
+                data=np.frombuffer(data, dtype=str(dtype)).copy(),
+                header={"network": network, "station": station,
+                        "location": location, "channel": channel,
+                        "starttime": obspy.UTCDateTime(starttime),
+                        "delta": delta})
+        return st
+
+    def add_stream(self, station_id, st, fingerprint):
+        """
+        Stores the waveforms of a station, replacing any existing ones.
+
+        :param station_id: The id of the station in the form ``NET.STA``.
+        :param st: The waveforms.
+        :type st: :class:`~obspy.core.stream.Stream`
+        :param fingerprint: String identifying everything the waveforms
+            have been derived from.
+        """
+        with self._conn as conn:
+            conn.execute("DELETE FROM traces WHERE station_id = ?;",
+                         (station_id,))
+            for tr in st:
+                data = np.require(tr.data, requirements="C")
+                conn.execute("""
+                INSERT OR REPLACE INTO traces
+                    (station_id, channel_id, starttime, delta, dtype, data)
+                VALUES (?, ?, ?, ?, ?, ?);
+                """, (station_id, tr.id, tr.stats.starttime.timestamp,
+                      tr.stats.delta, data.dtype.str,
+                      sqlite3.Binary(data.tobytes())))
+            conn.execute("""
+            INSERT OR REPLACE INTO stations
+                (station_id, version, fingerprint)
+            VALUES (?, ?, ?);
+            """, (station_id, SYNTHETICS_STORE_VERSION, fingerprint))
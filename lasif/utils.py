@@ -9,14 +9,24 @@ Some utility functionality.
     GNU General Public License, Version 3
     (http://www.gnu.org/copyleft/gpl.html)
 """
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
+import contextlib
 from geographiclib import geodesic
 from fnmatch import fnmatch
 from lxml.builder import E
+import os
+import tempfile
 
 from lasif import LASIFNotFoundError
 
 
+# The maximum number of parsed station files kept in memory by each process.
+STATION_FILE_CACHE_SIZE = 50
+
+# The parsed station files of the current process. See read_station_file().
+_STATION_FILE_CACHE = OrderedDict()
+
+
 def is_mpi_env():
     """
     Returns True if currently in an MPI environment.
@@ -270,6 +280,133 @@ def greatcircle_points(point_1, point_2, max_extension=None,
         yield Point(line_point["lat2"], line_point["lon2"])
 
 
+def greatcircle_points_array(lats_1, lngs_1, lats_2, lngs_2, npts):
+    """
+    Vectorized version of :func:`greatcircle_points` for many pairs of
+    points. Returns the latitudes and longitudes of ``npts`` equally spaced
+    points along each great circle including both end points, each as an
+    array of shape ``(N, npts)``.
+
+    The points are calculated on a sphere and not on the WGS84 ellipsoid
+    which is accurate enough for domain checks and many orders of
+    magnitude faster.
+
+    >>> lats, lngs = greatcircle_points_array([0.0], [0.0], [0.0], [90.0], 4)
+    >>> lats.round(6).tolist(), lngs.round(6).tolist()
+    ([[0.0, 0.0, 0.0, 0.0]], [[0.0, 30.0, 60.0, 90.0]])
+
+    :param lats_1: The latitudes of the first points.
+    :param lngs_1: The longitudes of the first points.
+    :param lats_2: The latitudes of the second points.
+    :param lngs_2: The longitudes of the second points.
+    :param npts: The number of points along each great circle.
+    """
+    import numpy as np
+
+    a, b, omega = _get_greatcircle_bases(lats_1, lngs_1, lats_2, lngs_2)
+    t = np.linspace(0.0, 1.0, max(npts, 2))
+    return _get_greatcircle_positions(
+        a[:, np.newaxis, :], b[:, np.newaxis, :],
+        omega[:, np.newaxis] * t[np.newaxis, :])
+
+
+def greatcircle_points_flat(lats_1, lngs_1, lats_2, lngs_2,
+                            max_extension=None, max_npts=3000):
+    """
+    Vectorized version of :func:`greatcircle_points` for many pairs of
+    points. Each great circle has the same number of points as with
+    :func:`greatcircle_points`. As that number differs between the great
+    circles, the points of all of them are returned concatenated as flat
+    latitude and longitude arrays.
+
+    The points are calculated on a sphere and not on the WGS84 ellipsoid.
+
+    >>> lats, lngs = greatcircle_points_flat([0.0, 0.0], [0.0, 0.0], \
+        [0.0, 0.0], [60.0, 45.0], max_extension=90.0, max_npts=5)
+    >>> lngs.round(6).tolist()
+    [0.0, 20.0, 40.0, 60.0, 0.0, 22.5, 45.0]
+
+    :param lats_1: The latitudes of the first points.
+    :param lngs_1: The longitudes of the first points.
+    :param lats_2: The latitudes of the second points.
+    :param lngs_2: The longitudes of the second points.
+    :param max_extension: The normalization factor in degree. If not given,
+        each great circle will have exactly ``max_npts`` points.
+    :param max_npts: The number of points of a great circle with a length of
+        ``max_extension``.
+    """
+    import numpy as np
+
+    a, b, omega = _get_greatcircle_bases(lats_1, lngs_1, lats_2, lngs_2)
+
+    if max_extension:
+        npts = (np.rad2deg(omega) / float(max_extension) *
+                max_npts).astype(np.int64)
+    else:
+        npts = np.empty(len(omega), dtype=np.int64)
+        npts.fill(max_npts - 1)
+    npts[npts == 0] = 1
+
+    # Index of the great circle and angle along it for every point.
+    idx = np.repeat(np.arange(len(npts)), npts + 1)
+    offsets = np.cumsum(npts + 1) - (npts + 1)
+    theta = (np.arange(len(idx)) - offsets[idx]) * \
+        (omega / npts.astype(np.float64))[idx]
+    return _get_greatcircle_positions(a[idx], b[idx], theta)
+
+
+def _get_greatcircle_bases(lats_1, lngs_1, lats_2, lngs_2):
+    """
+    Returns an orthonormal basis of the plane of each great circle and the
+    angle between both points. The first basis vector points at the first
+    point and the second one is perpendicular to it in the direction of the
+    second point. The great circles are then given by
+    ``cos(theta) * a + sin(theta) * b`` with ``0 <= theta <= omega``.
+    """
+    import numpy as np
+
+    def _to_xyz(lats, lngs):
+        lats = np.deg2rad(np.asarray(lats, dtype=np.float64))
+        lngs = np.deg2rad(np.asarray(lngs, dtype=np.float64))
+        xyz = np.empty(lats.shape + (3,), dtype=np.float64)
+        xyz[..., 0] = np.cos(lats) * np.cos(lngs)
+        xyz[..., 1] = np.cos(lats) * np.sin(lngs)
+        xyz[..., 2] = np.sin(lats)
+        return xyz
+
+    a = _to_xyz(lats_1, lngs_1)
+    c = _to_xyz(lats_2, lngs_2)
+    cos_omega = np.clip((a * c).sum(axis=-1), -1.0, 1.0)
+    omega = np.arccos(cos_omega)
+
+    b = c - cos_omega[..., np.newaxis] * a
+    norm = np.sqrt((b * b).sum(axis=-1))
+    # The plane is not defined for identical points. As omega is zero in
+    # that case any vector works.
+    small = norm < 1E-12
+    norm[small] = 1.0
+    b /= norm[..., np.newaxis]
+    b[small] = 0.0
+    return a, b, omega
+
+
+def _get_greatcircle_positions(a, b, theta):
+    """
+    Returns the latitudes and longitudes of the points at the angles theta
+    along the great circles given by the bases a and b.
+    """
+    import numpy as np
+
+    cos_theta = np.cos(theta)
+    sin_theta = np.sin(theta)
+    x = cos_theta * a[..., 0] + sin_theta * b[..., 0]
+    y = cos_theta * a[..., 1] + sin_theta * b[..., 1]
+    z = cos_theta * a[..., 2] + sin_theta * b[..., 2]
+    lats = np.rad2deg(np.arcsin(np.clip(z, -1.0, 1.0)))
+    lngs = np.rad2deg(np.arctan2(y, x))
+    return lats, lngs
+
+
 def channel2station(value):
     """
     Helper function converting a channel id to a station id. Will not change
@@ -285,6 +422,43 @@ def channel2station(value):
     return ".".join(value.split(".")[:2])
 
 
+def read_station_file(filename):
+    """
+    Reads a SEED or StationXML file and returns the
+    :class:`~obspy.io.xseed.Parser` or :class:`~obspy.core.inventory.Inventory`
+    object.
+
+    Station files usually cover all channels of a station, dataless SEED
+    files often a whole network. Thus the parsed objects are cached per
+    process, keyed by the filename and its modification time, and each file
+    is only parsed once even if it is needed for hundreds of waveforms. The
+    least recently used objects are discarded once
+    ``STATION_FILE_CACHE_SIZE`` files are cached. Do not modify the returned
+    objects.
+
+    :param filename: The station file. Files in a ``StationXML`` folder are
+        read as StationXML, all others as SEED.
+    """
+    filename = os.path.abspath(filename)
+    key = (filename, os.path.getmtime(filename))
+
+    try:
+        station = _STATION_FILE_CACHE.pop(key)
+    except KeyError:
+        if "/StationXML/" in filename:
+            from obspy import read_inventory
+            station = read_inventory(filename, format="stationxml")
+        else:
+            from obspy.io.xseed import Parser
+            station = Parser(filename)
+
+    # (Re-)Inserting marks it as the most recently used one.
+    _STATION_FILE_CACHE[key] = station
+    while len(_STATION_FILE_CACHE) > STATION_FILE_CACHE_SIZE:
+        _STATION_FILE_CACHE.popitem(last=False)
+    return station
+
+
 def select_component_from_stream(st, component):
     """
     Helper function selecting a component from a Stream an raising the proper
@@ -304,6 +478,35 @@ def select_component_from_stream(st, component):
     return component[0]
 
 
+@contextlib.contextmanager
+def atomic_write(filename):
+    """
+    Context manager yielding a file handle to a temporary file in the
+    folder of ``filename``. The temporary file is renamed to ``filename``
+    once the block finishes and removed if it raises. Other processes thus
+    never see partially written files. Missing folders are created.
+
+    >>> with atomic_write(filename) as fh:  # doctest: +SKIP
+    ...     np.save(fh, data)
+    """
+    folder = os.path.dirname(filename)
+    try:
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+    except OSError:
+        # Another process might have just created it.
+        if not os.path.exists(folder):
+            raise
+    fd, tmp_filename = tempfile.mkstemp(dir=folder or None, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            yield fh
+        os.rename(tmp_filename, filename)
+    except:
+        os.remove(tmp_filename)
+        raise
+
+
 def get_event_filename(event, prefix):
     """
     Helper function generating a descriptive event filename.
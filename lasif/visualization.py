@@ -38,18 +38,23 @@ def plot_events(events, map_object, beachball_size=0.02):
     return beachballs
 
 
-def plot_raydensity(map_object, station_events, domain):
+def plot_raydensity(map_object, station_events, domain, processes=None,
+                    cache=None):
     """
     Create a ray-density plot for all events and all stations.
 
-    This function is potentially expensive and will use all CPUs available.
-    Does require geographiclib to be installed.
+    This function is potentially expensive and will by default use all CPUs
+    available. The binning itself is done by
+    :func:`~lasif.tools.great_circle_binner.calculate_raydensity`.
+
+    :param processes: The number of processes. Defaults to the number of
+        CPUs.
+    :param cache: Optional cache of the binned raypaths of each event.
+    :type cache: :class:`~lasif.tools.raydensity_cache.RaydensityCache`
     """
-    import ctypes as C
     from lasif import rotations
     from lasif.domain import RectangularSphericalSection
-    from lasif.tools.great_circle_binner import GreatCircleBinner
-    from lasif.utils import Point
+    from lasif.tools.great_circle_binner import calculate_raydensity
     import multiprocessing
     import progressbar
     from scipy.stats import scoreatpercentile
@@ -59,109 +64,20 @@ def plot_raydensity(map_object, station_events, domain):
             "Raydensity currently only implemented for rectangular domains. "
             "Should be easy to implement for other domains. Let me know.")
 
-    # Merge everything so that a list with coordinate pairs is created. This
-    # list is then distributed among all processors.
-    station_event_list = []
-    for event, stations in station_events:
-        if domain.rotation_angle_in_degree:
-            # Rotate point to the non-rotated domain.
-            e_point = Point(*rotations.rotate_lat_lon(
-                event["latitude"], event["longitude"], domain.rotation_axis,
-                -1.0 * domain.rotation_angle_in_degree))
-        else:
-            e_point = Point(event["latitude"], event["longitude"])
-        for station in stations.itervalues():
-            # Rotate point to the non-rotated domain if necessary.
-            if domain.rotation_angle_in_degree:
-                p = Point(*rotations.rotate_lat_lon(
-                    station["latitude"], station["longitude"],
-                    domain.rotation_axis,
-                    -1.0 * domain.rotation_angle_in_degree))
-            else:
-                p = Point(station["latitude"], station["longitude"])
-            station_event_list.append((e_point, p))
-
-    circle_count = len(station_event_list)
-
-    # The granularity of the latitude/longitude discretization for the
-    # raypaths. Attempt to get a somewhat meaningful result in any case.
-    lat_lng_count = 1000
-    if circle_count < 1000:
-        lat_lng_count = 1000
-    if circle_count < 10000:
-        lat_lng_count = 2000
-    else:
-        lat_lng_count = 3000
-
-    cpu_count = multiprocessing.cpu_count()
-
-    def to_numpy(raw_array, dtype, shape):
-        data = np.frombuffer(raw_array.get_obj())
-        data.dtype = dtype
-        return data.reshape(shape)
+    circle_count = sum(len(_i[1]) for _i in station_events)
 
     print "\nLaunching %i greatcircle calculations on %i CPUs..." % \
-        (circle_count, cpu_count)
+        (circle_count, processes or multiprocessing.cpu_count())
 
     widgets = ["Progress: ", progressbar.Percentage(),
                progressbar.Bar(), "", progressbar.ETA()]
     pbar = progressbar.ProgressBar(widgets=widgets,
-                                   maxval=circle_count).start()
-
-    def great_circle_binning(sta_evs, bin_data_buffer, bin_data_shape,
-                             lock, counter):
-        new_bins = GreatCircleBinner(
-            domain.min_latitude, domain.max_latitude,
-            lat_lng_count, domain.min_longitude,
-            domain.max_longitude, lat_lng_count)
-        for event, station in sta_evs:
-            with lock:
-                counter.value += 1
-            if not counter.value % 25:
-                pbar.update(counter.value)
-            new_bins.add_greatcircle(event, station)
-
-        bin_data = to_numpy(bin_data_buffer, np.uint32, bin_data_shape)
-        with bin_data_buffer.get_lock():
-            bin_data += new_bins.bins
-
-    # Split the data in cpu_count parts.
-    def chunk(seq, num):
-        avg = len(seq) / float(num)
-        out = []
-        last = 0.0
-        while last < len(seq):
-            out.append(seq[int(last):int(last + avg)])
-            last += avg
-        return out
-    chunks = chunk(station_event_list, cpu_count)
-
-    # One instance that collects everything.
-    collected_bins = GreatCircleBinner(
-        domain.min_latitude, domain.max_latitude,
-        lat_lng_count, domain.min_longitude,
-        domain.max_longitude, lat_lng_count)
-
-    # Use a multiprocessing shared memory array and map it to a numpy view.
-    collected_bins_data = multiprocessing.Array(C.c_uint32,
-                                                collected_bins.bins.size)
-    collected_bins.bins = to_numpy(collected_bins_data, np.uint32,
-                                   collected_bins.bins.shape)
-
-    # Create, launch and join one process per CPU. Use a shared value as a
-    # counter and a lock to avoid race conditions.
-    processes = []
-    lock = multiprocessing.Lock()
-    counter = multiprocessing.Value("i", 0)
-    for _i in xrange(cpu_count):
-        processes.append(multiprocessing.Process(
-            target=great_circle_binning, args=(chunks[_i], collected_bins_data,
-                                               collected_bins.bins.shape, lock,
-                                               counter)))
-    for process in processes:
-        process.start()
-    for process in processes:
-        process.join()
+                                   maxval=max(circle_count, 1)).start()
+
+    collected_bins = calculate_raydensity(
+        station_events, domain, backend="multiprocessing",
+        processes=processes, cache=cache,
+        progress_callback=lambda done, total: pbar.update(done))
 
     pbar.finish()
 
@@ -195,10 +111,9 @@ def plot_raydensity(map_object, station_events, domain):
     lngs, lats = collected_bins.coordinates
     # Rotate back if necessary!
     if domain.rotation_angle_in_degree:
-        for lat, lng in zip(lats, lngs):
-            lat[:], lng[:] = rotations.rotate_lat_lon(
-                lat, lng, domain.rotation_axis,
-                domain.rotation_angle_in_degree)
+        lats, lngs = rotations.rotate_lat_lon_array(
+            lats, lngs, domain.rotation_axis,
+            domain.rotation_angle_in_degree)
     ln, la = map_object(lngs, lats)
     map_object.pcolormesh(ln, la, data, cmap=cmap, vmin=0, vmax=max_val,
                           zorder=10)
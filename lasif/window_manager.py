@@ -283,6 +283,16 @@ class WindowCollection(object):
             misfit_type=misfit_type,
             collection=self))
 
+    def get_adjoint_sources(self):
+        """
+        Returns the adjoint sources of all windows in the order of the
+        windows. The waveforms are only read once for all of them.
+        """
+        if self.comm is None:
+            raise ValueError("Operation only possible with an active "
+                             "communicator instance.")
+        return self.comm.adjoint_sources.calculate_adjoint_sources([self])[0]
+
     def plot(self, show=True, filename=None):
         """
         Plots the windows for the object's channel.
@@ -500,7 +510,7 @@ class Window(object):
                                                      "adjoint source!")
         return adj_src
 
-    def get_adjoint_source(self):
+    def get_adjoint_source(self, compute="all", new_values=None):
         if self.comm is None:
             raise ValueError("Operation only possible with an active "
                              "communicator instance.")
@@ -510,7 +520,8 @@ class Window(object):
             self.__collection.event_name, self.__collection.synthetics_tag,
             self.__collection.channel_id,
             self.starttime, self.endtime, self.taper,
-            self.taper_percentage, self.misfit_type)
+            self.taper_percentage, self.misfit_type, compute=compute,
+            new_values=new_values)
         return adsrc
 
     def plot_adjoint_source(self):
@@ -543,7 +554,11 @@ class Window(object):
 
     @property
     def misfit_value(self):
-        adj_src = self.get_adjoint_source()
+        """
+        Returns the misfit value. Only the misfit is calculated if it is not
+        yet stored, the adjoint source is not.
+        """
+        adj_src = self.get_adjoint_source(compute="misfit")
         return adj_src["misfit_value"]
 
     def __eq__(self, other):
@@ -24,6 +24,7 @@ import math
 import numpy as np
 from obspy import geodetics
 import obspy.signal.filter
+from scipy.fftpack import next_fast_len
 from scipy.signal import argrelextrema
 
 
@@ -203,21 +204,81 @@ def _plot_mask(new_mask, old_mask, name=None):
     plt.gca().xaxis.set_ticklabels([])
 
 
-def _window_generator(data_length, window_width):
-    """
-    Simple generator yielding start and stop indices for sliding windows.
+# Number of sliding windows whose cross correlations are computed at once.
+# Bounds the memory of the intermediate arrays.
+SLIDING_WINDOW_BLOCK_SIZE = 512
+
 
-    :param data_length: The complete length of the data series over which to
-        slide the window.
-    :param window_width: The desired window width.
+def _sliding_cross_correlation(data, synth, taper, start_indices):
+    """
+    Cross correlates tapered sliding windows of data and synthetics.
+
+    All windows are processed in blocks by correlating them in the
+    frequency domain. The results are identical (up to floating point
+    accuracy) to applying ``np.correlate(..., mode="full")`` to each pair of
+    tapered windows.
+
+    Returns a tuple of three arrays with one value per window: the peak to
+    peak amplitude of the tapered synthetic window, the time shift in
+    samples of the synthetics relative to the data at the maximum of the
+    cross correlation, and the normalized maximum cross correlation
+    coefficient.
+
+    :param data: The data.
+    :type data: :class:`numpy.ndarray`
+    :param synth: The synthetics.
+    :type synth: :class:`numpy.ndarray`
+    :param taper: The taper applied to each window. Its length is the
+        window length.
+    :type taper: :class:`numpy.ndarray`
+    :param start_indices: The start indices of all windows. All windows must
+        be fully contained in the data.
+    :type start_indices: :class:`numpy.ndarray`
     """
-    window_start = 0
-    while True:
-        window_end = window_start + window_width
-        if window_end > data_length:
-            break
-        yield (window_start, window_end, window_start + window_width // 2)
-        window_start += 1
+    window_length = len(taper)
+    start_indices = np.asarray(start_indices, dtype=np.int64)
+    count = len(start_indices)
+
+    synth_ptp = np.empty(count, dtype=np.float64)
+    time_shift = np.empty(count, dtype=np.int64)
+    max_cc = np.empty(count, dtype=np.float64)
+    if not count:
+        return synth_ptp, time_shift, max_cc
+
+    # Zero padding to avoid wrap around effects of the circular correlation.
+    nfft = next_fast_len(2 * window_length - 1)
+
+    # Views of all possible windows without copying the data.
+    data_windows = np.lib.stride_tricks.as_strided(
+        data, shape=(len(data) - window_length + 1, window_length),
+        strides=(data.strides[0], data.strides[0]))
+    synth_windows = np.lib.stride_tricks.as_strided(
+        synth, shape=(len(synth) - window_length + 1, window_length),
+        strides=(synth.strides[0], synth.strides[0]))
+
+    for i in xrange(0, count, SLIDING_WINDOW_BLOCK_SIZE):
+        idx = start_indices[i: i + SLIDING_WINDOW_BLOCK_SIZE]
+        d = data_windows[idx] * taper
+        s = synth_windows[idx] * taper
+
+        cc = np.fft.irfft(np.fft.rfft(d, n=nfft, axis=1) *
+                          np.fft.rfft(s, n=nfft, axis=1).conj(),
+                          n=nfft, axis=1)
+        # Reorder to the output of np.correlate(..., mode="full"), e.g.
+        # from the most negative to the most positive lag.
+        cc = np.concatenate([cc[:, nfft - window_length + 1:],
+                             cc[:, :window_length]], axis=1)
+
+        block = slice(i, i + len(idx))
+        synth_ptp[block] = s.max(axis=1) - s.min(axis=1)
+        time_shift[block] = cc.argmax(axis=1) - window_length + 1
+        # Windows without energy result in invalid values. They are
+        # discarded by the caller.
+        with np.errstate(divide="ignore", invalid="ignore"):
+            max_cc[block] = cc.max(axis=1) / np.sqrt(
+                (s ** 2).sum(axis=1) * (d ** 2).sum(axis=1))
+
+    return synth_ptp, time_shift, max_cc
 
 
 def _log_window_selection(tr_id, msg):
@@ -565,36 +626,31 @@ def select_windows(data_trace, synthetic_trace, event_latitude,
     max_cc_coeff = np.ma.zeros(npts, dtype="float32")
     max_cc_coeff.mask = True
 
-    for start_idx, end_idx, midpoint_idx in _window_generator(npts,
-                                                              window_length):
-        if not min_idx < midpoint_idx < max_idx:
-            continue
-
-        # Slice windows. Create a copy to be able to taper without affecting
-        # the original time series.
-        data_window = data[start_idx: end_idx].copy() * taper
-        synthetic_window = \
-            synth[start_idx: end_idx].copy() * taper
-
-        # Elimination Stage 2: Skip windows that have essentially no energy
-        # to avoid instabilities. No windows can be picked in these.
-        if synthetic_window.ptp() < synth.ptp() * 0.001:
-            time_windows.mask[midpoint_idx] = True
-            continue
-
-        # Calculate the time shift. Here this is defined as the shift of the
-        # synthetics relative to the data. So a value of 2, for instance, means
-        # that the synthetics are 2 timesteps later then the data.
-        cc = np.correlate(data_window, synthetic_window, mode="full")
-
-        time_shift = cc.argmax() - window_length + 1
-        # Express the time shift in fraction of the minimum period.
-        sliding_time_shift[midpoint_idx] = (time_shift * dt) / minimum_period
-
-        # Normalized cross correlation.
-        max_cc_value = cc.max() / np.sqrt((synthetic_window ** 2).sum() *
-                                          (data_window ** 2).sum())
-        max_cc_coeff[midpoint_idx] = max_cc_value
+    # Only windows whose midpoint is within the traveltime bounds are
+    # considered.
+    half_window = window_length // 2
+    start_indices = np.arange(max(0, min_idx + 1 - half_window),
+                              min(npts - window_length,
+                                  max_idx - 1 - half_window) + 1)
+    midpoint_indices = start_indices + half_window
+
+    synth_ptp, time_shift, max_cc_value = _sliding_cross_correlation(
+        data, synth, taper, start_indices)
+
+    # Elimination Stage 2: Skip windows that have essentially no energy
+    # to avoid instabilities. No windows can be picked in these.
+    no_energy = synth_ptp < synth.ptp() * 0.001
+    time_windows.mask[midpoint_indices[no_energy]] = True
+
+    # The time shift is defined as the shift of the synthetics relative to
+    # the data. So a value of 2, for instance, means that the synthetics are
+    # 2 timesteps later then the data. Express it in fraction of the minimum
+    # period.
+    midpoint_indices = midpoint_indices[~no_energy]
+    sliding_time_shift[midpoint_indices] = \
+        (time_shift[~no_energy] * dt) / minimum_period
+    # Normalized cross correlation.
+    max_cc_coeff[midpoint_indices] = max_cc_value[~no_energy]
 
     if plot:
         plt.subplot2grid(grid, (9, 0), rowspan=1)